@@ -0,0 +1,93 @@
+import contextvars
+import os
+import subprocess
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+# Benchmarks never call Bedrock; the provider can still be overridden explicitly.
+os.environ.setdefault("LLM_PROVIDER", "local")
+
+from sqlalchemy import event  # noqa: E402
+
+from database import async_engine, engine  # noqa: E402
+
+_query_counter: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("query_counter", default=None)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter["queries"] += 1
+
+
+def install_query_counter() -> None:
+    """Count statements on both engines; the embedding cache uses the sync one."""
+    for target in (engine, async_engine.sync_engine):
+        if not event.contains(target, "before_cursor_execute", _count_query):
+            event.listen(target, "before_cursor_execute", _count_query)
+
+
+def start_counting() -> dict:
+    """
+    Count queries issued from the current context.
+
+    The counter follows the request into executor threads because the async
+    wrappers copy the calling context, so concurrent requests never mix counts.
+    """
+    counter = {"queries": 0}
+    _query_counter.set(counter)
+    return counter
+
+
+def pool_status() -> dict:
+    pool = async_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "capacity": pool.size() + getattr(pool, "_max_overflow", 0),
+    }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def latency_summary(latencies_ms: List[float]) -> dict:
+    if not latencies_ms:
+        return {}
+    return {
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p95_ms": round(percentile(latencies_ms, 95), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 3),
+        "max_ms": round(max(latencies_ms), 3),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+@asynccontextmanager
+async def app_client(base_url: Optional[str] = None):
+    """
+    httpx client for the service: in-process over ASGI (with lifespan), or a running server.
+    """
+    import httpx
+
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            yield client
+        return
+
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            yield client
@@ -0,0 +1,58 @@
+"""
+Compare two benchmark result files.
+
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/new.json
+
+Exits with status 1 when any scenario's p95 regressed by more than --threshold percent.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+
+
+def _change(old, new) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> bool:
+    print(f"baseline {baseline.get('commit')} ({baseline.get('label') or ''}) -> "
+          f"candidate {candidate.get('commit')} ({candidate.get('label') or ''})")
+    if baseline.get("rows") != candidate.get("rows"):
+        print(f"warning: row counts differ: {baseline.get('rows')} vs {candidate.get('rows')}")
+
+    regressed = False
+    for name, new in candidate["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            print(f"{name:28s} (new scenario)")
+            continue
+        cells = [f"{m.replace('_ms', '')} {old.get(m)} -> {new.get(m)} ({_change(old.get(m), new.get(m))})"
+                 for m in METRICS]
+        flag = ""
+        if old.get("p95_ms") and new["p95_ms"] > old["p95_ms"] * (1 + threshold / 100):
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{name:28s} " + " | ".join(cells) + flag)
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10, help="allowed p95 increase in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    sys.exit(1 if compare(baseline, candidate, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Open-loop load test replaying the test/*.rest scenarios (and optional JSONL files).
+
+    python -m benchmarks.loadtest --rate 50 --duration 60 --llm-latency 800 --embedding-latency 60
+    python -m benchmarks.loadtest --base-url http://localhost:8001 --rate 20 --scenarios traffic.jsonl
+
+Requests are sent at a fixed or Poisson arrival rate regardless of how fast the
+service answers, and latency is measured from the scheduled send time, so queueing
+shows up in the tail instead of silently lowering the rate. In-process runs also
+sample the database connection pool.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import List, Optional
+
+
+def _parse_weights(values: Optional[List[str]]) -> dict:
+    weights = {}
+    for value in values or []:
+        name, _, weight = value.rpartition("=")
+        weights[name] = float(weight)
+    return weights
+
+
+def configure_provider(args) -> None:
+    """Stubbed model latency for in-process runs; must happen before the app is imported."""
+    os.environ.setdefault("LLM_PROVIDER", "local")
+    os.environ["LOCAL_LLM_LATENCY_MS"] = str(args.llm_latency)
+    os.environ["LOCAL_EMBEDDING_LATENCY_MS"] = str(args.embedding_latency)
+    os.environ["LOCAL_LATENCY_DISTRIBUTION"] = args.latency_distribution
+
+
+class Recorder:
+    def __init__(self, pool_capacity: Optional[int]):
+        self.pool_capacity = pool_capacity
+        self.requests = defaultdict(list)   # scenario -> [(latency_ms, status, pool_busy)]
+        self.pool_samples: List[int] = []
+
+    def record(self, name: str, latency_ms: float, status: int, pool_busy: Optional[int]) -> None:
+        self.requests[name].append((latency_ms, status, pool_busy))
+
+    def report(self, elapsed: float) -> dict:
+        from benchmarks.common import latency_summary
+
+        def pool_stats(busy: List[int]) -> Optional[dict]:
+            if not busy or not self.pool_capacity:
+                return None
+            return {
+                "mean_utilization": round(sum(busy) / len(busy) / self.pool_capacity, 3),
+                "max_checked_out": max(busy),
+                "saturated_fraction": round(sum(b >= self.pool_capacity for b in busy) / len(busy), 3),
+            }
+
+        endpoints = {}
+        for name, rows in sorted(self.requests.items()):
+            statuses = Counter(status for _, status, _ in rows)
+            errors = sum(n for status, n in statuses.items() if status >= 400 or status == 0)
+            endpoints[name] = {
+                "requests": len(rows),
+                "throughput_rps": round(len(rows) / elapsed, 2),
+                "error_rate": round(errors / len(rows), 4),
+                "statuses": {str(k): v for k, v in sorted(statuses.items())},
+                **latency_summary([latency for latency, _, _ in rows]),
+                "pool": pool_stats([busy for _, _, busy in rows if busy is not None]),
+            }
+
+        total = sum(len(rows) for rows in self.requests.values())
+        all_latencies = [latency for rows in self.requests.values() for latency, _, _ in rows]
+        errors = sum(e["error_rate"] * e["requests"] for e in endpoints.values())
+        return {
+            "requests": total,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "error_rate": round(errors / total, 4) if total else 0,
+            **latency_summary(all_latencies),
+            "pool": {"capacity": self.pool_capacity, **(pool_stats(self.pool_samples) or {})},
+            "endpoints": endpoints,
+        }
+
+
+async def run(args) -> dict:
+    from benchmarks.common import app_client, pool_status
+    from benchmarks.scenarios import IdPool, load_scenarios
+
+    scenarios = load_scenarios(
+        rest_glob=None if args.no_rest else args.rest_glob,
+        jsonl_files=args.scenarios,
+        include_destructive=args.include_destructive,
+        weights=_parse_weights(args.weight),
+    )
+    if not scenarios:
+        raise SystemExit("No runnable scenarios found.")
+    ids = IdPool()
+    rand = random.Random(args.seed)
+    in_process = not args.base_url
+    recorder = Recorder(pool_status()["capacity"] if in_process else None)
+    semaphore = asyncio.Semaphore(args.max_in_flight)
+    total = int(args.rate * args.duration)
+
+    print(f"{len(scenarios)} scenarios, {total} requests at {args.rate} req/s "
+          f"({'in-process' if in_process else args.base_url})")
+    for scenario in scenarios:
+        print(f"  {scenario.weight:>5g}  {scenario.name}  [{scenario.endpoint}]")
+
+    async def send(client, scenario, scheduled: float):
+        path, body = ids.render(scenario, rand)
+        async with semaphore:
+            busy = pool_status()["checked_out"] if in_process else None
+            try:
+                response = await client.request(scenario.method, path, content=body, headers=scenario.headers)
+                status = response.status_code
+            except Exception:
+                status = 0
+        recorder.record(scenario.name, (time.perf_counter() - scheduled) * 1000, status, busy)
+
+    async def sample_pool(stop: asyncio.Event):
+        while not stop.is_set():
+            recorder.pool_samples.append(pool_status()["checked_out"])
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=0.05)
+            except asyncio.TimeoutError:
+                pass
+
+    async with app_client(args.base_url) as client:
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_pool(stop)) if in_process else None
+        tasks = []
+        started = time.perf_counter()
+        next_at = started
+        weights = [s.weight for s in scenarios]
+        for _ in range(total):
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            scenario = rand.choices(scenarios, weights)[0]
+            tasks.append(asyncio.create_task(send(client, scenario, next_at)))
+            next_at += rand.expovariate(args.rate) if args.arrival == "poisson" else 1 / args.rate
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        if sampler:
+            await sampler
+
+    report = recorder.report(elapsed)
+    report.update({
+        "created_at": datetime.utcnow().isoformat(),
+        "target": args.base_url or "in-process",
+        "rate": args.rate,
+        "arrival": args.arrival,
+        "provider": {key: os.getenv(key) for key in
+                     ("LLM_PROVIDER", "LOCAL_LLM_LATENCY_MS", "LOCAL_EMBEDDING_LATENCY_MS",
+                      "LOCAL_LATENCY_DISTRIBUTION")} if in_process else None,
+    })
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s: {report['throughput_rps']} req/s, "
+          f"errors {report['error_rate']:.2%}, p50 {report.get('p50_ms')}ms p95 {report.get('p95_ms')}ms "
+          f"p99 {report.get('p99_ms')}ms")
+    pool = report["pool"]
+    if pool.get("capacity"):
+        print(f"pool: capacity {pool['capacity']}, max checked out {pool.get('max_checked_out')}, "
+              f"mean utilization {pool.get('mean_utilization')}, saturated {pool.get('saturated_fraction')}")
+    print(f"\n{'scenario':40s} {'req':>6s} {'rps':>7s} {'err':>7s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'pool':>6s}")
+    for name, e in report["endpoints"].items():
+        pool_util = e["pool"]["mean_utilization"] if e["pool"] else "-"
+        print(f"{name[:40]:40s} {e['requests']:>6d} {e['throughput_rps']:>7} {e['error_rate']:>7.2%} "
+              f"{e.get('p50_ms', 0):>9} {e.get('p95_ms', 0):>9} {e.get('p99_ms', 0):>9} {pool_util:>6}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="poisson")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="client-side cap on open requests")
+    parser.add_argument("--base-url", help="load a running server instead of the in-process app")
+    parser.add_argument("--rest-glob", default="test/**/*.rest")
+    parser.add_argument("--no-rest", action="store_true", help="only use --scenarios files")
+    parser.add_argument("--scenarios", nargs="*", help="JSONL scenario files")
+    parser.add_argument("--weight", nargs="*", metavar="NAME=WEIGHT", help="override scenario weights")
+    parser.add_argument("--include-destructive", action="store_true", help="also run deletes and admin operations")
+    parser.add_argument("--llm-latency", type=float, default=800, help="stubbed Claude latency (ms, in-process)")
+    parser.add_argument("--embedding-latency", type=float, default=60, help="stubbed embedding latency (ms)")
+    parser.add_argument("--latency-distribution", choices=["uniform", "lognormal", "fixed"], default="lognormal")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    if not args.base_url:
+        configure_provider(args)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Latency micro-benchmarks for the search and write hot paths.
+
+    python -m benchmarks.run --iterations 200 --output benchmarks/results/base.json
+
+Runs the app in-process against the database from .env (seed it first with
+benchmarks.seed) with the local model provider. Each scenario is run
+sequentially so latencies and query counts are per request.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from benchmarks.common import (
+    app_client,
+    git_commit,
+    install_query_counter,
+    latency_summary,
+    start_counting,
+)
+from database import engine
+from sqlalchemy import text
+
+
+def load_samples(limit: int = 1000) -> dict:
+    """Random existing ids and names for request payloads."""
+    with engine.connect() as conn:
+        customers = conn.execute(text(
+            "SELECT id, name FROM customer TABLESAMPLE SYSTEM (10) LIMIT :n"), {"n": limit}).fetchall()
+        if len(customers) < 10:
+            customers = conn.execute(text("SELECT id, name FROM customer LIMIT :n"), {"n": limit}).fetchall()
+        aliases = conn.execute(text(
+            "SELECT alias FROM customer_alias ORDER BY random() LIMIT :n"), {"n": limit}).scalars().all()
+        contacts = conn.execute(text(
+            "SELECT customer_id, name FROM contact ORDER BY random() LIMIT :n"), {"n": limit}).fetchall()
+        counts = {
+            table: conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+            for table in ("customer", "customer_alias", "contact", "custom_notes", "feature_request", "task")
+        }
+    if not customers:
+        raise SystemExit("No customers found; run `python -m benchmarks.seed` first.")
+    return {"customers": customers, "aliases": aliases or [c.name for c in customers],
+            "contacts": contacts, "counts": counts}
+
+
+def build_scenarios(samples: dict, rand: random.Random) -> Dict[str, Callable]:
+    """Scenario name -> function returning (method, path, kwargs) for one request."""
+    customers, aliases, contacts = samples["customers"], samples["aliases"], samples["contacts"]
+
+    def customer_id():
+        return str(rand.choice(customers).id)
+
+    def vector_search_customers():
+        return "POST", "/customers/search", {"json": {"query": rand.choice(aliases), "top_k": 3}}
+
+    def get_customer():
+        return "GET", "/customers", {"params": {"id": customer_id()}}
+
+    def get_customer_by_name():
+        return "GET", "/customers", {"params": {"name": rand.choice(customers).name.split()[0], "limit": 50}}
+
+    def search_contacts_api():
+        if contacts:
+            contact = rand.choice(contacts)
+            return "POST", "/contacts/search", {"json": {
+                "customer_id": str(contact.customer_id),
+                "filters": [{"field": "name", "value": contact.name.split()[0]}],
+            }}
+        return "POST", "/contacts/search", {"json": {"customer_id": customer_id(), "filters": []}}
+
+    def create_note():
+        return "POST", "/notes", {"json": {
+            "customer_id": customer_id(), "author": "bench", "category": "Meeting",
+            "full_note": f"Benchmark note {uuid.uuid4()} about renewal pricing.", "tags": ["bench"], "source": "bench",
+        }}
+
+    def create_task():
+        return "POST", "/tasks", {"json": {
+            "customer_id": customer_id(), "title": f"Follow up {uuid.uuid4()}",
+            "due_date": datetime.utcnow().isoformat(), "status": "open", "assigned_to": "bench",
+        }}
+
+    def create_contact():
+        return "POST", "/contacts", {"json": {"operation": "add", "payload": {
+            "customer_id": customer_id(), "name": f"Bench Person {rand.randint(0, 10**6)}", "role": "Engineer",
+            "email": "bench@example.com", "phone": "000", "notes": "bench",
+        }}}
+
+    def create_feature_request():
+        return "POST", "/feature-requests", {"json": {"operation": "add", "payload": {
+            "customer_id": customer_id(), "raw_input": f"Please support SSO via SAML ({uuid.uuid4()})",
+        }}}
+
+    def create_customer():
+        name = f"Bench Customer {uuid.uuid4().hex[:8]}"
+        return "POST", "/customers", {"json": {"name": name, "aliases": [{"alias": name.upper()}]}}
+
+    return {
+        "vector_search_customers": vector_search_customers,
+        "get_customer": get_customer,
+        "get_customer_by_name": get_customer_by_name,
+        "search_contacts_api": search_contacts_api,
+        "create_note": create_note,
+        "create_task": create_task,
+        "create_contact": create_contact,
+        "create_feature_request": create_feature_request,
+        "create_customer": create_customer,
+    }
+
+
+async def run_scenario(client, make_request: Callable, iterations: int, warmup: int) -> dict:
+    latencies: List[float] = []
+    queries: List[int] = []
+    errors = 0
+    for i in range(warmup + iterations):
+        method, path, kwargs = make_request()
+        counter = start_counting()
+        started = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+        if i < warmup:
+            continue
+        if response.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed)
+        queries.append(counter["queries"])
+    return {
+        "iterations": iterations,
+        "errors": errors,
+        **latency_summary(latencies),
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else 0,
+    }
+
+
+async def run(args) -> dict:
+    rand = random.Random(args.seed)
+    samples = load_samples()
+    scenarios = build_scenarios(samples, rand)
+    selected = args.only.split(",") if args.only else list(scenarios)
+    unknown = set(selected) - set(scenarios)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    install_query_counter()
+    results = {}
+    async with app_client() as client:
+        for name in selected:
+            results[name] = await run_scenario(client, scenarios[name], args.iterations, args.warmup)
+            print(f"{name:28s} p50={results[name].get('p50_ms')}ms p95={results[name].get('p95_ms')}ms "
+                  f"p99={results[name].get('p99_ms')}ms queries={results[name]['queries_per_request']}")
+
+    return {
+        "commit": git_commit(),
+        "label": args.label,
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "provider": {key: os.getenv(key) for key in
+                     ("LLM_PROVIDER", "LOCAL_LLM_LATENCY_MS", "LOCAL_EMBEDDING_LATENCY_MS")},
+        "rows": samples["counts"],
+        "iterations": args.iterations,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--label", help="free-form label stored with the results")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"{datetime.utcnow():%Y%m%dT%H%M%S}-{report['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Traffic scenarios for the load generator.
+
+Scenarios come from the `.rest` files under test/ and from JSONL files with one
+request per line:
+
+    {"name": "search", "method": "POST", "path": "/customers/search",
+     "body": {"query": "acme"}, "weight": 5}
+
+In a .rest block, a `# @weight N` comment sets the weight (default 1).
+"""
+import glob
+import json
+import os
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy import text
+
+from database import engine
+
+_REQUEST_LINE = re.compile(r"^(GET|POST|PUT|PATCH|DELETE)\s+(\S+)")
+_WEIGHT = re.compile(r"^#\s*@weight\s+([\d.]+)")
+_PLACEHOLDER = re.compile(r"[A-Z]+(?:-[A-Z]+)*-HERE")
+_UUID = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+# JSON keys whose example UUIDs are replaced with ids that exist in the target database
+_ID_FIELDS = re.compile(rf'"(customer_id|contact_id|request_id)"(\s*:\s*)"({_UUID})"')
+_PATH_ID = re.compile(rf"^/customers/{_UUID}")
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    body: Optional[str] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    weight: float = 1.0
+    source: str = ""
+
+    @property
+    def destructive(self) -> bool:
+        return (
+            self.method == "DELETE"
+            or self.path.startswith("/admin/")
+            or bool(self.body and re.search(r'"operation"\s*:\s*"delete"', self.body))
+        )
+
+    @property
+    def endpoint(self) -> str:
+        """Method and path template, for grouping results."""
+        path = re.sub(_UUID, "{id}", urlsplit(self.path).path)
+        return f"{self.method} {path}"
+
+
+def _path(url: str) -> str:
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "") if parts.scheme else url
+
+
+def parse_rest_file(path: str) -> List[Scenario]:
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    blocks, current = [], []
+    for line in lines:
+        if line.startswith("###") and current:
+            blocks.append(current)
+            current = []
+        current.append(line)
+    if current:
+        blocks.append(current)
+
+    stem = os.path.splitext(os.path.relpath(path))[0]
+    scenarios = []
+    for i, block in enumerate(blocks):
+        title, weight, request = None, 1.0, None
+        headers, body_lines, in_body = {}, [], False
+        for line in block:
+            if request is None:
+                if line.startswith("###"):
+                    title = line.lstrip("#").strip()
+                elif _WEIGHT.match(line):
+                    weight = float(_WEIGHT.match(line).group(1))
+                elif _REQUEST_LINE.match(line):
+                    request = _REQUEST_LINE.match(line).groups()
+            elif not in_body:
+                if not line.strip():
+                    in_body = True
+                elif ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip()] = value.strip()
+            else:
+                body_lines.append(line)
+        if request is None:
+            continue
+        body = "\n".join(body_lines).strip() or None
+        name = title or (stem if len(blocks) == 1 else f"{stem}#{i + 1}")
+        scenarios.append(Scenario(name=name, method=request[0], path=_path(request[1]), body=body,
+                                  headers=headers, weight=weight, source=path))
+    return scenarios
+
+
+def parse_jsonl_file(path: str) -> List[Scenario]:
+    scenarios = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            body = item.get("body")
+            if body is not None and not isinstance(body, str):
+                body = json.dumps(body)
+            headers = item.get("headers") or ({"Content-Type": "application/json"} if body else {})
+            scenarios.append(Scenario(
+                name=item.get("name") or f"{os.path.basename(path)}:{line_no}",
+                method=item.get("method", "GET").upper(),
+                path=_path(item["path"]),
+                body=body,
+                headers=headers,
+                weight=float(item.get("weight", 1)),
+                source=path,
+            ))
+    return scenarios
+
+
+def load_scenarios(
+    rest_glob: Optional[str] = "test/**/*.rest",
+    jsonl_files: Optional[List[str]] = None,
+    include_destructive: bool = False,
+    weights: Optional[Dict[str, float]] = None,
+) -> List[Scenario]:
+    """
+    Load scenarios, dropping ones that still contain placeholders (JOB-ID-HERE, ...)
+    and, unless requested, deletes and admin operations.
+    """
+    scenarios = []
+    for path in sorted(glob.glob(rest_glob, recursive=True)) if rest_glob else []:
+        scenarios += parse_rest_file(path)
+    for path in jsonl_files or []:
+        scenarios += parse_jsonl_file(path)
+
+    selected = []
+    for scenario in scenarios:
+        if _PLACEHOLDER.search(scenario.path + (scenario.body or "")):
+            continue
+        if scenario.destructive and not include_destructive:
+            continue
+        if weights and scenario.name in weights:
+            scenario.weight = weights[scenario.name]
+        if scenario.weight > 0:
+            selected.append(scenario)
+    return selected
+
+
+class IdPool:
+    """Existing ids used in place of the example UUIDs in scenario bodies and paths."""
+
+    def __init__(self, limit: int = 2000):
+        with engine.connect() as conn:
+            self.ids = {
+                "customer_id": conn.execute(text(
+                    "SELECT id FROM customer ORDER BY random() LIMIT :n"), {"n": limit}).scalars().all(),
+                "contact_id": conn.execute(text(
+                    "SELECT id FROM contact ORDER BY random() LIMIT :n"), {"n": limit}).scalars().all(),
+                "request_id": conn.execute(text(
+                    "SELECT id FROM feature_request ORDER BY random() LIMIT :n"), {"n": limit}).scalars().all(),
+            }
+
+    def pick(self, kind: str, rand: random.Random, default: str) -> str:
+        values = self.ids.get(kind)
+        return str(rand.choice(values)) if values else default
+
+    def render(self, scenario: Scenario, rand: random.Random) -> tuple:
+        """(path, body) with example ids replaced."""
+        path = _PATH_ID.sub(lambda m: "/customers/" + self.pick("customer_id", rand, m.group(0)[11:]), scenario.path)
+        body = scenario.body
+        if body:
+            body = _ID_FIELDS.sub(
+                lambda m: f'"{m.group(1)}"{m.group(2)}"{self.pick(m.group(1), rand, m.group(3))}"', body)
+        return path, body
@@ -0,0 +1,196 @@
+"""
+Seed Postgres with synthetic customers, aliases, contacts, notes and feature requests.
+
+    python -m benchmarks.seed --rows 100000 --reset
+
+Use a dedicated database: --reset truncates every table of the service.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import benchmarks.common  # noqa: F401  (selects the local provider)
+from database import engine, ensure_schema
+from models import Base
+from utils import vector_index
+from utils.llm_providers import EMBEDDING_DIMENSIONS, LocalProvider
+
+WORDS = [
+    "acme", "globex", "initech", "umbrella", "stark", "wayne", "hooli", "vandelay", "wonka", "cyberdyne",
+    "soylent", "tyrell", "massive", "dynamic", "nordic", "pacific", "atlas", "summit", "vertex", "quantum",
+    "blue", "green", "silver", "iron", "cloud", "data", "logic", "micro", "net", "solar",
+]
+SUFFIXES = ["Inc", "Ltd", "GmbH", "AB", "Corp", "Group", "Labs", "Systems", "Holdings", "AS"]
+TOPICS = [
+    "onboarding", "renewal", "pricing", "SSO", "audit logs", "dark mode", "API limits", "export to CSV",
+    "Slack integration", "mobile app", "data residency", "SLA", "invoice", "roadmap", "migration",
+]
+ROLES = ["CTO", "Engineer", "Buyer", "Admin", "Product Manager", "Support Lead"]
+TABLES = ["enrichment_job", "embedding_cache", "summary_cache", "backfill_checkpoint", "task", "contact",
+          "note_chunk", "custom_notes", "feature_request_theme_member", "feature_request_theme", "feature_request",
+          "customer_alias", "customer"]
+
+
+def _vector_literal(values) -> str:
+    # str() of a rounded float list is a valid pgvector literal and much faster than formatting
+    return str(np.round(np.asarray(values, dtype=np.float64), 6).tolist())
+
+
+def _random_unit_vectors(rng: np.random.Generator, n: int) -> np.ndarray:
+    vectors = rng.standard_normal((n, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _copy(table: str, columns: list, rows) -> None:
+    """COPY rows into a table in one round trip."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# Set in each worker process by _init_worker.
+_customers: list = []
+_provider = LocalProvider(llm_latency_ms=0, embedding_latency_ms=0)
+
+
+def _init_worker(customers: list) -> None:
+    global _customers
+    _customers = customers
+    # connections inherited from the parent process must not be reused
+    engine.dispose(close=False)
+
+
+def _alias_rows(rand, rng, start, n):
+    for i in range(start, start + n):
+        cid, name = _customers[i % len(_customers)]
+        alias = name if i < len(_customers) else f"{name.rsplit(' ', 1)[0]} {rand.choice(SUFFIXES)} {i}"
+        yield uuid.uuid4(), cid, alias, _vector_literal(_provider.embed(alias))
+
+
+def _contact_rows(rand, rng, start, n):
+    for i, vector in zip(range(start, start + n), _random_unit_vectors(rng, n)):
+        cid, _ = _customers[i % len(_customers)]
+        name = f"{rand.choice(WORDS).title()} {rand.choice(WORDS).title()}son"
+        yield (uuid.uuid4(), cid, name, rand.choice(ROLES), f"user{i}@example.com",
+               f"+46-{i:08d}", "seeded", _vector_literal(vector))
+
+
+def _note_rows(rand, rng, start, n):
+    now = datetime.utcnow()
+    for i, vector in zip(range(start, start + n), _random_unit_vectors(rng, n)):
+        cid, name = _customers[i % len(_customers)]
+        topic = rand.choice(TOPICS)
+        yield (uuid.uuid4(), cid, "bench", now - timedelta(minutes=i), "Meeting",
+               f"{name} discussed {topic}.", f"Call with {name} about {topic}.",
+               json.dumps([topic]), "seed", _vector_literal(vector))
+
+
+def _feature_request_rows(rand, rng, start, n):
+    now = datetime.utcnow()
+    for i, vector in zip(range(start, start + n), _random_unit_vectors(rng, n)):
+        cid, _ = _customers[i % len(_customers)]
+        topic = rand.choice(TOPICS)
+        yield (uuid.uuid4(), cid, f"Support {topic}", f"Customer asks for {topic}.",
+               rand.choice(["low", "medium", "high"]), "new", now, f"Please add {topic}", _vector_literal(vector))
+
+
+TABLE_ROWS = {
+    "customer_alias": (["id", "customer_id", "alias", "embedding"], _alias_rows),
+    "contact": (["id", "customer_id", "name", "role", "email", "phone", "notes", "name_embedding"], _contact_rows),
+    "custom_notes": (["id", "customer_id", "author", "timestamp", "category", "summary", "full_note", "tags",
+                      "source", "embedding"], _note_rows),
+    "feature_request": (["id", "customer_id", "request_title", "summary", "priority", "status", "created_at",
+                         "raw_input", "embedding"], _feature_request_rows),
+}
+
+
+def _copy_batch(table: str, start: int, n: int, seed_value: int) -> int:
+    # every batch has its own seed so the data does not depend on scheduling
+    batch_seed = (seed_value, list(TABLE_ROWS).index(table), start)
+    rand = random.Random(str(batch_seed))
+    rng = np.random.default_rng(batch_seed)
+    columns, generate = TABLE_ROWS[table]
+    _copy(table, columns, generate(rand, rng, start, n))
+    return n
+
+
+def seed(rows: int, batch_size: int = 5000, seed_value: int = 42, workers: int = 4) -> dict:
+    """
+    Insert `rows` aliases, contacts, notes and feature requests spread over rows / 4 customers.
+
+    Alias embeddings come from the local provider so text queries find them;
+    the other embeddings are random unit vectors. Batches are generated and
+    copied by `workers` processes.
+    """
+    rand = random.Random(seed_value)
+    now = datetime.utcnow()
+    customers = []
+    for i in range(max(1, rows // 4)):
+        name = f"{rand.choice(WORDS).title()} {rand.choice(WORDS).title()} {i}"
+        customers.append((uuid.uuid4(), name))
+    for start in range(0, len(customers), batch_size):
+        _copy("customer", ["id", "name", "industry", "status", "created_at", "updated_at"], [
+            (cid, name, rand.choice(["Tech", "Energy", "Retail"]), "active", now, now)
+            for cid, name in customers[start:start + batch_size]
+        ])
+    counts = {"customer": len(customers)}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(customers,)) as pool:
+        for table in TABLE_ROWS:
+            started = time.perf_counter()
+            futures = [pool.submit(_copy_batch, table, start, min(batch_size, rows - start), seed_value)
+                       for start in range(0, rows, batch_size)]
+            counts[table] = sum(f.result() for f in futures)
+            logging.info(f"Seeded {counts[table]} rows into {table} in {time.perf_counter() - started:.1f}s")
+
+    return counts
+
+
+def reset() -> None:
+    for index in vector_index.list_vector_indexes():
+        vector_index.drop_vector_index(index["name"])
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"TRUNCATE {', '.join(TABLES)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000, help="rows per table (10000, 100000, 1000000)")
+    parser.add_argument("--reset", action="store_true", help="truncate all tables and drop ANN indexes first")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=4, help="processes generating and copying batches")
+    args = parser.parse_args()
+
+    ensure_schema(Base.metadata)
+    if args.reset:
+        reset()
+
+    started = time.perf_counter()
+    counts = seed(args.rows, args.batch_size, args.seed, args.workers)
+    # ANN indexes are built after the load; inserting into a live HNSW index is much slower
+    vector_index.ensure_vector_indexes()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    print(json.dumps({"rows": counts, "seconds": round(time.perf_counter() - started, 1)}, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
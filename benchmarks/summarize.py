@@ -0,0 +1,118 @@
+"""
+One-at-a-time vs batched Claude summarization.
+
+    python -m benchmarks.summarize --kind note --items 200 --llm-latency 1500 --ms-per-token 15
+    LLM_PROVIDER=bedrock python -m benchmarks.summarize --kind feature_request --items 50
+
+Summarizes the same synthetic items through both paths with the summary cache
+off and reports items per second, Claude calls and tokens per item. Token counts
+come from kc_model_tokens_total: Bedrock's reported usage, or a 4-characters-per-
+token estimate with the local provider. The local provider's latency is a fixed
+part (--llm-latency) plus a per-output-token part (--ms-per-token), so a long
+batched reply is not free.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+
+def configure(args) -> None:
+    """Must happen before the app modules are imported."""
+    os.environ.setdefault("LLM_PROVIDER", "local")
+    os.environ["SUMMARY_CACHE_ENABLED"] = "false"
+    os.environ["LOCAL_LLM_LATENCY_MS"] = str(args.llm_latency)
+    os.environ["LOCAL_LLM_MS_PER_OUTPUT_TOKEN"] = str(args.ms_per_token)
+    os.environ["LOCAL_LATENCY_DISTRIBUTION"] = "fixed"
+
+
+WORDS = ("export dashboard customer invoice sync calendar report latency outage billing access role "
+         "permission onboarding migration integration webhook audit search filter mobile offline").split()
+
+
+def make_texts(kind: str, count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    run = uuid.uuid4().hex[:8]  # unique per run, so no cache or dedupe can help either path
+    texts = []
+    for i in range(count):
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120)))
+        text = f"[{run}-{i}] {sentence}"
+        texts.append(json.dumps(text) if kind == "note" else text)
+    return texts
+
+
+async def measure(label: str, run, model_id: str) -> dict:
+    from utils import metrics
+    from utils.bedrock_wrapper import guards
+
+    calls = guards["claude"].stats["calls"]
+    tokens_in = metrics.MODEL_TOKENS.value(model_id, "input")
+    tokens_out = metrics.MODEL_TOKENS.value(model_id, "output")
+    started = time.perf_counter()
+    outputs = await run()
+    elapsed = time.perf_counter() - started
+    ok = sum(not isinstance(o, Exception) for o in outputs)
+    tokens_in = metrics.MODEL_TOKENS.value(model_id, "input") - tokens_in
+    tokens_out = metrics.MODEL_TOKENS.value(model_id, "output") - tokens_out
+    return {
+        "path": label,
+        "items": len(outputs),
+        "ok": ok,
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(len(outputs) / elapsed, 2),
+        "claude_calls": guards["claude"].stats["calls"] - calls,
+        "input_tokens_per_item": round(tokens_in / len(outputs), 1),
+        "output_tokens_per_item": round(tokens_out / len(outputs), 1),
+    }
+
+
+async def run_benchmark(args) -> list:
+    from services import batch_summarizer
+    from utils.bedrock_wrapper import provider
+
+    kind = batch_summarizer.KINDS[args.kind]
+    texts = make_texts(args.kind, args.items, args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def single():
+        async def one(text):
+            async with semaphore:
+                return await kind.summarize(text)
+        return await asyncio.gather(*(one(t) for t in texts), return_exceptions=True)
+
+    async def batched():
+        return await batch_summarizer.summarize_many(args.kind, texts, concurrency=args.concurrency)
+
+    model_id = provider.generation_model_id
+    results = [await measure("single", single, model_id)]
+    # fresh texts: the batched path must not profit from anything the first pass did
+    texts = make_texts(args.kind, args.items, args.seed + 1)
+    results.append(await measure("batched", batched, model_id))
+    results[-1]["batch_stats"] = batch_summarizer.get_stats()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kind", choices=("note", "task", "feature_request"), default="note")
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4, help="Claude calls in flight on either path")
+    parser.add_argument("--llm-latency", type=float, default=1500, help="local provider: ms per call")
+    parser.add_argument("--ms-per-token", type=float, default=15, help="local provider: ms per output token")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    configure(args)
+
+    results = asyncio.run(run_benchmark(args))
+    for r in results:
+        print(f"{r['path']:8s} {r['items_per_second']:8.2f} items/s | {r['claude_calls']:4d} calls | "
+              f"in {r['input_tokens_per_item']:7.1f} tok/item | out {r['output_tokens_per_item']:6.1f} tok/item | "
+              f"{r['ok']}/{r['items']} ok")
+    print(json.dumps(results, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
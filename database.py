@@ -0,0 +1,101 @@
+import logging
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateTable
+
+from utils import metrics
+
+# --- Load environment ---
+load_dotenv(override=True)
+
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME")
+DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+# pg_trgm backs the substring (ILIKE) indexes
+EXTENSIONS = ("vector", "pg_trgm")
+
+# Sync engine: startup schema management, admin tooling and background jobs.
+engine = create_engine(DATABASE_URL)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine: the HTTP request path.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+metrics.instrument_engine(engine, "sync")
+metrics.instrument_engine(async_engine.sync_engine, "async")
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@lru_cache(maxsize=None)
+def has_extension(name: str) -> bool:
+    """Whether an extension is installed in the database (checked once per process)."""
+    with engine.connect() as conn:
+        return bool(conn.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = :name"), {"name": name}
+        ).scalar())
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def ensure_schema(metadata) -> None:
+    """
+    Create missing tables, columns and indexes declared on the models.
+
+    Columns and indexes added to an existing model are applied with IF NOT
+    EXISTS semantics, since create_all only creates whole tables.
+    """
+    for extension in EXTENSIONS:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {extension}"))
+        except Exception as e:
+            logging.warning(f"Extension {extension} unavailable: {str(e)}")
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                # indexes are created separately below, so one needing a missing
+                # extension cannot fail the table itself
+                conn.execute(CreateTable(table))
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(
+                        f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS "{column.name}" {column_type}'
+                    ))
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                logging.warning(f"Index {index.name} not created: {str(e)}")
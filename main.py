@@ -1,79 +1,162 @@
 import logging
-import os
+import threading
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Optional
 from uuid import UUID, uuid4
 
-from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException, Query
-from sqlalchemy import MetaData, create_engine, text
-from sqlalchemy.orm import Session, sessionmaker
-
-from models import Base, Contact, Customer, CustomerAlias
-from utils.bedrock_wrapper import fetch_embedding
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import MetaData, delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database import async_engine, engine, ensure_schema, get_async_db
+from models import Base, Customer, CustomerAlias
+from utils import bedrock_wrapper, embedding_cache, metrics, resilience, summary_cache, vector_index
+from utils.bedrock_wrapper import afetch_embeddings
+from utils.search import serialize_row
+from services import alias_index, batch_summarizer
+from services.bulk_service import BULK_ENTITIES, bulk_ingest, iter_chunks, spool_body
 from services.contact_service import (
     add_contact,
     update_contact,
     delete_contact,
+    resolve_contacts,
     search_contacts,
     ContactPayload,
     ContactUpdatePayload,
 )
-from services.featurerequest_service import handle_feature_request_operation
-from services.note_service import add_note
-from services.task_service import add_task
+from services.customer_service import (
+    backfill_normalized_aliases,
+    get_search_stats,
+    list_customers,
+    search_customers,
+)
+from services.enrichment_queue import get_job, queue_enabled
+from services.enrichment_worker import ENRICHMENT_RUN_IN_APP, start_workers, stop_workers
+from services.featurerequest_service import (
+    handle_feature_request_operation,
+    query_feature_requests,
+    search_feature_requests,
+)
+from services.hybrid_service import HYBRID_ENTITIES, hybrid_search
+from services.note_service import add_note, query_notes, search_note_passages, search_notes
+from services.task_service import add_task, query_tasks, search_tasks
+from services.theme_service import THEME_CLUSTERS, build_themes, list_themes
 from schemas import (
     AliasOperationRequest,
+    ContactResolveRequest,
     ContactSearchRequest,
     ContactOperationRequest,
     CustomerCreate,
     CustomerUpdateRequest,
     CustomerVectorSearchRequest,
     FeatureRequestOperationRequest,
+    HybridSearchRequest,
     NoteCreateRequest,
+    SemanticSearchRequest,
+    StructuredQuery,
     TaskCreate,
+    ThemeBuildRequest,
+    VectorIndexCreateRequest,
+    VectorIndexReportRequest,
 )
 
-# --- Load environment ---
-load_dotenv(override=True)
-
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME")
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(bind=engine)
+ensure_schema(Base.metadata)
 metadata = MetaData()
 metadata.reflect(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if vector_index.VECTOR_INDEX_AUTO_CREATE:
+        # index builds on populated tables take minutes; serve (with exact scans) meanwhile
+        threading.Thread(target=vector_index.ensure_vector_indexes, name="vector-index-build", daemon=True).start()
+    # a full pass over customer_alias on first start; misses meanwhile fall back to vector search
+    threading.Thread(target=backfill_normalized_aliases, name="alias-normalize", daemon=True).start()
+    workers = None
+    if queue_enabled() and ENRICHMENT_RUN_IN_APP:
+        workers = start_workers()
+    listener = alias_index.start_alias_index() if alias_index.ALIAS_INDEX_ENABLED else None
+    yield
+    if listener:
+        await alias_index.stop_alias_index(*listener)
+    if workers:
+        await stop_workers(*workers)
+    await async_engine.dispose()
+
+
 app = FastAPI(
     title="Knowledge Companion Service",
     description="Microservice for managing customer identities and embeddings, supporting AI agents and RAG systems.",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=metrics.TimedJSONResponse,
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# streams and admin jobs run far longer than an interactive request
+NO_DEADLINE_PREFIXES = ("/bulk/", "/admin/")
+
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    """Bound the model calls made for a request by its deadline (REQUEST_TIMEOUT_SECONDS / X-Request-Timeout)."""
+    seconds = None
+    if not request.url.path.startswith(NO_DEADLINE_PREFIXES):
+        seconds = resilience.REQUEST_TIMEOUT_SECONDS or None
+        try:
+            requested = float(request.headers.get("x-request-timeout", ""))
+        except ValueError:
+            requested = 0
+        if requested > 0:
+            seconds = min(seconds, requested) if seconds else requested
+    with resilience.deadline(seconds):
+        return await call_next(request)
+
+
+# added last so it wraps every other middleware
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/cache/embeddings")
+def embedding_cache_stats():
+    return embedding_cache.get_stats()
+
+
+@app.get("/cache/summaries")
+def summary_cache_stats():
+    return summary_cache.get_stats()
+
+
+@app.get("/admin/batch-summarizer")
+def batch_summarizer_stats():
+    """Batched summarization counters, token estimates and current batch limits."""
+    return batch_summarizer.get_stats()
+
+
+@app.get("/admin/bedrock")
+def bedrock_stats():
+    """Rate limit, concurrency, retry and circuit breaker state per model."""
+    return bedrock_wrapper.get_stats()
+
+
 @app.post("/tasks")
-def create_task(payload: TaskCreate, db: Session = Depends(get_db)):
+async def create_task(payload: TaskCreate, db: AsyncSession = Depends(get_async_db)):
     try:
-        return add_task(
+        return await add_task(
             db=db,
             customer_id=payload.customer_id,
             title=payload.title,
@@ -81,57 +164,105 @@ def create_task(payload: TaskCreate, db: Session = Depends(get_db)):
             status=payload.status,
             assigned_to=payload.assigned_to,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Task creation failed: {str(e)}")
 
 
+@app.post("/tasks/query")
+async def query_tasks_api(payload: StructuredQuery, response: Response, db: AsyncSession = Depends(get_async_db)):
+    tasks, next_cursor = await query_tasks(db, payload)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [serialize_row(t) for t in tasks]
+
+
+@app.post("/tasks/search")
+async def search_tasks_api(payload: SemanticSearchRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await search_tasks(db, payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Task search failed: {str(e)}")
+
+
 @app.post("/contacts")
-def handle_contact_operation(payload: ContactOperationRequest, db: Session = Depends(get_db)):
+async def handle_contact_operation(payload: ContactOperationRequest, db: AsyncSession = Depends(get_async_db)):
     try:
         if payload.operation == "add":
-            return add_contact(db, ContactPayload(**payload.payload))
+            return await add_contact(db, ContactPayload(**payload.payload))
         elif payload.operation == "update":
-            return update_contact(db, ContactUpdatePayload(**payload.payload))
+            return await update_contact(db, ContactUpdatePayload(**payload.payload))
         elif payload.operation == "delete":
             contact_id = UUID(payload.payload.get("contact_id"))
-            return delete_contact(db, contact_id)
+            return await delete_contact(db, contact_id)
         else:
             raise HTTPException(status_code=400, detail="Invalid operation type")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Contact {payload.operation} failed: {str(e)}")
 
 
 @app.post("/contacts/search")
-def search_contacts_api(payload: ContactSearchRequest, db: Session = Depends(get_db)):
-    query = db.query(Contact)
-    if payload.customer_id:
-        query = query.filter(Contact.customer_id == payload.customer_id)
-    query = search_contacts(query, payload)
-    results = query.all()
-    return [
-        {
-            "id": str(c.id),
-            "customer_id": str(c.customer_id),
-            "name": c.name,
-            "role": c.role,
-            "email": c.email,
-            "phone": c.phone,
-            "notes": c.notes,
-        }
-        for c in results
-    ]
+async def search_contacts_api(
+    payload: ContactSearchRequest, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    results, next_cursor = await search_contacts(db, payload)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [serialize_row(c) for c in results]
+
+
+@app.post("/contacts/resolve")
+async def resolve_contacts_api(payload: ContactResolveRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await resolve_contacts(db, payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Contact resolution failed: {str(e)}")
 
 
 @app.post("/feature-requests")
-def feature_request_op(payload: FeatureRequestOperationRequest, db: Session = Depends(get_db)):
+async def feature_request_op(payload: FeatureRequestOperationRequest, db: AsyncSession = Depends(get_async_db)):
     try:
-        return handle_feature_request_operation(db, payload)
+        return await handle_feature_request_operation(db, payload)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Feature request operation failed: {str(e)}")
 
 
+@app.post("/feature-requests/query")
+async def query_feature_requests_api(
+    payload: StructuredQuery, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    requests, next_cursor = await query_feature_requests(db, payload)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [serialize_row(r) for r in requests]
+
+
+@app.post("/feature-requests/search")
+async def search_feature_requests_api(payload: SemanticSearchRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await search_feature_requests(db, payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Feature request search failed: {str(e)}")
+
+
+@app.get("/feature-requests/themes")
+async def list_feature_request_themes(limit: int = Query(20, ge=1, le=500), db: AsyncSession = Depends(get_async_db)):
+    return await list_themes(db, limit)
+
+
 @app.post("/customers")
-def create_customer(payload: CustomerCreate, db: Session = Depends(get_db)):
+async def create_customer(payload: CustomerCreate, db: AsyncSession = Depends(get_async_db)):
     try:
         customer = Customer(
             id=payload.id or uuid4(),
@@ -147,132 +278,151 @@ def create_customer(payload: CustomerCreate, db: Session = Depends(get_db)):
             mainpage_url=payload.mainpage_url,
         )
         db.add(customer)
-        db.flush()
+        await db.flush()
 
-        alias_texts = [payload.name] + [a.alias for a in (payload.aliases or [])]
-        for alias_text in set(alias_texts):
+        alias_texts = list(dict.fromkeys([payload.name] + [a.alias for a in (payload.aliases or [])]))
+        for alias_text, embedding in zip(alias_texts, await afetch_embeddings(alias_texts)):
             db.add(CustomerAlias(
                 id=uuid4(),
                 customer_id=customer.id,
                 alias=alias_text,
-                embedding=fetch_embedding(alias_text),
+                embedding=embedding,
             ))
 
-        db.commit()
+        await db.commit()
         return {"status": "customer created", "customer_id": str(customer.id)}
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logging.error("Customer creation failed", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Customer creation failed: {str(e)}")
 
 
 @app.patch("/customers/{customer_id}")
-def update_customer(customer_id: UUID, update: CustomerUpdateRequest, db: Session = Depends(get_db)):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+async def update_customer(customer_id: UUID, update: CustomerUpdateRequest, db: AsyncSession = Depends(get_async_db)):
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
 
     if update.name:
         customer.name = update.name
 
-    db.commit()
+    await db.commit()
     return {"status": "updated", "customer_id": str(customer.id)}
 
 
 @app.delete("/customers/{customer_id}")
-def delete_customer(customer_id: UUID, db: Session = Depends(get_db)):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+async def delete_customer(customer_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    # aliases are loaded up front so the delete cascade doesn't lazy-load them
+    customer = await db.get(Customer, customer_id, options=[selectinload(Customer.aliases)])
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
-    db.delete(customer)
-    db.commit()
+    await db.delete(customer)
+    await db.commit()
     return {"status": "deleted"}
 
 
 @app.get("/customers")
-def get_customer(id: Optional[UUID] = Query(None), name: Optional[str] = Query(None), db: Session = Depends(get_db)):
-    query = db.query(Customer)
-    if id:
-        query = query.filter(Customer.id == id)
-    if name:
-        query = query.filter(Customer.name.ilike(f"%{name}%"))
-    customers = query.all()
+async def get_customer(
+    response: Response,
+    id: Optional[UUID] = Query(None),
+    name: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    customers, next_cursor = await list_customers(db, customer_id=id, name=name, limit=limit, after=after)
     if not customers:
         raise HTTPException(status_code=404, detail="Customer not found")
-    return [
-        {"id": str(c.id), "name": c.name, "aliases": [a.alias for a in c.aliases]}
-        for c in customers
-    ]
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return customers
 
 
 @app.post("/customers/search")
-def vector_search_customers(payload: CustomerVectorSearchRequest, db: Session = Depends(get_db)):
+async def vector_search_customers(
+    payload: CustomerVectorSearchRequest, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    """Normalized alias lookup first, vector search on a miss; X-Search-Stage names the stage that answered."""
     try:
-        embedding = fetch_embedding(payload.query)
-        if not embedding:
-            raise HTTPException(status_code=400, detail="Embedding generation failed.")
-
-        sql = text("""
-            SELECT customer_id, alias, embedding <-> CAST(:query_vector AS vector) AS distance
-            FROM customer_alias
-            WHERE embedding IS NOT NULL
-            ORDER BY embedding <-> CAST(:query_vector AS vector)
-            LIMIT :top_k
-        """)
-
-        results = db.execute(sql, {"query_vector": embedding, "top_k": payload.top_k}).fetchall()
-        customer_ids = list({str(row.customer_id) for row in results})
-        customers = db.query(Customer).filter(Customer.id.in_(customer_ids)).all()
-
-        return [
-            {"id": str(c.id), "name": c.name, "aliases": [a.alias for a in c.aliases]}
-            for c in customers
-        ]
+        results, stage = await search_customers(
+            db,
+            payload.query,
+            top_k=payload.top_k,
+            ef_search=payload.ef_search,
+            probes=payload.probes,
+        )
+        response.headers["X-Search-Stage"] = stage
+        return results
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Customer search failed: {str(e)}")
 
 
+@app.get("/customers/search/stats")
+def customer_search_stats():
+    return get_search_stats()
+
+
+@app.post("/{entity}/hybrid-search")
+async def hybrid_search_api(entity: str, payload: HybridSearchRequest, db: AsyncSession = Depends(get_async_db)):
+    """customers / notes / feature-requests; explain=true adds per-signal ranks and scores."""
+    if entity not in HYBRID_ENTITIES:
+        raise HTTPException(status_code=404, detail=f"Hybrid search not supported for '{entity}'")
+    try:
+        return await hybrid_search(db, entity, payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Hybrid search failed: {str(e)}")
+
+
 @app.post("/aliases")
-def alias_operation(payload: AliasOperationRequest, db: Session = Depends(get_db)):
-    customer = db.query(Customer).filter(Customer.id == payload.customer_id).first()
+async def alias_operation(payload: AliasOperationRequest, db: AsyncSession = Depends(get_async_db)):
+    customer = await db.get(Customer, payload.customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
 
     try:
         if payload.operation == "add":
-            for alias_text in payload.aliases:
+            for alias_text, embedding in zip(payload.aliases, await afetch_embeddings(payload.aliases)):
                 db.add(CustomerAlias(
                     customer_id=payload.customer_id,
                     alias=alias_text,
-                    embedding=fetch_embedding(alias_text)
+                    embedding=embedding,
                 ))
         elif payload.operation == "delete":
-            db.query(CustomerAlias).filter(
+            await db.execute(delete(CustomerAlias).where(
                 CustomerAlias.customer_id == payload.customer_id,
                 CustomerAlias.alias.in_(payload.aliases),
-            ).delete(synchronize_session=False)
+            ))
         elif payload.operation == "update":
-            for alias_text in payload.aliases:
-                db_alias = db.query(CustomerAlias).filter(
-                    CustomerAlias.customer_id == payload.customer_id,
-                    CustomerAlias.alias == alias_text,
-                ).first()
-                if db_alias:
-                    db_alias.embedding = fetch_embedding(alias_text)
-        db.commit()
+            db_aliases = (await db.execute(select(CustomerAlias).where(
+                CustomerAlias.customer_id == payload.customer_id,
+                CustomerAlias.alias.in_(payload.aliases),
+            ))).scalars().all()
+            embeddings = await afetch_embeddings([a.alias for a in db_aliases])
+            for db_alias, embedding in zip(db_aliases, embeddings):
+                db_alias.embedding = embedding
+        await db.commit()
         return {
             "status": f"aliases {payload.operation}d",
             "customer_id": str(payload.customer_id),
             "aliases": payload.aliases,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Alias operation failed: {str(e)}")
 
 
 @app.post("/notes")
-def create_note(payload: NoteCreateRequest, db: Session = Depends(get_db)):
+async def create_note(payload: NoteCreateRequest, db: AsyncSession = Depends(get_async_db)):
     try:
-        return add_note(
+        return await add_note(
             db=db,
             customer_id=payload.customer_id,
             author=payload.author,
@@ -282,10 +432,94 @@ def create_note(payload: NoteCreateRequest, db: Session = Depends(get_db)):
             source=payload.source or "",
             timestamp=payload.timestamp,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Note creation failed: {str(e)}")
 
 
+@app.post("/notes/query")
+async def query_notes_api(payload: StructuredQuery, response: Response, db: AsyncSession = Depends(get_async_db)):
+    notes, next_cursor = await query_notes(db, payload)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [serialize_row(n) for n in notes]
+
+
+@app.post("/notes/search")
+async def search_notes_api(payload: SemanticSearchRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await search_notes(db, payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Note search failed: {str(e)}")
+
+
+@app.post("/notes/passages/search")
+async def search_note_passages_api(payload: SemanticSearchRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await search_note_passages(db, payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Passage search failed: {str(e)}")
+
+
+@app.post("/bulk/{entity}")
+async def bulk_import(entity: str, request: Request):
+    """Import NDJSON records; one NDJSON result line per record is streamed back."""
+    if entity not in BULK_ENTITIES:
+        raise HTTPException(status_code=404, detail=f"Bulk import not supported for '{entity}'")
+    spool = await spool_body(request.stream())
+    return StreamingResponse(bulk_ingest(entity, iter_chunks(spool)), media_type="application/x-ndjson")
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    return await get_job(db, job_id)
+
+
+@app.get("/admin/alias-index")
+def alias_index_stats():
+    return alias_index.get_stats()
+
+
+@app.get("/admin/vector-indexes")
+def list_vector_indexes(table: Optional[str] = Query(None)):
+    return vector_index.list_vector_indexes(table)
+
+
+@app.post("/admin/vector-indexes")
+def create_vector_index(payload: VectorIndexCreateRequest):
+    try:
+        return vector_index.create_vector_index(**payload.dict())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Vector index creation failed: {str(e)}")
+
+
+@app.delete("/admin/vector-indexes/{index_name}")
+def drop_vector_index(index_name: str):
+    return vector_index.drop_vector_index(index_name)
+
+
+@app.post("/admin/vector-indexes/report")
+def vector_index_report(payload: VectorIndexReportRequest):
+    return vector_index.recall_report(**payload.dict())
+
+
+@app.post("/admin/feature-request-themes")
+async def build_feature_request_themes(payload: ThemeBuildRequest):
+    try:
+        return await build_themes(payload.clusters or THEME_CLUSTERS, payload.seed)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Theme build failed: {str(e)}")
+
+
 @app.get("/schema")
 def get_schema():
     schema_info = [
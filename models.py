@@ -1,14 +1,31 @@
 import uuid
 
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import TIMESTAMP, Column, ForeignKey, Text
+from sqlalchemy import TIMESTAMP, Boolean, Column, Float, ForeignKey, Index, Integer, Text, func, text
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
+from utils.normalize import normalize_name
+
 Base = declarative_base()
 
 
+def search_document(config: str, *columns: str) -> str:
+    """tsvector expression over text columns; queries must repeat it verbatim to use the GIN index."""
+    return f"to_tsvector('{config}', " + " || ' ' || ".join(f"coalesce({c}, '')" for c in columns) + ")"
+
+
+# identifiers and names are not stemmed; free text uses English stemming
+CUSTOMER_SEARCH_CONFIG = "simple"
+TEXT_SEARCH_CONFIG = "english"
+CUSTOMER_DOCUMENT = search_document(
+    CUSTOMER_SEARCH_CONFIG, "name", "industry", "region", "jira_project_key", "salesforce_account_id"
+)
+NOTE_DOCUMENT = search_document(TEXT_SEARCH_CONFIG, "category", "summary", "full_note")
+FEATURE_REQUEST_DOCUMENT = search_document(TEXT_SEARCH_CONFIG, "request_title", "summary", "raw_input")
+
+
 class Task(Base):
     __tablename__ = "task"
     id = Column(UUID(as_uuid=True), primary_key=True)
@@ -20,6 +37,12 @@ class Task(Base):
 
     summary = Column(Text)
     embedding = Column(Vector(1024))
+    enrichment_status = Column(Text)  # pending / done / failed; NULL for rows enriched inline
+
+    __table_args__ = (
+        Index("ix_task_customer_due", "customer_id", "due_date"),
+        Index("ix_task_status", "status"),
+    )
 
 
 class Customer(Base):
@@ -39,15 +62,34 @@ class Customer(Base):
         "CustomerAlias", back_populates="customer", cascade="all, delete"
     )
 
+    __table_args__ = (
+        # keyset pagination; NULL names sort as '' so the row comparison never turns NULL
+        Index("ix_customer_name_key_id", func.coalesce(text("name"), text("''")), "id"),
+        Index("ix_customer_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_customer_jira_project_key", func.lower(text("jira_project_key"))),
+        Index("ix_customer_fts", text(CUSTOMER_DOCUMENT), postgresql_using="gin"),
+    )
+
+
+def _normalized_alias(context) -> str:
+    return normalize_name(context.get_current_parameters().get("alias") or "")
+
 
 class CustomerAlias(Base):
     __tablename__ = "customer_alias"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    customer_id = Column(UUID(as_uuid=True), ForeignKey("customer.id"))
+    customer_id = Column(UUID(as_uuid=True), ForeignKey("customer.id"), index=True)
     alias = Column(Text)
     embedding = Column(Vector(1024))
+    # lookup key for the exact-match fast path, see utils.normalize
+    normalized_alias = Column(Text, default=_normalized_alias)
     customer = relationship("Customer", back_populates="aliases")
 
+    __table_args__ = (
+        # not unique: distinct customers can share a normalized name ("Acme Inc" / "Acme GmbH")
+        Index("ix_customer_alias_normalized", "normalized_alias", "customer_id"),
+    )
+
 
 class CustomNote(Base):
     __tablename__ = "custom_notes"
@@ -61,6 +103,32 @@ class CustomNote(Base):
     tags = Column(JSONB)
     source = Column(Text)
     embedding = Column(Vector(1024))
+    enrichment_status = Column(Text)
+    # passages of long notes; write-only so adding chunks never loads the existing ones
+    chunks = relationship("NoteChunk", lazy="write_only", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_custom_notes_customer_timestamp", "customer_id", "timestamp"),
+        Index("ix_custom_notes_tags", "tags", postgresql_using="gin", postgresql_ops={"tags": "jsonb_path_ops"}),
+        Index("ix_custom_notes_fts", text(NOTE_DOCUMENT), postgresql_using="gin"),
+    )
+
+
+class NoteChunk(Base):
+    """A passage of a long note with its own embedding, for passage-level search."""
+    __tablename__ = "note_chunk"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    note_id = Column(UUID(as_uuid=True), ForeignKey("custom_notes.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    start_char = Column(Integer, nullable=False)  # offsets into custom_notes.full_note
+    end_char = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    summary = Column(Text)                        # map-step summary of this passage
+    embedding = Column(Vector(1024))              # of the passage text itself
+
+    __table_args__ = (
+        Index("ix_note_chunk_note", "note_id", "chunk_index", unique=True),
+    )
 
 
 class FeatureRequest(Base):
@@ -74,6 +142,47 @@ class FeatureRequest(Base):
     created_at = Column(TIMESTAMP)
     raw_input = Column(Text)              # ✅ renamed from row_input
     embedding = Column(Vector(1024))
+    enrichment_status = Column(Text)
+    # embedding of raw_input; near-duplicate detection compares raw text with raw text
+    raw_embedding = Column(Vector(1024))
+    dedupe_pending = Column(Boolean)      # queued request still to be checked for a duplicate
+    # set on near-duplicates: the request whose title / summary / embedding this row shares
+    canonical_id = Column(UUID(as_uuid=True), ForeignKey("feature_request.id", ondelete="SET NULL"))
+
+    __table_args__ = (
+        Index("ix_feature_request_customer_created", "customer_id", "created_at"),
+        Index("ix_feature_request_status", "status"),
+        Index("ix_feature_request_canonical_id", "canonical_id", postgresql_where=text("canonical_id IS NOT NULL")),
+        Index("ix_feature_request_fts", text(FEATURE_REQUEST_DOCUMENT), postgresql_using="gin"),
+        Index("ix_feature_request_title_trgm", "request_title", postgresql_using="gin",
+              postgresql_ops={"request_title": "gin_trgm_ops"}),
+    )
+
+
+class FeatureRequestTheme(Base):
+    """A cluster of feature requests from the latest theme run."""
+    __tablename__ = "feature_request_theme"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    run_id = Column(UUID(as_uuid=True), nullable=False)
+    label = Column(Text)
+    description = Column(Text)
+    size = Column(Integer, nullable=False)
+    customer_count = Column(Integer, nullable=False)
+    cohesion = Column(Float)                  # mean cosine similarity of members to the centroid
+    centroid = Column(Vector(1024))
+    examples = Column(JSONB)                  # requests closest to the centroid: [{"id", "title", "summary"}]
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+
+class FeatureRequestThemeMember(Base):
+    """Theme assignment of a feature request; kept apart so a rebuild never rewrites feature_request rows."""
+    __tablename__ = "feature_request_theme_member"
+    feature_request_id = Column(
+        UUID(as_uuid=True), ForeignKey("feature_request.id", ondelete="CASCADE"), primary_key=True
+    )
+    theme_id = Column(UUID(as_uuid=True), ForeignKey("feature_request_theme.id", ondelete="CASCADE"),
+                      nullable=False, index=True)
+    similarity = Column(Float)                # cosine similarity to the theme centroid
 
 
 class Contact(Base):
@@ -86,3 +195,66 @@ class Contact(Base):
     phone = Column(Text)
     notes = Column(Text)
     name_embedding = Column(Vector(1024))   
+
+    __table_args__ = (
+        Index("ix_contact_customer_id", "customer_id"),
+        Index("ix_contact_name_prefix", "name", postgresql_ops={"name": "text_pattern_ops"}),  # LIKE 'x%'
+        Index("ix_contact_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_contact_email", "email"),
+        Index("ix_contact_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
+    )
+
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+    key = Column(Text, primary_key=True)          # sha256(model_id, normalized text)
+    model_id = Column(Text, nullable=False)
+    embedding = Column(Vector(1024), nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    last_used_at = Column(TIMESTAMP, server_default=func.now())  # refreshed on hits at most daily; drives pruning
+
+
+class SummaryCache(Base):
+    __tablename__ = "summary_cache"
+    key = Column(Text, primary_key=True)          # sha256(prompt hash, model_id, normalized input)
+    prompt_hash = Column(Text, nullable=False)
+    model_id = Column(Text, nullable=False)
+    output = Column(Text, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+
+class BackfillCheckpoint(Base):
+    """Progress of one embedding backfill run, see services/backfill_service.py."""
+    __tablename__ = "backfill_checkpoint"
+    target = Column(Text, primary_key=True)      # table name, e.g. customer_alias
+    mode = Column(Text, primary_key=True)        # missing / all
+    model_id = Column(Text, primary_key=True)    # embedding model the run writes
+    last_id = Column(UUID(as_uuid=True))         # every row up to this id is written
+    status = Column(Text, nullable=False, default="running")  # running / done
+    processed = Column(Integer, nullable=False, default=0)
+    embedded = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)   # no source text yet (e.g. enrichment pending)
+    failed = Column(Integer, nullable=False, default=0)
+    started_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now())
+    finished_at = Column(TIMESTAMP)
+
+
+class EnrichmentJob(Base):
+    __tablename__ = "enrichment_job"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    entity = Column(Text, nullable=False)       # note / task / feature_request
+    entity_id = Column(UUID(as_uuid=True), nullable=False)
+    status = Column(Text, nullable=False, default="queued")  # queued / running / done / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    last_error = Column(Text)
+    run_after = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    locked_at = Column(TIMESTAMP)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_enrichment_job_queued", "run_after", postgresql_where=text("status = 'queued'")),
+        Index("ix_enrichment_job_entity", "entity", "entity_id"),
+    )
@@ -1,8 +1,19 @@
-from datetime import datetime
-from typing import List, Literal, Optional, Dict
+from datetime import datetime, timezone
+from typing import Annotated, Any, List, Literal, Optional, Dict, Union
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field
+
+
+def _to_naive_utc(value: datetime) -> datetime:
+    # columns are TIMESTAMP WITHOUT TIME ZONE holding UTC; asyncpg rejects aware values
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+UTCDatetime = Annotated[datetime, AfterValidator(_to_naive_utc)]
+
 
 # --- COMMON SCHEMAS ---
 class OperationStatus(BaseModel):
@@ -11,6 +22,79 @@ class OperationStatus(BaseModel):
     id: str
 
 
+class EnrichmentQueuedStatus(OperationStatus):
+    job_id: str
+
+
+class DuplicateMergedStatus(OperationStatus):
+    canonical_id: str
+    canonical_title: Optional[str] = None
+    similarity: float
+
+
+# --- STRUCTURED QUERY SCHEMAS ---
+class QueryCondition(BaseModel):
+    """One predicate: eq / prefix / contains / in use `value`, range uses the bounds."""
+    model_config = ConfigDict(extra="forbid")
+
+    field: str
+    op: Literal["eq", "prefix", "contains", "in", "range"] = "eq"
+    value: Optional[Any] = None
+    gt: Optional[Any] = None
+    gte: Optional[Any] = None
+    lt: Optional[Any] = None
+    lte: Optional[Any] = None
+
+
+class QueryGroup(BaseModel):
+    """Exactly one of `and` / `or`, each a list of conditions or nested groups."""
+    model_config = ConfigDict(extra="forbid", populate_by_name=True)
+
+    all_of: Optional[List["QueryNode"]] = Field(None, alias="and")
+    any_of: Optional[List["QueryNode"]] = Field(None, alias="or")
+
+
+QueryNode = Union[QueryCondition, QueryGroup]
+QueryGroup.model_rebuild()
+
+
+class QueryOrder(BaseModel):
+    field: str
+    direction: Literal["asc", "desc"] = "asc"
+
+
+class StructuredQuery(BaseModel):
+    where: Optional[QueryNode] = None
+    order_by: Optional[List[QueryOrder]] = None
+    limit: int = Field(50, ge=1, le=500)
+    cursor: Optional[str] = Field(None, description="X-Next-Cursor header of the previous page")
+
+
+class SemanticSearchRequest(BaseModel):
+    """Filtered ANN search: `where` uses the structured query language."""
+    query: str
+    top_k: int = Field(10, ge=1, le=100)
+    customer_id: Optional[UUID] = None
+    where: Optional[QueryNode] = None
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
+
+
+class HybridSearchRequest(BaseModel):
+    """Lexical + vector retrieval fused with reciprocal rank fusion."""
+    query: str
+    top_k: int = Field(10, ge=1, le=100)
+    customer_id: Optional[UUID] = None
+    where: Optional[QueryNode] = None
+    weights: Optional[Dict[str, float]] = None  # fulltext / trigram / vector; 0 disables a signal
+    explain: bool = False
+
+
+class ThemeBuildRequest(BaseModel):
+    clusters: Optional[int] = Field(None, ge=2, le=500)  # defaults to THEME_CLUSTERS
+    seed: int = 0
+
+
 # --- CONTACT SCHEMAS ---
 class ContactPayload(BaseModel):
     customer_id: UUID
@@ -35,9 +119,19 @@ class ContactSearchFilter(BaseModel):
     value: str
 
 
-class ContactSearchRequest(BaseModel):
+class ContactSearchRequest(StructuredQuery):
     customer_id: Optional[UUID] = None
-    filters: Optional[List[ContactSearchFilter]] = []
+    filters: Optional[List[ContactSearchFilter]] = []  # legacy: OR-ed substring matches
+    limit: int = Field(100, ge=1, le=500)
+
+
+class ContactResolveRequest(BaseModel):
+    """Resolve a name / email fragment to contacts of one customer (by id, name or alias)."""
+    query: str
+    customer_id: Optional[UUID] = None
+    customer: Optional[str] = None
+    top_k: int = Field(5, ge=1, le=50)
+    min_score: float = Field(0.0, ge=0.0, le=1.0)
 
 
 class ContactOperationRequest(BaseModel):
@@ -48,7 +142,9 @@ class ContactOperationRequest(BaseModel):
 # --- CUSTOMER SCHEMAS ---
 class CustomerVectorSearchRequest(BaseModel):
     query: str
-    top_k: int = 3
+    top_k: int = Field(3, ge=1, le=100)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
 
 
 class CustomerAliasCreate(BaseModel):
@@ -63,8 +159,8 @@ class CustomerCreate(BaseModel):
     size: Optional[str] = None
     region: Optional[str] = None
     status: Optional[str] = None
-    created_at: Optional[datetime] = None
-    updated_at: Optional[datetime] = None
+    created_at: Optional[UTCDatetime] = None
+    updated_at: Optional[UTCDatetime] = None
     jira_project_key: Optional[str] = None
     salesforce_account_id: Optional[str] = None
     mainpage_url: Optional[str] = None
@@ -87,6 +183,7 @@ class FeatureRequestFromRaw(BaseModel):
     raw_input: str
     priority: Optional[str] = "unspecified"
     status: Optional[str] = "new"
+    dedupe: bool = True  # link to an existing near-identical request instead of summarizing
 
 
 class FeatureRequestUpdatePayload(BaseModel):
@@ -109,13 +206,36 @@ class NoteCreateRequest(BaseModel):
     full_note: str
     tags: List[str]
     source: str
-    timestamp: Optional[datetime] = None
+    timestamp: Optional[UTCDatetime] = None
 
 
 # --- TASK SCHEMAS ---
 class TaskCreate(BaseModel):
     customer_id: UUID
     title: str
-    due_date: datetime
+    due_date: UTCDatetime
     status: str
     assigned_to: str
+
+
+# --- VECTOR INDEX SCHEMAS ---
+class VectorIndexCreateRequest(BaseModel):
+    table: str
+    column: str = "embedding"
+    method: Literal["hnsw", "ivfflat"] = "hnsw"
+    distance: Optional[Literal["l2", "cosine", "inner_product"]] = None  # default: VECTOR_DISTANCE
+    m: Optional[int] = Field(None, ge=2, le=100)
+    ef_construction: Optional[int] = Field(None, ge=4, le=1000)
+    lists: Optional[int] = Field(None, ge=1)
+    replace: bool = False
+    where: Optional[Dict[str, str]] = None  # partial index, e.g. {"status": "open"}
+
+
+class VectorIndexReportRequest(BaseModel):
+    table: str
+    column: str = "embedding"
+    distance: Optional[Literal["l2", "cosine", "inner_product"]] = None  # default: VECTOR_DISTANCE
+    sample_size: int = Field(20, ge=1, le=500)
+    top_k: int = Field(10, ge=1, le=100)
+    ef_search: Optional[List[int]] = None
+    probes: Optional[List[int]] = None
@@ -0,0 +1,381 @@
+"""
+In-process alias index for customer resolution.
+
+Every alias embedding lives in one contiguous float32 matrix of unit rows, so a
+search is a single matrix-vector product plus argpartition. The matrix is
+loaded with a binary COPY and kept fresh with LISTEN/NOTIFY: a trigger on
+customer_alias publishes the ids of changed aliases and the listener re-reads
+just those rows. While the index is cold (before the first load, or after the
+listener lost its connection) callers fall back to pgvector.
+
+The matrix product takes tens of milliseconds at a million aliases, so searches
+run on a dedicated thread pool rather than the event loop. Each index has a
+read/write lock: searches share it, while a change batch (applied on a worker
+thread as well) takes it exclusively, because upsert / remove move rows in
+place. A reload builds a new index and swaps the reference, so searches still
+running finish on the old one.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import asyncpg
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select, text
+
+from database import AsyncSessionLocal, DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER, engine
+from models import CustomerAlias
+from utils import metrics
+from utils.llm_providers import EMBEDDING_DIMENSIONS
+from utils.vector_copy import copy_embeddings, to_uuids
+
+load_dotenv(override=True)
+
+ALIAS_INDEX_ENABLED = os.getenv("ALIAS_INDEX_ENABLED", "false").lower() == "true"
+ALIAS_INDEX_FLUSH_SECONDS = float(os.getenv("ALIAS_INDEX_FLUSH_SECONDS", "0.05"))  # batch notifications
+ALIAS_INDEX_RECONNECT_SECONDS = float(os.getenv("ALIAS_INDEX_RECONNECT_SECONDS", "5"))
+ALIAS_INDEX_SEARCH_THREADS = int(os.getenv("ALIAS_INDEX_SEARCH_THREADS", "4"))  # concurrent matrix searches
+ALIAS_INDEX_PING_SECONDS = 30  # idle listener connections are checked this often
+
+CHANNEL = "customer_alias_changed"
+RELOAD = "*"  # payload asking listeners for a full reload (TRUNCATE)
+# Aliases looked at per requested customer before widening; several aliases can belong to one customer.
+CANDIDATES_PER_CUSTOMER = 4
+
+TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION notify_customer_alias_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('{CHANNEL}', '{RELOAD}');
+        RETURN NULL;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        PERFORM pg_notify('{CHANNEL}', OLD.id::text);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        PERFORM pg_notify('{CHANNEL}', NEW.id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+TRIGGERS = {
+    "customer_alias_changed": "AFTER INSERT OR UPDATE OR DELETE ON customer_alias FOR EACH ROW",
+    "customer_alias_truncated": "AFTER TRUNCATE ON customer_alias FOR EACH STATEMENT",
+}
+
+
+def install_triggers() -> None:
+    """Create the NOTIFY triggers on customer_alias (idempotent)."""
+    with engine.begin() as conn:
+        conn.execute(text(TRIGGER_SQL))
+        existing = set(conn.execute(text(
+            "SELECT tgname FROM pg_trigger WHERE tgrelid = 'customer_alias'::regclass"
+        )).scalars().all())
+        for name, timing in TRIGGERS.items():
+            if name not in existing:
+                conn.execute(text(f"CREATE TRIGGER {name} {timing} EXECUTE FUNCTION notify_customer_alias_changed()"))
+
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ReadWriteLock:
+    """Any number of readers or one writer; a waiting writer holds back new readers."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class AliasIndex:
+    """
+    Alias embeddings in a growable float32 matrix; rows [0, size) are live.
+
+    search() takes the read lock itself; upsert() and remove() expect the
+    caller to hold the write lock (see apply()).
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.matrix = np.zeros((capacity, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        self.customer_ids = np.zeros(capacity, dtype="V16")
+        self.alias_ids: List[uuid.UUID] = []
+        self.aliases: List[str] = []
+        self.positions: Dict[uuid.UUID, int] = {}
+        self.lock = ReadWriteLock()
+
+    @classmethod
+    def from_arrays(cls, ids: np.ndarray, customers: np.ndarray, matrix: np.ndarray,
+                    aliases: Dict[uuid.UUID, str]) -> "AliasIndex":
+        index = cls(capacity=max(1024, len(matrix) * 5 // 4))
+        index.matrix[:len(matrix)] = matrix
+        index.customer_ids[:len(matrix)] = customers
+        index.alias_ids = to_uuids(ids)
+        index.aliases = [aliases.get(i, "") for i in index.alias_ids]
+        index.positions = {alias_id: row for row, alias_id in enumerate(index.alias_ids)}
+        return index
+
+    def __len__(self) -> int:
+        return len(self.alias_ids)
+
+    def upsert(self, alias_id: uuid.UUID, customer_id: Optional[uuid.UUID], alias: str, embedding) -> None:
+        row = self.positions.get(alias_id)
+        if row is None:
+            row = len(self.alias_ids)
+            if row == len(self.matrix):
+                self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+                self.customer_ids = np.concatenate([self.customer_ids, np.zeros_like(self.customer_ids)])
+            self.alias_ids.append(alias_id)
+            self.aliases.append(alias)
+            self.positions[alias_id] = row
+        self.matrix[row] = _unit(embedding)
+        self.customer_ids[row] = (customer_id or uuid.UUID(int=0)).bytes
+        self.aliases[row] = alias
+
+    def remove(self, alias_id: uuid.UUID) -> None:
+        """Swap the last row into the removed one so live rows stay contiguous."""
+        row = self.positions.pop(alias_id, None)
+        if row is None:
+            return
+        last = len(self.alias_ids) - 1
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.customer_ids[row] = self.customer_ids[last]
+            self.alias_ids[row] = self.alias_ids[last]
+            self.aliases[row] = self.aliases[last]
+            self.positions[self.alias_ids[row]] = row
+        self.alias_ids.pop()
+        self.aliases.pop()
+
+    def apply(self, rows: Dict[uuid.UUID, tuple], alias_ids: List[uuid.UUID]) -> None:
+        """Upsert the aliases found in `rows` ((customer_id, alias, embedding) by id), remove the others."""
+        with self.lock.write():
+            for alias_id in alias_ids:
+                row = rows.get(alias_id)
+                if row is None:
+                    self.remove(alias_id)
+                else:
+                    self.upsert(alias_id, *row)
+
+    def search(self, embedding, top_k: int) -> List[Tuple[uuid.UUID, str, float]]:
+        """
+        Best (customer_id, matched alias, cosine similarity) per customer, closest first.
+
+        Exact: the candidate window widens until it covers top_k distinct customers.
+        """
+        with self.lock.read():
+            return self._search(_unit(embedding), top_k)
+
+    def _search(self, query: np.ndarray, top_k: int) -> List[Tuple[uuid.UUID, str, float]]:
+        size = len(self.alias_ids)
+        if not size:
+            return []
+        scores = self.matrix[:size] @ query
+        window = min(size, top_k * CANDIDATES_PER_CUSTOMER)
+        while True:
+            candidates = np.argpartition(-scores, window - 1)[:window] if window < size else np.arange(size)
+            candidates = candidates[np.argsort(-scores[candidates])]
+            best: Dict[bytes, int] = {}
+            for row in candidates:
+                best.setdefault(bytes(self.customer_ids[row]), row)
+                if len(best) == top_k:
+                    break
+            if len(best) == top_k or window == size:
+                break
+            window = min(size, window * 4)
+        return [
+            (uuid.UUID(bytes=customer), self.aliases[row], float(scores[row]))
+            for customer, row in best.items()
+        ]
+
+
+_index: Optional[AliasIndex] = None
+_ready = False
+_lock = asyncio.Lock()
+_stats = {"loads": 0, "notifications": 0, "applied": 0, "searches": 0, "last_load_s": None, "loaded_at": None}
+
+
+def is_ready() -> bool:
+    return _ready and _index is not None
+
+
+_search_executor = ThreadPoolExecutor(max_workers=ALIAS_INDEX_SEARCH_THREADS, thread_name_prefix="alias-index")
+
+
+def _timed_search(index: AliasIndex, embedding, top_k: int) -> List[Tuple[uuid.UUID, str, float]]:
+    with metrics.stage("alias_index"):
+        return index.search(embedding, top_k)
+
+
+async def search(embedding, top_k: int) -> Optional[List[Tuple[uuid.UUID, str, float]]]:
+    """In-memory hits, or None while the index is cold."""
+    index = _index
+    if not is_ready():
+        return None
+    _stats["searches"] += 1
+    loop = asyncio.get_running_loop()
+    # copy the context so the stage lands in this request's Server-Timing header
+    return await loop.run_in_executor(
+        _search_executor, contextvars.copy_context().run, _timed_search, index, embedding, top_k
+    )
+
+
+def _load() -> AliasIndex:
+    ids, customers, matrix = copy_embeddings("customer_alias")
+    with engine.connect() as conn:
+        aliases = dict(conn.execute(
+            select(CustomerAlias.id, CustomerAlias.alias).where(CustomerAlias.embedding.is_not(None))
+        ).all())
+    return AliasIndex.from_arrays(ids, customers, matrix, aliases)
+
+
+async def reload() -> None:
+    global _index, _ready
+    async with _lock:
+        started = time.perf_counter()
+        _index = await asyncio.to_thread(_load)
+        _ready = True
+        _stats["loads"] += 1
+        _stats["last_load_s"] = round(time.perf_counter() - started, 3)
+        _stats["loaded_at"] = time.time()
+    logging.info(f"Alias index loaded {len(_index)} aliases in {_stats['last_load_s']}s")
+
+
+async def apply_changes(alias_ids: Iterable[uuid.UUID]) -> None:
+    """Re-read the given aliases; rows that are gone or lost their embedding are dropped."""
+    alias_ids = list(alias_ids)
+    async with _lock:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(CustomerAlias.id, CustomerAlias.customer_id, CustomerAlias.alias, CustomerAlias.embedding)
+                .where(CustomerAlias.id.in_(alias_ids))
+            )).all()
+        found = {
+            row.id: (row.customer_id, row.alias or "", row.embedding) for row in rows if row.embedding is not None
+        }
+        # off the loop: the write lock waits for searches in flight
+        await asyncio.to_thread(_index.apply, found, alias_ids)
+        _stats["applied"] += len(alias_ids)
+
+
+async def _wait(event: asyncio.Event, timeout: float) -> bool:
+    try:
+        await asyncio.wait_for(event.wait(), timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+async def listen(stop: asyncio.Event) -> None:
+    """Keep the index loaded and in sync until `stop` is set; reconnects and reloads on failure."""
+    global _ready
+    pending: Set[str] = set()
+    wake = asyncio.Event()
+
+    def on_notify(conn, pid, channel, payload):
+        pending.add(payload)
+        _stats["notifications"] += 1
+        wake.set()
+
+    while not stop.is_set():
+        conn = None
+        try:
+            conn = await asyncpg.connect(
+                user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=int(DB_PORT), database=DB_NAME
+            )
+            # listen before loading: changes committed during the load are re-read afterwards
+            await conn.add_listener(CHANNEL, on_notify)
+            pending.clear()
+            await reload()
+            while not stop.is_set():
+                if not await _wait(wake, ALIAS_INDEX_PING_SECONDS):
+                    await conn.fetchval("SELECT 1")  # raises once the connection is gone
+                    continue
+                await asyncio.sleep(ALIAS_INDEX_FLUSH_SECONDS)
+                wake.clear()
+                batch = set(pending)
+                pending.clear()
+                if RELOAD in batch:
+                    await reload()
+                elif batch:
+                    await apply_changes(uuid.UUID(payload) for payload in batch)
+        except Exception as e:
+            logging.warning(f"Alias index listener failed, falling back to pgvector: {str(e)}")
+        finally:
+            # without a listener the index would silently go stale
+            _ready = False
+            if conn is not None:
+                try:
+                    await conn.close(timeout=5)
+                except Exception:
+                    pass
+        await _wait(stop, ALIAS_INDEX_RECONNECT_SECONDS)
+
+
+def start_alias_index() -> Tuple[asyncio.Event, asyncio.Task]:
+    install_triggers()
+    stop = asyncio.Event()
+    return stop, asyncio.create_task(listen(stop))
+
+
+async def stop_alias_index(stop: asyncio.Event, task: asyncio.Task) -> None:
+    stop.set()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def get_stats() -> dict:
+    return {
+        **_stats,
+        "enabled": ALIAS_INDEX_ENABLED,
+        "ready": is_ready(),
+        "aliases": len(_index) if _index is not None else 0,
+        "matrix_bytes": _index.matrix.nbytes if _index is not None else 0,
+    }
+
+
+metrics.callback("kc_alias_index_ready", "1 while the in-process alias index serves searches.", (),
+                 lambda: {(): int(is_ready())})
+metrics.callback("kc_alias_index_aliases", "Aliases held by the in-process alias index.", (),
+                 lambda: {(): len(_index) if _index is not None else 0})
@@ -0,0 +1,267 @@
+"""
+Embedding backfill: fill NULL embeddings, or re-embed every row after the embedding model changed.
+
+    python -m services.backfill_service task feature_request
+    python -m services.backfill_service --all --rps 20 customer_alias
+    python -m services.backfill_service --status
+
+Rows are streamed in primary key order through a server-side cursor and
+embedded in batches, several batches in flight at once. Each batch is written
+back with one executemany UPDATE that only touches rows whose source text is
+unchanged, so a row edited meanwhile keeps the embedding the app gave it.
+
+After every written batch the checkpoint in backfill_checkpoint records the
+highest id below which all rows are done; an interrupted run resumes from there.
+Runs are keyed by table, mode and embedding model, so switching models starts a
+fresh --all run. Rows that fail stay NULL and are picked up by the next
+missing-mode run.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from database import AsyncSessionLocal, async_engine, engine
+from models import BackfillCheckpoint, Contact, CustomerAlias, CustomNote, FeatureRequest, NoteChunk, Task
+from utils.bedrock_wrapper import EmbeddingBatchError, afetch_embeddings, guards, provider
+from utils.resilience import TokenBucket
+
+load_dotenv(override=True)
+
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "100"))      # rows per embedding batch and UPDATE
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))      # batches in flight
+BACKFILL_FETCH_SIZE = int(os.getenv("BACKFILL_FETCH_SIZE", "1000"))     # rows per cursor round trip
+# Embedding requests per second for the whole run (0: only the adaptive limit after throttling).
+BACKFILL_EMBEDDING_RPS = float(os.getenv("BACKFILL_EMBEDDING_RPS", "10"))
+# Waits for Retry-After while Bedrock throttles or the breaker is open, before rows count as failed.
+BACKFILL_UNAVAILABLE_RETRIES = int(os.getenv("BACKFILL_UNAVAILABLE_RETRIES", "10"))
+
+# target -> (model, source text column, embedding column); the same text the app embeds.
+# Targets are table names, except feature_request_raw (the raw text embedding used for dedupe).
+TARGETS = {
+    "customer_alias": (CustomerAlias, "alias", "embedding"),
+    "custom_notes": (CustomNote, "summary", "embedding"),
+    "note_chunk": (NoteChunk, "content", "embedding"),
+    "task": (Task, "summary", "embedding"),
+    "feature_request": (FeatureRequest, "summary", "embedding"),
+    "feature_request_raw": (FeatureRequest, "raw_input", "raw_embedding"),
+    "contact": (Contact, "name", "name_embedding"),
+}
+MODES = ("missing", "all")
+COUNTS = ("processed", "embedded", "skipped", "failed")
+
+
+def limit_embedding_rate(rps: float) -> None:
+    """Cap this process's embedding calls; throttling still lowers the rate further."""
+    if rps > 0:
+        guards["embedding"].bucket = TokenBucket(rps)
+
+
+# --- Checkpoints ---
+
+def _checkpoint_dict(checkpoint: BackfillCheckpoint) -> dict:
+    return {
+        "target": checkpoint.target,
+        "mode": checkpoint.mode,
+        "model_id": checkpoint.model_id,
+        "status": checkpoint.status,
+        "last_id": str(checkpoint.last_id) if checkpoint.last_id else None,
+        **{name: getattr(checkpoint, name) for name in COUNTS},
+        "started_at": checkpoint.started_at,
+        "updated_at": checkpoint.updated_at,
+        "finished_at": checkpoint.finished_at,
+    }
+
+
+async def _load_checkpoint(target: str, mode: str) -> Optional[BackfillCheckpoint]:
+    async with AsyncSessionLocal() as db:
+        return await db.get(BackfillCheckpoint, (target, mode, provider.embedding_model_id))
+
+
+async def _save_checkpoint(target: str, mode: str, **values) -> None:
+    values["updated_at"] = func.now()
+    statement = insert(BackfillCheckpoint).values(
+        target=target, mode=mode, model_id=provider.embedding_model_id, **values
+    ).on_conflict_do_update(index_elements=["target", "mode", "model_id"], set_=values)
+    async with AsyncSessionLocal() as db:
+        await db.execute(statement)
+        await db.commit()
+
+
+async def get_status() -> List[dict]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(BackfillCheckpoint).order_by(BackfillCheckpoint.target, BackfillCheckpoint.mode)
+        )
+        return [_checkpoint_dict(c) for c in result.scalars().all()]
+
+
+# --- Batches ---
+
+async def _embed(target: str, rows: list) -> tuple:
+    """(row, embedding) pairs for the rows that could be embedded, and the number that could not."""
+    done = {}
+    pending = list(range(len(rows)))  # positions still without an embedding
+    for attempt in range(BACKFILL_UNAVAILABLE_RETRIES + 1):
+        try:
+            done.update(zip(pending, await afetch_embeddings([rows[i].text for i in pending])))
+            pending = []
+            break
+        except EmbeddingBatchError as e:
+            # keep what succeeded; only the failed rows are retried or counted
+            done.update({pending[j]: embedding for j, embedding in e.embeddings.items()})
+            pending = [pending[j] for j in sorted(e.errors)]
+            if e.status_code == 503 and attempt < BACKFILL_UNAVAILABLE_RETRIES:
+                # only throttling / open breaker: pause instead of burning rows
+                wait = float((e.headers or {}).get("Retry-After", "1"))
+                logging.warning(f"Backfill of {target} paused {wait:.0f}s: embedding model unavailable")
+                await asyncio.sleep(wait)
+                continue
+            logging.warning(f"Backfill of {target}: {len(e.errors)} of {len(rows)} rows failed: {e.detail[:500]}")
+            break
+    return [(rows[i], done[i]) for i in sorted(done)], len(pending)
+
+
+async def _process_batch(target: str, rows: list) -> dict:
+    model, text_column, embedding_column = TARGETS[target]
+    table = model.__table__
+    todo = [row for row in rows if row.text and row.text.strip()]
+    pairs, failed = await _embed(target, todo) if todo else ([], 0)
+    if pairs:
+        # bind names must differ from column names in an UPDATE .. VALUES
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("row_id"), table.c[text_column] == bindparam("row_text"))
+            .values({embedding_column: bindparam("row_embedding", type_=Vector(1024))})
+        )
+        async with async_engine.begin() as conn:
+            await conn.execute(
+                statement, [{"row_id": r.id, "row_text": r.text, "row_embedding": e} for r, e in pairs]
+            )
+    return {"processed": len(rows), "embedded": len(pairs), "skipped": len(rows) - len(todo), "failed": failed}
+
+
+# --- Runs ---
+
+async def backfill(
+    target: str,
+    mode: str = "missing",
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    restart: bool = False,
+) -> dict:
+    """
+    Embed the rows of one table: those with a NULL embedding (mode "missing") or
+    all of them ("all"). Resumes the table's unfinished run unless restart is set.
+    """
+    model, text_column, embedding_column = TARGETS[target]
+    table = model.__table__
+    checkpoint = None if restart else await _load_checkpoint(target, mode)
+    if checkpoint is not None and checkpoint.status == "done":
+        if mode == "all":
+            logging.info(f"Backfill of {target} ({mode}) already finished for {provider.embedding_model_id}")
+            return _checkpoint_dict(checkpoint)
+        checkpoint = None  # new NULL rows may have appeared since the last run
+
+    counts = {name: getattr(checkpoint, name) if checkpoint else 0 for name in COUNTS}
+    last_id = checkpoint.last_id if checkpoint else None
+    if checkpoint is None:
+        await _save_checkpoint(target, mode, status="running", last_id=None, finished_at=None,
+                               started_at=func.now(), **counts)
+    else:
+        logging.info(f"Resuming backfill of {target} ({mode}) after {last_id}, {counts['processed']} rows done")
+
+    query = select(table.c.id, table.c[text_column].label("text")).order_by(table.c.id)
+    if last_id is not None:
+        query = query.where(table.c.id > last_id)
+    if mode == "missing":
+        query = query.where(table.c[embedding_column].is_(None))
+
+    started = time.perf_counter()
+    processed_before = counts["processed"]
+    in_flight = deque()  # (task, last id of its batch), in cursor order
+
+    async def settle() -> None:
+        """Wait for a batch, then checkpoint past every finished batch at the front."""
+        nonlocal last_id
+        # only unfinished batches: a later batch done before the head would make wait() return at once
+        pending = [task for task, _ in in_flight if not task.done()]
+        if pending and not in_flight[0][0].done():
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        advanced = False
+        while in_flight and in_flight[0][0].done():
+            task, batch_last_id = in_flight.popleft()
+            for name, value in task.result().items():
+                counts[name] += value
+            last_id = batch_last_id
+            advanced = True
+        if advanced:
+            await _save_checkpoint(target, mode, last_id=last_id, **counts)
+            rate = (counts["processed"] - processed_before) / (time.perf_counter() - started)
+            logging.info(f"Backfill of {target}: {counts['processed']} rows, {counts['embedded']} embedded, "
+                         f"{counts['failed']} failed ({rate:.1f} rows/s)")
+
+    try:
+        # stream_results keeps the result set on the server; rows arrive fetch_size at a time
+        async with async_engine.connect() as conn:
+            result = await conn.stream(query.execution_options(yield_per=BACKFILL_FETCH_SIZE))
+            async for rows in result.partitions(batch_size):
+                while len(in_flight) >= concurrency:
+                    await settle()
+                in_flight.append((asyncio.create_task(_process_batch(target, rows)), rows[-1].id))
+            while in_flight:
+                await settle()
+    finally:
+        for task, _ in in_flight:
+            task.cancel()
+
+    await _save_checkpoint(target, mode, status="done", finished_at=func.now(), last_id=last_id, **counts)
+    elapsed = time.perf_counter() - started
+    return {
+        "target": target,
+        "mode": mode,
+        "model_id": provider.embedding_model_id,
+        **counts,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round((counts["processed"] - processed_before) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+async def run(targets: List[str], mode: str, batch_size: int, concurrency: int, restart: bool) -> List[dict]:
+    return [await backfill(t, mode, batch_size, concurrency, restart) for t in targets]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", metavar="table",
+                        help=f"tables to backfill (default: all of {', '.join(TARGETS)})")
+    parser.add_argument("--all", action="store_true", help="re-embed every row, not only NULL embeddings")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start at the first row")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY, help="batches in flight")
+    parser.add_argument("--rps", type=float, default=BACKFILL_EMBEDDING_RPS, help="embedding requests per second")
+    parser.add_argument("--status", action="store_true", help="print the checkpoints and exit")
+    args = parser.parse_args()
+    unknown = [t for t in args.targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown table(s): {', '.join(unknown)}")
+
+    BackfillCheckpoint.__table__.create(engine, checkfirst=True)
+    if args.status:
+        print(json.dumps(asyncio.run(get_status()), indent=2, default=str))
+    else:
+        limit_embedding_rate(args.rps)
+        mode = "all" if args.all else "missing"
+        results = asyncio.run(run(args.targets or list(TARGETS), mode, args.batch_size, args.concurrency,
+                                  args.restart))
+        print(json.dumps(results, indent=2, default=str))
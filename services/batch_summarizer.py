@@ -0,0 +1,283 @@
+"""
+Batched Claude summarization for bulk imports, queued enrichment and backfills.
+
+    outputs = await summarize_many("note", texts)
+
+Instead of one Claude round trip (and one copy of the system prompt) per item,
+items are packed into a single request whose reply must be a JSON array with one
+object per item. Batches are sized by a token budget for both the input and
+the expected output. Every object is validated on its own; items that are
+missing or malformed are re-run through the one-at-a-time summarizer. Results
+are stored in the summary cache under the single-item prompt, so both paths
+share entries.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from services.featurerequest_service import FEATURE_REQUEST_SUMMARY_PROMPT, parse_summary, summarize_feature_request
+from services.note_service import NOTE_SUMMARY_PROMPT, is_long_note, summarize_note
+from services.task_service import TASK_SUMMARY_PROMPT, summarize_task
+from utils import metrics, summary_cache
+from utils.bedrock_wrapper import acall_claude, provider
+from utils.llm_providers import estimate_tokens
+
+load_dotenv(override=True)
+
+BATCH_SUMMARY_ENABLED = os.getenv("BATCH_SUMMARY_ENABLED", "true").lower() == "true"
+BATCH_SUMMARY_MAX_ITEMS = int(os.getenv("BATCH_SUMMARY_MAX_ITEMS", "20"))
+BATCH_SUMMARY_INPUT_TOKENS = int(os.getenv("BATCH_SUMMARY_INPUT_TOKENS", "8000"))    # item text per request
+BATCH_SUMMARY_OUTPUT_TOKENS = int(os.getenv("BATCH_SUMMARY_OUTPUT_TOKENS", "4096"))  # max_tokens per request
+BATCH_SUMMARY_CONCURRENCY = int(os.getenv("BATCH_SUMMARY_CONCURRENCY", "4"))
+ITEM_OVERHEAD_TOKENS = 10  # {"id": .., "text": ..} wrapper per item
+
+
+class SummaryKind:
+    """How one entity is summarized, alone or in a batch, and where the result goes on its row."""
+
+    def __init__(
+        self,
+        name: str,
+        prompt: str,
+        summarize: Callable,
+        instruction: str,
+        fields: tuple,
+        output_tokens: int,
+        source: Callable,
+        apply: Callable,
+        batchable: Callable = lambda row: True,
+    ):
+        self.name = name
+        self.prompt = prompt              # single-item system prompt, also the cache namespace
+        self.summarize = summarize        # single-item summarizer, used as the fallback
+        self.fields = fields
+        self.output_tokens = output_tokens  # expected output per item before any is observed
+        self.source = source              # row -> text to summarize
+        self.apply = apply                # (row, output) -> None
+        self.batchable = batchable        # row -> False when it needs its own pipeline (long notes)
+        fields_json = ", ".join(f'"{f}": "<{f}>"' for f in fields)
+        self.batch_prompt = f"""
+{prompt.strip()}
+
+You get a JSON array of items, each {{"id": <number>, "text": "<input>"}}. Handle every
+item on its own, exactly as if it were the only input: {instruction}
+
+Return only a JSON array with one object per input item, in any order:
+[{{"id": <id of the item>, {fields_json}}}]
+"""
+
+    def from_cache(self, raw: str):
+        return parse_summary(raw) if self.fields == ("title", "summary") else raw
+
+    def to_cache(self, output) -> str:
+        return json.dumps(output) if isinstance(output, dict) else output
+
+    def validate(self, item) -> Optional[object]:
+        """The item's output in the single-item shape, or None if it is unusable."""
+        values = {}
+        for field in self.fields:
+            value = item.get(field)
+            if not isinstance(value, str) or not value.strip():
+                return None
+            values[field] = value.strip()
+        return values if len(self.fields) > 1 else values[self.fields[0]]
+
+
+def _apply_summary(row, output: str) -> None:
+    row.summary = output
+
+
+def _apply_feature_request(row, output: dict) -> None:
+    row.request_title = output["title"]
+    row.summary = output["summary"]
+
+
+KINDS: Dict[str, SummaryKind] = {
+    "note": SummaryKind(
+        "note", NOTE_SUMMARY_PROMPT, summarize_note,
+        "summarize the note into several sentences.", ("summary",), 200,
+        lambda row: json.dumps(row.full_note), _apply_summary,
+        batchable=lambda row: not is_long_note(row.full_note),
+    ),
+    "task": SummaryKind(
+        "task", TASK_SUMMARY_PROMPT, summarize_task,
+        "summarize the task.", ("summary",), 100,
+        lambda row: row.title, _apply_summary,
+    ),
+    "feature_request": SummaryKind(
+        "feature_request", FEATURE_REQUEST_SUMMARY_PROMPT, summarize_feature_request,
+        "write the TITLE and SUMMARY described above.", ("title", "summary"), 400,
+        lambda row: row.raw_input, _apply_feature_request,
+        batchable=lambda row: not row.dedupe_pending,  # the duplicate check runs before any summary
+    ),
+}
+
+# --- Adaptive sizing ---
+# Observed output tokens per item (moving average) and the current item cap per
+# kind. A reply that cannot be parsed at all (usually cut off at max_tokens)
+# halves the cap; every good reply raises it by one again.
+_output_per_item: Dict[str, float] = {}
+_max_items: Dict[str, int] = {}
+_stats_lock = threading.Lock()
+_stats = {
+    "items": 0, "cache_hits": 0, "batches": 0, "batched_items": 0, "single_items": 0, "fallback_items": 0,
+    "failed_items": 0, "malformed_replies": 0, "input_tokens": 0, "output_tokens": 0,
+}
+
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _expected_output(kind: SummaryKind) -> float:
+    return _output_per_item.get(kind.name, kind.output_tokens)
+
+
+def pack(kind: SummaryKind, texts: List[str]) -> List[List[str]]:
+    """Split texts into batches that fit the input and expected output token budgets."""
+    by_output = int(BATCH_SUMMARY_OUTPUT_TOKENS * 0.8 // _expected_output(kind))  # headroom for long replies
+    limit = max(1, min(_max_items.get(kind.name, BATCH_SUMMARY_MAX_ITEMS), by_output))
+    batches, current, tokens = [], [], 0
+    for text in texts:
+        cost = estimate_tokens(text) + ITEM_OVERHEAD_TOKENS
+        if current and (len(current) >= limit or tokens + cost > BATCH_SUMMARY_INPUT_TOKENS):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(text)
+        tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _parse_reply(kind: SummaryKind, raw: str, size: int) -> Dict[int, object]:
+    """Valid outputs by item index; raises ValueError when the reply is not a JSON array at all."""
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = raw.strip("`").strip("json").strip()
+    items = json.loads(raw)
+    if not isinstance(items, list):
+        raise ValueError("reply is not a JSON array")
+    outputs = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < size and index not in outputs:
+            output = kind.validate(item)
+            if output is not None:
+                outputs[index] = output
+    return outputs
+
+
+async def _run_batch(kind: SummaryKind, texts: List[str]) -> Dict[str, object]:
+    """Summarize texts in one Claude call; returns outputs for the items that came back valid."""
+    user_input = json.dumps([{"id": i, "text": t} for i, t in enumerate(texts)], ensure_ascii=False)
+    raw = await acall_claude(kind.batch_prompt, user_input, max_tokens=BATCH_SUMMARY_OUTPUT_TOKENS, batched=True)
+    _count("batches")
+    _count("input_tokens", estimate_tokens(kind.batch_prompt) + estimate_tokens(user_input))
+    _count("output_tokens", estimate_tokens(raw))
+    try:
+        outputs = _parse_reply(kind, raw, len(texts))
+    except ValueError as e:
+        _count("malformed_replies")
+        _max_items[kind.name] = max(1, len(texts) // 2)
+        logging.warning(f"Batched {kind.name} summary reply unusable ({len(texts)} items): {str(e)[:200]}")
+        return {}
+    if outputs:
+        observed = estimate_tokens(raw) / len(outputs)
+        previous = _output_per_item.get(kind.name)
+        _output_per_item[kind.name] = observed if previous is None else 0.8 * previous + 0.2 * observed
+    if len(outputs) == len(texts):
+        _max_items[kind.name] = min(BATCH_SUMMARY_MAX_ITEMS, _max_items.get(kind.name, BATCH_SUMMARY_MAX_ITEMS) + 1)
+    return {texts[i]: output for i, output in outputs.items()}
+
+
+async def summarize_many(kind_name: str, texts: List[str], concurrency: int = BATCH_SUMMARY_CONCURRENCY) -> list:
+    """
+    Summaries for texts in input order, in the shape of the single-item
+    summarizer (str, or dict for feature requests). A failed item holds its
+    exception, like asyncio.gather(return_exceptions=True).
+    """
+    kind = KINDS[kind_name]
+    unique = list(dict.fromkeys(texts))
+    _count("items", len(texts))
+    results: Dict[str, object] = {}
+
+    cached = await asyncio.to_thread(summary_cache.lookup_many, kind.prompt, provider.generation_model_id, unique)
+    for text, raw in cached.items():
+        try:
+            results[text] = kind.from_cache(raw)
+        except ValueError:
+            pass
+    _count("cache_hits", len(results))
+    missing = [t for t in unique if t not in results]
+
+    semaphore = asyncio.Semaphore(concurrency)
+    batches = pack(kind, missing) if BATCH_SUMMARY_ENABLED else [[t] for t in missing]
+
+    async def run(batch: List[str]) -> Dict[str, object]:
+        async with semaphore:
+            if len(batch) == 1:
+                return {}  # a batch of one is cheaper through the single-item prompt
+            try:
+                return await _run_batch(kind, batch)
+            except Exception as e:
+                # the model call itself failed: every item fails, nothing is retried one by one
+                _count("failed_items", len(batch))
+                return {t: e for t in batch}
+
+    for found in await asyncio.gather(*(run(b) for b in batches)):
+        results.update(found)
+    batched = {t: o for t, o in results.items() if t in missing and not isinstance(o, Exception)}
+    _count("batched_items", len(batched))
+    if batched:
+        await asyncio.to_thread(
+            summary_cache.store_many, kind.prompt, provider.generation_model_id,
+            {t: kind.to_cache(o) for t, o in batched.items()},
+        )
+
+    retry = [t for t in missing if t not in results]
+    in_batches = {t for b in batches if len(b) > 1 for t in b}
+    _count("single_items", len(retry))
+    _count("fallback_items", sum(t in in_batches for t in retry))
+
+    async def single(text: str):
+        async with semaphore:
+            return await kind.summarize(text)
+
+    for text, output in zip(retry, await asyncio.gather(*(single(t) for t in retry), return_exceptions=True)):
+        if isinstance(output, Exception):
+            _count("failed_items")
+        results[text] = output
+    return [results[t] for t in texts]
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    batched = stats["batched_items"]
+    stats.update({
+        "enabled": BATCH_SUMMARY_ENABLED,
+        "max_items": {name: _max_items.get(name, BATCH_SUMMARY_MAX_ITEMS) for name in KINDS},
+        "output_tokens_per_item": {name: round(_expected_output(kind), 1) for name, kind in KINDS.items()},
+        "items_per_batch": round(batched / stats["batches"], 2) if stats["batches"] else 0.0,
+        "input_tokens_per_batched_item": round(stats["input_tokens"] / batched, 1) if batched else 0.0,
+    })
+    return stats
+
+
+metrics.callback(
+    "kc_batch_summary_items_total", "Items through the batched summarizer by outcome.", ("outcome",),
+    lambda: {(name,): _stats[name] for name in ("cache_hits", "batched_items", "single_items", "failed_items")},
+    kind="counter",
+)
@@ -0,0 +1,350 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import IO, AsyncIterator, Callable, List, Optional, Tuple, Type
+from uuid import uuid4
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import Contact, CustomNote, Customer, CustomerAlias, EnrichmentJob, NoteChunk, Task
+from schemas import ContactPayload, CustomerCreate, NoteCreateRequest, TaskCreate
+from services.enrichment_queue import ENRICHMENT_MAX_ATTEMPTS, queue_enabled
+from services.note_service import enrich_long_note, is_long_note
+from services.batch_summarizer import summarize_many
+from utils.bedrock_wrapper import EmbeddingBatchError, afetch_embeddings
+
+load_dotenv(override=True)
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "100"))
+BULK_SUMMARY_CONCURRENCY = int(os.getenv("BULK_SUMMARY_CONCURRENCY", "16"))
+# Uploads larger than this are spooled to a temporary file instead of memory.
+BULK_SPOOL_MAX_BYTES = int(os.getenv("BULK_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+
+class LineResult:
+    """Outcome of one NDJSON input line."""
+
+    def __init__(self, line: int):
+        self.line = line
+        self.status = "error"
+        self.id: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def fail(self, error: str) -> None:
+        self.status = "error"
+        self.id = None
+        self.error = error
+
+    def to_json(self) -> str:
+        data = {"line": self.line, "status": self.status}
+        if self.id:
+            data["id"] = self.id
+        if self.error:
+            data["error"] = self.error
+        return json.dumps(data) + "\n"
+
+
+async def spool_body(stream: AsyncIterator[bytes]) -> IO[bytes]:
+    """
+    Copy the request body into a spooled temporary file.
+
+    The body has to be read before the response starts: StreamingResponse listens
+    for client disconnects on the same receive channel and would swallow body chunks.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_MAX_BYTES)
+    async for chunk in stream:
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+async def iter_chunks(spool: IO[bytes]) -> AsyncIterator[bytes]:
+    try:
+        while chunk := spool.read(CHUNK_SIZE):
+            yield chunk
+    finally:
+        spool.close()
+
+
+async def iter_ndjson(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Yield (line number, raw line) pairs as the body arrives; blank lines are skipped."""
+    buffer = b""
+    line_no = 0
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, line
+    if buffer.strip():
+        yield line_no + 1, buffer
+
+
+async def iter_batches(
+    stream: AsyncIterator[bytes], schema: Type[BaseModel], size: int
+) -> AsyncIterator[List[Tuple[LineResult, Optional[BaseModel]]]]:
+    """Parse and validate lines against a request schema, grouped into batches."""
+    batch = []
+    async for line_no, raw in iter_ndjson(stream):
+        result = LineResult(line_no)
+        try:
+            batch.append((result, schema(**json.loads(raw))))
+        except Exception as e:
+            result.fail(f"Invalid record: {str(e)}")
+            batch.append((result, None))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _gather_summaries(
+    items: List[Tuple[LineResult, BaseModel]], kind: str, source: Callable[[BaseModel], str]
+) -> List[Tuple[LineResult, BaseModel, str]]:
+    summaries = await summarize_many(kind, [source(p) for _, p in items], concurrency=BULK_SUMMARY_CONCURRENCY)
+    done = []
+    for (result, payload), summary in zip(items, summaries):
+        if isinstance(summary, Exception):
+            result.fail(f"Summarization failed: {str(summary)}")
+        else:
+            done.append((result, payload, summary))
+    return done
+
+
+async def _embed_items(items: list, texts: List[str]) -> list:
+    """Embed texts for items in one batch; items whose embedding failed are marked and dropped."""
+    if not items:
+        return []
+    try:
+        embeddings = await afetch_embeddings(texts)
+    except EmbeddingBatchError as e:
+        for i, error in e.errors.items():
+            items[i][0].fail(f"Embedding failed: {error}")
+        ok = sorted(e.embeddings)
+        embeddings = [e.embeddings[i] for i in ok]
+        items = [items[i] for i in ok]
+    return [item + (embedding,) for item, embedding in zip(items, embeddings)]
+
+
+async def _insert_rows(db: AsyncSession, rows: list) -> None:
+    """
+    Insert rows with multi-row INSERTs and commit.
+
+    Each row is (result, [(model, values), ...], status). If the batch is
+    rejected, rows are retried one at a time so only the bad lines fail.
+    """
+    if not rows:
+        return
+
+    async def write(batch):
+        by_model = {}
+        for _, values in batch:
+            for model, model_rows in values:
+                by_model.setdefault(model, []).extend(model_rows)
+        for model, model_rows in by_model.items():
+            await db.execute(insert(model), model_rows)
+        await db.commit()
+
+    try:
+        await write([(r, v) for r, v, _ in rows])
+        for result, _, status in rows:
+            result.status = status
+        return
+    except Exception as e:
+        await db.rollback()
+        logging.warning(f"Bulk batch insert failed, retrying row by row: {str(getattr(e, 'orig', e))}")
+
+    for result, values, status in rows:
+        try:
+            await write([(result, values)])
+            result.status = status
+        except Exception as e:
+            await db.rollback()
+            # the driver error, without the statement and its vector parameters
+            result.fail(f"Insert failed: {str(getattr(e, 'orig', e))}")
+
+
+def _job_row(entity: str, entity_id) -> tuple:
+    """Enrichment job inserted together with its row in queue mode."""
+    return (EnrichmentJob, [{
+        "id": uuid4(),
+        "entity": entity,
+        "entity_id": entity_id,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": ENRICHMENT_MAX_ATTEMPTS,
+    }])
+
+
+# --- Per-entity batch handlers ---
+
+async def _ingest_notes(db: AsyncSession, items: List[Tuple[LineResult, NoteCreateRequest]]) -> None:
+    def values(result: LineResult, p: NoteCreateRequest, summary=None, embedding=None, pending=False, chunks=()):
+        note_id = uuid4()
+        result.id = str(note_id)
+        chunk_rows = [(NoteChunk, [{"id": uuid4(), "note_id": note_id, **c} for c in chunks])] if chunks else []
+        return [(CustomNote, [{
+            "id": note_id,
+            "customer_id": p.customer_id,
+            "author": p.author,
+            "timestamp": p.timestamp or datetime.utcnow(),
+            "category": p.category or "",
+            "summary": summary,
+            "full_note": p.full_note,
+            "tags": p.tags,
+            "source": p.source or "",
+            "embedding": embedding,
+            "enrichment_status": "pending" if pending else None,
+        }])] + chunk_rows + ([_job_row("note", note_id)] if pending else [])
+
+    if queue_enabled():
+        rows = [(r, values(r, p, pending=True), "accepted") for r, p in items]
+    else:
+        short = [(r, p) for r, p in items if not is_long_note(p.full_note)]
+        long = [(r, p) for r, p in items if is_long_note(p.full_note)]
+        summarized = await _gather_summaries(short, "note", lambda p: json.dumps(p.full_note))
+        embedded = await _embed_items(summarized, [s for _, _, s in summarized])
+        rows = [(r, values(r, p, s, e), "created") for r, p, s, e in embedded]
+        # long notes go through the chunked map-reduce pipeline instead
+        enriched = await asyncio.gather(*(enrich_long_note(p.full_note) for _, p in long), return_exceptions=True)
+        for (result, p), outcome in zip(long, enriched):
+            if isinstance(outcome, Exception):
+                result.fail(f"Summarization failed: {str(outcome)}")
+                continue
+            summary, embedding, chunks = outcome
+            rows.append((result, values(result, p, summary, embedding, chunks=chunks), "created"))
+    await _insert_rows(db, rows)
+
+
+async def _ingest_tasks(db: AsyncSession, items: List[Tuple[LineResult, TaskCreate]]) -> None:
+    def values(result: LineResult, p: TaskCreate, summary=None, embedding=None, pending=False):
+        task_id = uuid4()
+        result.id = str(task_id)
+        return [(Task, [{
+            "id": task_id,
+            "customer_id": p.customer_id,
+            "title": p.title,
+            "due_date": p.due_date,
+            "status": p.status,
+            "assigned_to": p.assigned_to,
+            "summary": summary,
+            "embedding": embedding,
+            "enrichment_status": "pending" if pending else None,
+        }])] + ([_job_row("task", task_id)] if pending else [])
+
+    if queue_enabled():
+        rows = [(r, values(r, p, pending=True), "accepted") for r, p in items]
+    else:
+        summarized = await _gather_summaries(items, "task", lambda p: p.title)
+        embedded = await _embed_items(summarized, [s for _, _, s in summarized])
+        rows = [(r, values(r, p, s, e), "created") for r, p, s, e in embedded]
+    await _insert_rows(db, rows)
+
+
+async def _ingest_contacts(db: AsyncSession, items: List[Tuple[LineResult, ContactPayload]]) -> None:
+    def values(result: LineResult, p: ContactPayload, embedding):
+        contact_id = uuid4()
+        result.id = str(contact_id)
+        return [(Contact, [{
+            "id": contact_id,
+            "customer_id": p.customer_id,
+            "name": p.name,
+            "role": p.role,
+            "email": p.email,
+            "phone": p.phone,
+            "notes": p.notes,
+            "name_embedding": embedding,
+        }])]
+
+    embedded = await _embed_items(items, [p.name for _, p in items])
+    await _insert_rows(db, [(r, values(r, p, e), "created") for r, p, e in embedded])
+
+
+async def _ingest_customers(db: AsyncSession, items: List[Tuple[LineResult, CustomerCreate]]) -> None:
+    alias_lists = [
+        list(dict.fromkeys([p.name] + [a.alias for a in (p.aliases or [])])) for _, p in items
+    ]
+    flat = [alias for aliases in alias_lists for alias in aliases]
+    try:
+        flat_embeddings = await afetch_embeddings(flat)
+        failed = set()
+    except EmbeddingBatchError as e:
+        flat_embeddings = [e.embeddings.get(i) for i in range(len(flat))]
+        failed = set(e.errors)
+
+    rows = []
+    offset = 0
+    for (result, p), aliases in zip(items, alias_lists):
+        positions = range(offset, offset + len(aliases))
+        offset += len(aliases)
+        if failed.intersection(positions):
+            result.fail("Embedding failed for one or more aliases")
+            continue
+        embeddings = [flat_embeddings[i] for i in positions]
+
+        customer_id = p.id or uuid4()
+        result.id = str(customer_id)
+        now = datetime.utcnow()
+        rows.append((result, [
+            (Customer, [{
+                "id": customer_id,
+                "name": p.name,
+                "industry": p.industry,
+                "size": p.size,
+                "region": p.region,
+                "status": p.status,
+                "created_at": p.created_at or now,
+                "updated_at": p.updated_at or now,
+                "jira_project_key": p.jira_project_key,
+                "salesforce_account_id": p.salesforce_account_id,
+                "mainpage_url": p.mainpage_url,
+            }]),
+            (CustomerAlias, [
+                {"id": uuid4(), "customer_id": customer_id, "alias": alias, "embedding": embedding}
+                for alias, embedding in zip(aliases, embeddings)
+            ]),
+        ], "created"))
+    await _insert_rows(db, rows)
+
+
+BULK_ENTITIES = {
+    "notes": (NoteCreateRequest, _ingest_notes),
+    "tasks": (TaskCreate, _ingest_tasks),
+    "contacts": (ContactPayload, _ingest_contacts),
+    "customers": (CustomerCreate, _ingest_customers),
+}
+
+
+async def bulk_ingest(entity: str, stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Ingest an NDJSON stream batch by batch, yielding one NDJSON result per input line.
+
+    Only one batch is held in memory at a time, so the input can be arbitrarily long.
+    A final line summarizes the counts.
+    """
+    schema, handler = BULK_ENTITIES[entity]
+    counts = {"created": 0, "accepted": 0, "error": 0}
+    async with AsyncSessionLocal() as db:
+        async for batch in iter_batches(stream, schema, BULK_BATCH_SIZE):
+            valid = [(r, p) for r, p in batch if p is not None]
+            try:
+                await handler(db, valid)
+            except Exception as e:
+                await db.rollback()
+                logging.error(f"Bulk {entity} batch failed", exc_info=True)
+                for result, _ in valid:
+                    result.fail(str(e))
+            for result, _ in batch:
+                counts[result.status] += 1
+                yield result.to_json()
+    yield json.dumps({"summary": counts}) + "\n"
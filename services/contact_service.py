@@ -1,16 +1,31 @@
-from typing import Optional
+from typing import List
 from uuid import UUID, uuid4
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session, Query
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from database import has_extension
 from models import Contact
-from utils.bedrock_wrapper import fetch_embedding
-from utils.search import apply_dynamic_filters
-from schemas import ContactPayload, ContactUpdatePayload, ContactSearchRequest, OperationStatus
-
-
-def add_contact(db: Session, payload: ContactPayload) -> OperationStatus:
+from utils import vector_index
+from utils.bedrock_wrapper import afetch_embedding
+from utils.search import apply_dynamic_filters, escape_like, execute_structured_query
+from schemas import (
+    ContactPayload,
+    ContactResolveRequest,
+    ContactSearchRequest,
+    ContactUpdatePayload,
+    OperationStatus,
+)
+
+# Rows each signal contributes before scoring; scoped to one customer this is usually all of them.
+RESOLVE_CANDIDATES = 20
+# Weight of the lexical score against name_embedding similarity; exact matches always score 1.
+RESOLVE_LEXICAL_WEIGHT = 0.5
+
+
+async def add_contact(db: AsyncSession, payload: ContactPayload) -> OperationStatus:
     """Add a new contact and generate its name embedding."""
     contact_id = uuid4()
     contact = Contact(
@@ -21,16 +36,16 @@ def add_contact(db: Session, payload: ContactPayload) -> OperationStatus:
         email=payload.email,
         phone=payload.phone,
         notes=payload.notes,
-        name_embedding=fetch_embedding(payload.name),
+        name_embedding=await afetch_embedding(payload.name),
     )
     db.add(contact)
-    db.commit()
+    await db.commit()
     return OperationStatus(status="created", entity="contact", id=str(contact_id))
 
 
-def update_contact(db: Session, payload: ContactUpdatePayload) -> OperationStatus:
+async def update_contact(db: AsyncSession, payload: ContactUpdatePayload) -> OperationStatus:
     """Update an existing contact and regenerate embedding if name changes."""
-    contact = db.query(Contact).filter(Contact.id == payload.contact_id).first()
+    contact = await db.get(Contact, payload.contact_id)
     if not contact:
         raise HTTPException(status_code=404, detail="Contact not found")
 
@@ -43,31 +58,144 @@ def update_contact(db: Session, payload: ContactUpdatePayload) -> OperationStatu
 
     if name_changed:
         try:
-            contact.name_embedding = fetch_embedding(contact.name)
+            contact.name_embedding = await afetch_embedding(contact.name)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Embedding error: {str(e)}")
 
-    db.commit()
+    await db.commit()
     return OperationStatus(status="updated", entity="contact", id=str(contact.id))
 
 
-def delete_contact(db: Session, contact_id: UUID) -> OperationStatus:
+async def delete_contact(db: AsyncSession, contact_id: UUID) -> OperationStatus:
     """Delete an existing contact by ID."""
-    contact = db.query(Contact).filter(Contact.id == contact_id).first()
+    contact = await db.get(Contact, contact_id)
     if not contact:
         raise HTTPException(status_code=404, detail="Contact not found")
 
-    db.delete(contact)
-    db.commit()
+    await db.delete(contact)
+    await db.commit()
     return OperationStatus(status="deleted", entity="contact", id=str(contact_id))
 
 
-def search_contacts(query: Query, payload: ContactSearchRequest) -> Query:
-    """Apply dynamic filters to a contact query."""
+async def search_contacts(db: AsyncSession, payload: ContactSearchRequest) -> tuple:
+    """Run a structured contact query; legacy filters and customer_id are ANDed with `where`."""
+    query = select(Contact)
     if payload.customer_id:
         query = query.filter(Contact.customer_id == payload.customer_id)
 
     if payload.filters:
         query = apply_dynamic_filters(query, Contact, payload.filters)
 
-    return query
+    return await execute_structured_query(db, Contact, payload, query=query, default_order=[("name", "asc")])
+
+
+def _resolve_sql(trigram: bool):
+    # lexical tiers: 1.0 exact name / email, 0.8 prefix of the name, a word of it or the email,
+    # 0.5 substring; with pg_trgm, word_similarity / similarity catch misspellings as well
+    lexical_score = (
+        "greatest(tier, word_similarity(:q, c.name), similarity(:q, coalesce(c.email, '')))"
+        if trigram else "tier"
+    )
+    fuzzy_match = "OR :q <% c.name OR c.email % :q" if trigram else ""
+    return text(f"""
+        WITH scope AS (
+            SELECT id FROM customer WHERE id = :customer_id
+            UNION
+            SELECT id FROM customer
+            WHERE lower(name) = lower(:customer) OR name ILIKE :customer_prefix
+            UNION
+            SELECT customer_id FROM customer_alias WHERE lower(alias) = lower(:customer)
+        ),
+        lexical AS (
+            SELECT id, {lexical_score} AS lexical_score, tier
+            FROM (
+                SELECT c.*,
+                       CASE WHEN lower(c.name) = lower(:q) OR lower(c.email) = lower(:q) THEN 1.0
+                            WHEN c.name ILIKE :q_prefix OR c.name ILIKE :q_word
+                              OR c.email ILIKE :q_prefix THEN 0.8
+                            WHEN c.name ILIKE :q_contains
+                              OR c.email ILIKE :q_contains THEN 0.5
+                            ELSE 0.0 END AS tier
+                FROM contact c
+                WHERE c.customer_id IN (SELECT id FROM scope)
+                  AND (c.name ILIKE :q_contains OR c.email ILIKE :q_contains {fuzzy_match})
+            ) c
+            ORDER BY lexical_score DESC
+            LIMIT :candidates
+        ),
+        semantic AS (
+            SELECT c.id, c.name_embedding {vector_index.distance_operator()} :query_vector AS distance
+            FROM contact c
+            WHERE c.name_embedding IS NOT NULL AND c.customer_id IN (SELECT id FROM scope)
+            ORDER BY c.name_embedding {vector_index.distance_operator()} :query_vector
+            LIMIT :candidates
+        )
+        SELECT c.id, c.customer_id, cu.name AS customer_name, c.name, c.role, c.email, c.phone,
+               l.lexical_score, l.tier, s.distance
+        FROM (SELECT id FROM lexical UNION SELECT id FROM semantic) hits
+        JOIN contact c ON c.id = hits.id
+        JOIN customer cu ON cu.id = c.customer_id
+        LEFT JOIN lexical l ON l.id = hits.id
+        LEFT JOIN semantic s ON s.id = hits.id
+    """).bindparams(bindparam("query_vector", type_=Vector(1024)))
+
+
+async def resolve_contacts(db: AsyncSession, payload: ContactResolveRequest) -> List[dict]:
+    """
+    Rank a customer's contacts against a name or email fragment in one statement.
+
+    Lexical matches on name / email (exact, prefix, substring and, with pg_trgm,
+    trigram similarity) are merged with nearest neighbours on name_embedding.
+    """
+    query = payload.query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Query must not be empty.")
+    if not payload.customer_id and not payload.customer:
+        raise HTTPException(status_code=400, detail="Provide customer_id or customer to scope the lookup.")
+
+    embedding = await afetch_embedding(query)
+    await vector_index.apply_iterative_scan(db)
+    escaped = escape_like(query)
+    customer = (payload.customer or "").strip() or None
+    result = await db.execute(_resolve_sql(has_extension("pg_trgm")), {
+        "customer_id": payload.customer_id,
+        "customer": customer,
+        "customer_prefix": f"{escape_like(customer)}%" if customer else None,
+        "q": query,
+        "q_prefix": f"{escaped}%",
+        "q_word": f"% {escaped}%",
+        "q_contains": f"%{escaped}%",
+        "query_vector": embedding,
+        "candidates": max(RESOLVE_CANDIDATES, payload.top_k),
+    })
+
+    candidates = []
+    for row in result.fetchall():
+        lexical = float(row.lexical_score or 0.0)
+        semantic = (
+            max(0.0, min(1.0, vector_index.similarity(row.distance))) if row.distance is not None else 0.0
+        )
+        tier = float(row.tier or 0.0)
+        if tier >= 1.0:
+            score, match = 1.0, "exact"
+        else:
+            score = RESOLVE_LEXICAL_WEIGHT * lexical + (1 - RESOLVE_LEXICAL_WEIGHT) * semantic
+            match = "prefix" if tier >= 0.8 else "substring" if tier > 0 else "fuzzy" if lexical > 0 else "semantic"
+        if score < payload.min_score:
+            continue
+        candidates.append({
+            "id": str(row.id),
+            "customer_id": str(row.customer_id),
+            "customer_name": row.customer_name,
+            "name": row.name,
+            "role": row.role,
+            "email": row.email,
+            "phone": row.phone,
+            "score": round(score, 6),
+            "lexical_score": round(lexical, 6),
+            "vector_score": round(semantic, 6),
+            "match": match,
+        })
+
+    candidates.sort(key=lambda c: c["score"], reverse=True)
+    return candidates[:payload.top_k]
@@ -0,0 +1,294 @@
+import argparse
+import base64
+import json
+import threading
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import bindparam, func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database import engine
+from models import Customer, CustomerAlias
+from services import alias_index
+from utils import metrics, vector_index
+from utils.bedrock_wrapper import afetch_embedding
+from utils.normalize import normalize_name
+from utils.search import MAX_EF_SEARCH
+
+# Aliases fetched per requested customer; several aliases can belong to one customer.
+CANDIDATES_PER_CUSTOMER = 4
+DEFAULT_HNSW_EF_SEARCH = 40
+
+# Stages of /customers/search, cheapest first; the first one with results answers.
+SEARCH_STAGES = ("normalized", "memory", "pgvector")
+_stage_lock = threading.Lock()
+_stage_counts = {stage: 0 for stage in SEARCH_STAGES}
+metrics.callback("kc_customer_search_total", "Customer searches by the stage that answered.", ("stage",),
+                 lambda: {(stage,): count for stage, count in _stage_counts.items()}, kind="counter")
+
+
+def backfill_normalized_aliases(batch_size: int = 5000, rebuild: bool = False) -> int:
+    """
+    Fill normalized_alias for aliases written before the column existed.
+
+    With rebuild, recompute it for every alias, e.g. after utils.normalize changed.
+    Returns the number of aliases processed.
+    """
+    total = 0
+    after = None
+    while True:
+        query = select(CustomerAlias.id, CustomerAlias.alias).order_by(CustomerAlias.id).limit(batch_size)
+        if not rebuild:
+            query = query.where(CustomerAlias.normalized_alias.is_(None))
+        elif after is not None:
+            query = query.where(CustomerAlias.id > after)
+        with engine.begin() as conn:
+            rows = conn.execute(query).all()
+            if not rows:
+                return total
+            conn.execute(text("""
+                UPDATE customer_alias a SET normalized_alias = v.normalized
+                FROM unnest(CAST(:ids AS uuid[]), CAST(:normalized AS text[])) AS v(id, normalized)
+                WHERE a.id = v.id AND a.normalized_alias IS DISTINCT FROM v.normalized
+            """), {
+                "ids": [str(row.id) for row in rows],
+                "normalized": [normalize_name(row.alias or "") for row in rows],
+            })
+        total += len(rows)
+        after = rows[-1].id
+
+
+async def lookup_normalized(db: AsyncSession, query: str, top_k: int) -> List[dict]:
+    """
+    Customers with an alias equal to the query after normalization (utils.normalize).
+
+    Customers whose alias matches the query verbatim come first.
+    """
+    key = normalize_name(query)
+    if not key:
+        return []
+    result = await db.execute(text("""
+        WITH matches AS (
+            SELECT DISTINCT ON (customer_id) customer_id, alias AS matched_alias, alias = :query AS verbatim
+            FROM customer_alias
+            WHERE normalized_alias = :key
+            ORDER BY customer_id, alias = :query DESC, alias
+        )
+        SELECT c.id, c.name, m.matched_alias, array_agg(a.alias ORDER BY a.alias) AS aliases
+        FROM matches m
+        JOIN customer c ON c.id = m.customer_id
+        JOIN customer_alias a ON a.customer_id = c.id
+        GROUP BY c.id, c.name, m.matched_alias, m.verbatim
+        ORDER BY m.verbatim DESC, c.name, c.id
+        LIMIT :top_k
+    """), {"query": query, "key": key, "top_k": top_k})
+    distance = vector_index.distance_from_cosine(1.0)
+    return [
+        {
+            "id": str(row.id),
+            "name": row.name,
+            "aliases": list(row.aliases),
+            "matched_alias": row.matched_alias,
+            "distance": distance,
+            "score": 1.0,
+        }
+        for row in result.fetchall()
+    ]
+
+
+async def search_customers(
+    db: AsyncSession,
+    query: str,
+    top_k: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> Tuple[List[dict], str]:
+    """
+    Resolve a customer query, returning (results, answering stage).
+
+    A normalized alias hit returns immediately without an embedding call; only
+    misses pay for Titan and go to the in-memory index or pgvector.
+    """
+    results = await lookup_normalized(db, query, top_k)
+    stage = "normalized"
+    if not results:
+        embedding = await afetch_embedding(query)
+        if not embedding:
+            raise HTTPException(status_code=400, detail="Embedding generation failed.")
+        stage = "memory" if alias_index.is_ready() else "pgvector"
+        results = await search_customers_by_embedding(db, embedding, top_k, ef_search=ef_search, probes=probes)
+    with _stage_lock:
+        _stage_counts[stage] += 1
+    for item in results:
+        item["stage"] = stage
+    return results, stage
+
+
+def get_search_stats() -> dict:
+    with _stage_lock:
+        counts = dict(_stage_counts)
+    total = sum(counts.values())
+    return {
+        "searches": total,
+        "stages": counts,
+        "normalized_hit_rate": round(counts["normalized"] / total, 4) if total else 0.0,
+    }
+
+
+async def search_customers_by_embedding(
+    db: AsyncSession,
+    embedding: List[float],
+    top_k: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List[dict]:
+    """
+    Rank customers by their closest alias in a single statement.
+
+    Alias hits are grouped per customer, the best distance wins, and all of the
+    customer's aliases are aggregated in the same query. When the in-process
+    alias index is warm the ranking is done in memory instead.
+    """
+    hits = await alias_index.search(embedding, top_k)
+    if hits is not None:
+        return await _hydrate_alias_hits(db, hits)
+
+    op = vector_index.distance_operator()
+    candidates = top_k * CANDIDATES_PER_CUSTOMER
+    if ef_search is None and candidates > DEFAULT_HNSW_EF_SEARCH:
+        # HNSW never returns more than ef_search rows; pgvector rejects values above MAX_EF_SEARCH
+        ef_search = min(candidates, MAX_EF_SEARCH)
+    await vector_index.apply_search_params(db, ef_search=ef_search, probes=probes)
+
+    sql = text(f"""
+        WITH hits AS (
+            SELECT customer_id, alias, embedding {op} CAST(:query_vector AS vector) AS distance
+            FROM customer_alias
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding {op} CAST(:query_vector AS vector)
+            LIMIT :candidates
+        ),
+        best AS (
+            SELECT customer_id,
+                   min(distance) AS distance,
+                   (array_agg(alias ORDER BY distance))[1] AS matched_alias
+            FROM hits
+            GROUP BY customer_id
+            ORDER BY min(distance)
+            LIMIT :top_k
+        )
+        SELECT c.id, c.name, b.matched_alias, b.distance,
+               array_agg(a.alias ORDER BY a.alias) AS aliases
+        FROM best b
+        JOIN customer c ON c.id = b.customer_id
+        JOIN customer_alias a ON a.customer_id = c.id
+        GROUP BY c.id, c.name, b.matched_alias, b.distance
+        ORDER BY b.distance
+    """).bindparams(bindparam("query_vector", type_=Vector(1024)))
+    result = await db.execute(sql, {"query_vector": embedding, "candidates": candidates, "top_k": top_k})
+    rows = result.fetchall()
+
+    return [
+        {
+            "id": str(row.id),
+            "name": row.name,
+            "aliases": list(row.aliases),
+            "matched_alias": row.matched_alias,
+            "distance": row.distance,
+            "score": round(vector_index.similarity(row.distance), 6),
+        }
+        for row in rows
+    ]
+
+
+async def _hydrate_alias_hits(db: AsyncSession, hits: List[Tuple[UUID, str, float]]) -> List[dict]:
+    """Names and aliases for in-memory hits, keeping their order."""
+    if not hits:
+        return []
+    result = await db.execute(text("""
+        SELECT c.id, c.name, array_agg(a.alias ORDER BY a.alias) AS aliases
+        FROM customer c
+        JOIN customer_alias a ON a.customer_id = c.id
+        WHERE c.id = ANY(:ids)
+        GROUP BY c.id, c.name
+    """), {"ids": [customer_id for customer_id, _, _ in hits]})
+    customers = {row.id: row for row in result.fetchall()}
+
+    output = []
+    for customer_id, matched_alias, cosine in hits:
+        row = customers.get(customer_id)
+        if row is None:
+            continue  # deleted since the last index update
+        distance = vector_index.distance_from_cosine(cosine)
+        output.append({
+            "id": str(row.id),
+            "name": row.name,
+            "aliases": list(row.aliases),
+            "matched_alias": matched_alias,
+            "distance": distance,
+            "score": round(vector_index.similarity(distance), 6),
+        })
+    return output
+
+
+def encode_cursor(name: str, customer_id: UUID) -> str:
+    raw = json.dumps([name, str(customer_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+# matches ix_customer_name_key_id; a NULL name would make the keyset comparison NULL for every row
+CUSTOMER_SORT_NAME = func.coalesce(Customer.name, "")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, UUID]:
+    try:
+        name, customer_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return name, UUID(customer_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def list_customers(
+    db: AsyncSession,
+    customer_id: Optional[UUID] = None,
+    name: Optional[str] = None,
+    limit: int = 50,
+    after: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Page through customers ordered by (name, id), customers without a name first.
+
+    Returns the page and the cursor for the next one (None on the last page).
+    Aliases are loaded with one extra IN query for the whole page.
+    """
+    query = select(Customer).options(selectinload(Customer.aliases))
+    if customer_id:
+        query = query.filter(Customer.id == customer_id)
+    if name:
+        query = query.filter(Customer.name.ilike(f"%{name}%"))
+    if after:
+        after_name, after_id = decode_cursor(after)
+        query = query.filter(tuple_(CUSTOMER_SORT_NAME, Customer.id) > tuple_(after_name, after_id))
+
+    result = await db.execute(query.order_by(CUSTOMER_SORT_NAME, Customer.id).limit(limit + 1))
+    customers = result.scalars().all()
+    next_cursor = None
+    if len(customers) > limit:
+        customers = customers[:limit]
+        next_cursor = encode_cursor(customers[-1].name or "", customers[-1].id)
+
+    return [
+        {"id": str(c.id), "name": c.name, "aliases": [a.alias for a in c.aliases]}
+        for c in customers
+    ], next_cursor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill customer_alias.normalized_alias.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every alias, not only missing ones")
+    args = parser.parse_args()
+    print(f"{backfill_normalized_aliases(rebuild=args.rebuild)} aliases processed")
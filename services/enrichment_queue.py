@@ -0,0 +1,127 @@
+import os
+import random
+from typing import List
+from uuid import UUID, uuid4
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import EnrichmentJob
+
+load_dotenv(override=True)
+
+# inline: summarize + embed before the insert (default)
+# queue:  commit the row immediately and let enrichment workers fill it in
+ENRICHMENT_MODE = os.getenv("ENRICHMENT_MODE", "inline")
+ENRICHMENT_MAX_ATTEMPTS = int(os.getenv("ENRICHMENT_MAX_ATTEMPTS", "5"))
+ENRICHMENT_LOCK_TIMEOUT_SECONDS = int(os.getenv("ENRICHMENT_LOCK_TIMEOUT_SECONDS", "300"))
+ENRICHMENT_BACKOFF_BASE_SECONDS = float(os.getenv("ENRICHMENT_BACKOFF_BASE_SECONDS", "2"))
+ENRICHMENT_BACKOFF_MAX_SECONDS = float(os.getenv("ENRICHMENT_BACKOFF_MAX_SECONDS", "300"))
+
+
+def queue_enabled() -> bool:
+    return ENRICHMENT_MODE == "queue"
+
+
+def enqueue_enrichment(db: AsyncSession, entity: str, entity_id: UUID) -> UUID:
+    """Add an enrichment job to the session; it is committed together with the row."""
+    job_id = uuid4()
+    db.add(EnrichmentJob(
+        id=job_id,
+        entity=entity,
+        entity_id=entity_id,
+        status="queued",
+        attempts=0,
+        max_attempts=ENRICHMENT_MAX_ATTEMPTS,
+    ))
+    return job_id
+
+
+async def claim_jobs(db: AsyncSession, limit: int = 1) -> List[dict]:
+    """
+    Claim up to `limit` of the oldest runnable jobs.
+
+    FOR UPDATE SKIP LOCKED lets any number of workers poll the table without
+    blocking each other or picking the same job.
+    """
+    result = await db.execute(text("""
+        UPDATE enrichment_job
+        SET status = 'running', attempts = attempts + 1, locked_at = now(), updated_at = now()
+        WHERE id IN (
+            SELECT id FROM enrichment_job
+            WHERE status = 'queued' AND run_after <= now()
+            ORDER BY run_after
+            FOR UPDATE SKIP LOCKED
+            LIMIT :limit
+        )
+        RETURNING id, entity, entity_id, attempts, max_attempts
+    """), {"limit": limit})
+    rows = result.mappings().all()
+    await db.commit()
+    return [dict(row) for row in rows]
+
+
+async def complete_job(db: AsyncSession, job_id: UUID) -> None:
+    await db.execute(
+        text("UPDATE enrichment_job SET status = 'done', last_error = NULL, updated_at = now() WHERE id = :id"),
+        {"id": job_id},
+    )
+
+
+async def fail_job(db: AsyncSession, job: dict, error: str) -> bool:
+    """Reschedule with jittered exponential backoff; returns True once attempts are exhausted."""
+    if job["attempts"] >= job["max_attempts"]:
+        await db.execute(
+            text("UPDATE enrichment_job SET status = 'failed', last_error = :error, updated_at = now() WHERE id = :id"),
+            {"id": job["id"], "error": error},
+        )
+        return True
+
+    delay = min(ENRICHMENT_BACKOFF_MAX_SECONDS, ENRICHMENT_BACKOFF_BASE_SECONDS * 2 ** (job["attempts"] - 1))
+    delay = random.uniform(delay / 2, delay)
+    await db.execute(
+        text("""
+            UPDATE enrichment_job
+            SET status = 'queued', last_error = :error, locked_at = NULL, updated_at = now(),
+                run_after = now() + make_interval(secs => :delay)
+            WHERE id = :id
+        """),
+        {"id": job["id"], "error": error, "delay": float(delay)},
+    )
+    return False
+
+
+async def requeue_stale_jobs(db: AsyncSession) -> int:
+    """Return jobs whose worker died mid-run to the queue."""
+    result = await db.execute(
+        text("""
+            UPDATE enrichment_job
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                last_error = coalesce(last_error, 'worker lock expired'),
+                locked_at = NULL, updated_at = now()
+            WHERE status = 'running' AND locked_at < now() - make_interval(secs => :timeout)
+        """),
+        {"timeout": float(ENRICHMENT_LOCK_TIMEOUT_SECONDS)},
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def get_job(db: AsyncSession, job_id: UUID) -> dict:
+    job = await db.get(EnrichmentJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "id": str(job.id),
+        "entity": job.entity,
+        "entity_id": str(job.entity_id),
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "last_error": job.last_error,
+        "run_after": job.run_after,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
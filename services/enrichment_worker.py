@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+from typing import List, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from utils.bedrock_wrapper import EmbeddingBatchError, afetch_embeddings
+from models import CustomNote, FeatureRequest, Task
+from services.batch_summarizer import KINDS, summarize_many
+from services.enrichment_queue import claim_jobs, complete_job, fail_job, requeue_stale_jobs
+from services.featurerequest_service import enrich_queued_feature_request
+from services.note_service import enrich_note
+from services.task_service import enrich_task
+
+load_dotenv(override=True)
+
+ENRICHMENT_WORKERS = int(os.getenv("ENRICHMENT_WORKERS", "4"))
+ENRICHMENT_POLL_SECONDS = float(os.getenv("ENRICHMENT_POLL_SECONDS", "1"))
+# Jobs claimed at once; under a backlog they are summarized together (services/batch_summarizer.py).
+ENRICHMENT_BATCH_SIZE = int(os.getenv("ENRICHMENT_BATCH_SIZE", "10"))
+# Start workers inside the API process; set to false when running them separately
+# with `python -m services.enrichment_worker`.
+ENRICHMENT_RUN_IN_APP = os.getenv("ENRICHMENT_RUN_IN_APP", "true").lower() == "true"
+
+ENRICHERS = {
+    "note": (CustomNote, enrich_note),
+    "task": (Task, enrich_task),
+    "feature_request": (FeatureRequest, enrich_queued_feature_request),
+}
+
+
+async def _fail(db: AsyncSession, model, job: dict, error: str) -> None:
+    logging.warning(f"Enrichment of {job['entity']} {job['entity_id']} failed (attempt {job['attempts']}): {error}")
+    if await fail_job(db, job, error[:2000]):
+        row = await db.get(model, job["entity_id"])
+        if row is not None:
+            row.enrichment_status = "failed"
+
+
+async def process_job(db: AsyncSession, job: dict) -> None:
+    model, enrich = ENRICHERS[job["entity"]]
+    row = await db.get(model, job["entity_id"])
+    if row is None:
+        # the row was deleted before it could be enriched
+        await complete_job(db, job["id"])
+        await db.commit()
+        return
+
+    try:
+        await enrich(row)
+        row.enrichment_status = "done"
+        await complete_job(db, job["id"])
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        await _fail(db, model, job, str(e))
+        await db.commit()
+
+
+async def process_batch(db: AsyncSession, jobs: List[dict]) -> None:
+    """
+    Enrich several jobs of one entity: one batched summarization and one
+    embedding batch. Each job still succeeds or fails on its own.
+    """
+    if len(jobs) == 1:
+        return await process_job(db, jobs[0])
+    entity = jobs[0]["entity"]
+    model, _ = ENRICHERS[entity]
+    kind = KINDS[entity]
+    pending, single = [], []
+    for job in jobs:
+        row = await db.get(model, job["entity_id"])
+        if row is None:
+            await complete_job(db, job["id"])
+        elif kind.batchable(row):
+            pending.append((job, row))
+        else:
+            single.append(job)
+
+    outputs = await summarize_many(entity, [kind.source(row) for _, row in pending])
+    summarized, failed = [], []
+    for (job, row), output in zip(pending, outputs):
+        if isinstance(output, Exception):
+            failed.append((job, str(output)))
+        else:
+            summarized.append((job, row, output))
+
+    embeddings, errors = [], {}
+    if summarized:
+        texts = [output["summary"] if isinstance(output, dict) else output for _, _, output in summarized]
+        try:
+            embeddings = await afetch_embeddings(texts)
+        except EmbeddingBatchError as e:
+            errors = e.errors
+            embeddings = [e.embeddings.get(i) for i in range(len(texts))]
+        except Exception as e:
+            errors = {i: str(e) for i in range(len(texts))}
+            embeddings = [None] * len(texts)
+
+    for i, (job, row, output) in enumerate(summarized):
+        if i in errors:
+            failed.append((job, f"Embedding failed: {errors[i]}"))
+            continue
+        kind.apply(row, output)
+        row.embedding = embeddings[i]
+        row.enrichment_status = "done"
+        await complete_job(db, job["id"])
+    for job, error in failed:
+        await _fail(db, model, job, error)
+    await db.commit()
+    for job in single:
+        await process_job(db, job)
+
+
+async def worker_loop(stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        jobs = []
+        try:
+            async with AsyncSessionLocal() as db:
+                jobs = await claim_jobs(db, ENRICHMENT_BATCH_SIZE)
+                by_entity = {}
+                for job in jobs:
+                    by_entity.setdefault(job["entity"], []).append(job)
+                for entity_jobs in by_entity.values():
+                    await process_batch(db, entity_jobs)
+        except Exception:
+            logging.error("Enrichment worker error", exc_info=True)
+
+        if not jobs:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=ENRICHMENT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def stale_job_reaper(stop: asyncio.Event, interval: float = 60) -> None:
+    while not stop.is_set():
+        try:
+            async with AsyncSessionLocal() as db:
+                requeued = await requeue_stale_jobs(db)
+                if requeued:
+                    logging.warning(f"Requeued {requeued} stale enrichment jobs")
+        except Exception:
+            logging.error("Stale job reaper error", exc_info=True)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_workers(count: int = ENRICHMENT_WORKERS) -> Tuple[asyncio.Event, List[asyncio.Task]]:
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(worker_loop(stop)) for _ in range(count)]
+    tasks.append(asyncio.create_task(stale_job_reaper(stop)))
+    return stop, tasks
+
+
+async def stop_workers(stop: asyncio.Event, tasks: List[asyncio.Task]) -> None:
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_workers() -> None:
+    stop, tasks = start_workers()
+    logging.info(f"Started {ENRICHMENT_WORKERS} enrichment workers")
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await stop_workers(stop, tasks)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_workers())
@@ -1,36 +1,58 @@
+from typing import List, Optional, Tuple
 from uuid import UUID, uuid4
 import json
+import logging
+import os
 from datetime import datetime
+from dotenv import load_dotenv
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Float, bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_object_session
 from sqlalchemy.exc import IntegrityError
 
 from models import FeatureRequest, Customer
-from utils.bedrock_wrapper import call_claude, fetch_embedding
+from services.enrichment_queue import enqueue_enrichment, queue_enabled
+from utils import vector_index
+from utils.embedding_cache import normalize_text
+from utils.bedrock_wrapper import acall_claude, afetch_embedding, forget_claude_output
+from utils.search import execute_structured_query, semantic_search
 from schemas import (
+    DuplicateMergedStatus,
+    EnrichmentQueuedStatus,
     FeatureRequestUpdatePayload,
     FeatureRequestOperationRequest,
     FeatureRequestFromRaw,
     OperationStatus,
+    SemanticSearchRequest,
+    StructuredQuery,
 )
 
-def summarize_feature_request(text: str) -> dict:
-    """Use Claude to summarize a raw feature request into title and summary."""
-    system_prompt = """
-    You are a helpful assistant summarizing software feature requests.
-
-    Based on the provided input:
-    1. Generate a clear and concise TITLE — it must be 80 characters or fewer.
-    2. Then generate a longer SUMMARY explaining the feature in more detail (1–3 paragraphs).
-
-    Return only the JSON object in this format:
-    {
-      "title": "<title here>",
-      "summary": "<summary here>"
-    }
-    """
-    raw_response = call_claude(system_prompt, text)
+load_dotenv(override=True)
+
+# Near-duplicate detection: the raw text is embedded (cheap, cached) and compared with the
+# raw text embeddings of canonical requests before any Claude call. In queue mode the check
+# runs in the enrichment job, so ingest never waits on Titan.
+FEATURE_REQUEST_DEDUPE = os.getenv("FEATURE_REQUEST_DEDUPE", "true").lower() == "true"
+FEATURE_REQUEST_DUPLICATE_THRESHOLD = float(os.getenv("FEATURE_REQUEST_DUPLICATE_THRESHOLD", "0.9"))
+
+FEATURE_REQUEST_SUMMARY_PROMPT = """
+You are a helpful assistant summarizing software feature requests.
 
+Based on the provided input:
+1. Generate a clear and concise TITLE — it must be 80 characters or fewer.
+2. Then generate a longer SUMMARY explaining the feature in more detail (1–3 paragraphs).
+
+Return only the JSON object in this format:
+{
+  "title": "<title here>",
+  "summary": "<summary here>"
+}
+"""
+
+
+def parse_summary(raw_response: str) -> dict:
+    """Title and summary out of Claude's JSON reply; raises ValueError when it is malformed."""
     try:
         if raw_response.strip().startswith("```"):
             raw_response = raw_response.strip().strip("`").strip("json").strip()
@@ -40,87 +62,224 @@ def summarize_feature_request(text: str) -> dict:
         raise ValueError(f"Failed to parse Claude response: {e}\nRaw: {raw_response}")
 
 
-def add_feature_request_from_raw(
-    db: Session,
+async def summarize_feature_request(text: str) -> dict:
+    """Use Claude to summarize a raw feature request into title and summary."""
+    raw_response = await acall_claude(FEATURE_REQUEST_SUMMARY_PROMPT, text, cache=True)
+    try:
+        return parse_summary(raw_response)
+    except ValueError:
+        forget_claude_output(FEATURE_REQUEST_SUMMARY_PROMPT, text)
+        raise
+
+
+async def enrich_feature_request(request: FeatureRequest) -> None:
+    """Fill in the Claude title / summary and the summary embedding (and the raw text embedding if missing)."""
+    summary_data = await summarize_feature_request(request.raw_input)
+    request.request_title = summary_data["title"]
+    request.summary = summary_data["summary"]
+    request.embedding = await afetch_embedding(request.summary)
+    if request.raw_embedding is None:
+        request.raw_embedding = await afetch_embedding(request.raw_input)
+
+
+async def find_duplicate(
+    db: AsyncSession, raw_embedding: List[float], exclude_id: Optional[UUID] = None
+) -> Optional[Tuple[FeatureRequest, float]]:
+    """Closest canonical request by raw text and its similarity, if it clears the duplicate threshold."""
+    distance = FeatureRequest.raw_embedding.op(vector_index.distance_operator(), return_type=Float)(
+        bindparam("query_vector", raw_embedding, type_=Vector(1024))
+    ).label("distance")
+    query = (
+        select(FeatureRequest, distance)
+        .where(
+            FeatureRequest.raw_embedding.is_not(None),
+            FeatureRequest.embedding.is_not(None),
+            FeatureRequest.canonical_id.is_(None),
+        )
+        .order_by(distance)
+        .limit(1)
+    )
+    if exclude_id is not None:
+        query = query.where(FeatureRequest.id != exclude_id)
+    await vector_index.apply_iterative_scan(db)
+    row = (await db.execute(query)).first()
+    if row is None:
+        return None
+    similarity = vector_index.similarity(row.distance)
+    return (row[0], similarity) if similarity >= FEATURE_REQUEST_DUPLICATE_THRESHOLD else None
+
+
+def link_duplicate(request: FeatureRequest, canonical: FeatureRequest) -> None:
+    """Make request a near-duplicate of canonical, sharing its title, summary and embedding."""
+    request.request_title = canonical.request_title
+    request.summary = canonical.summary
+    request.embedding = canonical.embedding
+    request.canonical_id = canonical.id
+
+
+async def enrich_queued_feature_request(request: FeatureRequest) -> None:
+    """Enrichment job: link a near-duplicate if the request asked for it, otherwise summarize."""
+    if request.dedupe_pending:
+        request.dedupe_pending = None
+        request.raw_embedding = await afetch_embedding(request.raw_input)
+        match = await find_duplicate(async_object_session(request), request.raw_embedding, exclude_id=request.id)
+        if match:
+            link_duplicate(request, match[0])
+            return
+    await enrich_feature_request(request)
+
+
+async def add_feature_request_from_raw(
+    db: AsyncSession,
     customer_id: UUID,
     raw_input: str,
     priority: str = "unspecified",
     status: str = "new",
+    dedupe: bool = True,
 ) -> OperationStatus:
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail=f"Customer {customer_id} not found.")
 
     request_id = uuid4()
     created_at = datetime.utcnow()
-    summary_data = summarize_feature_request(raw_input)
+
+    raw_embedding = None
+    if dedupe and FEATURE_REQUEST_DEDUPE and not queue_enabled():
+        try:
+            raw_embedding = await afetch_embedding(raw_input)
+        except Exception as e:
+            # the duplicate check is an optimization; store the request without it
+            logging.warning(f"Duplicate check for feature request {request_id} skipped: {e}")
+        match = await find_duplicate(db, raw_embedding) if raw_embedding else None
+        if match:
+            canonical, similarity = match
+            request = FeatureRequest(
+                id=request_id,
+                customer_id=customer_id,
+                priority=priority,
+                status=status,
+                created_at=created_at,
+                raw_input=raw_input,
+                raw_embedding=raw_embedding,
+            )
+            link_duplicate(request, canonical)
+            db.add(request)
+            await db.commit()
+            return DuplicateMergedStatus(
+                status="merged",
+                entity="feature_request",
+                id=str(request_id),
+                canonical_id=str(canonical.id),
+                canonical_title=canonical.request_title,
+                similarity=round(similarity, 6),
+            )
 
     request = FeatureRequest(
         id=request_id,
         customer_id=customer_id,
-        request_title=summary_data["title"],
-        summary=summary_data["summary"],
         priority=priority,
         status=status,
         created_at=created_at,
         raw_input=raw_input,
-        embedding=fetch_embedding(summary_data["summary"]),
+        raw_embedding=raw_embedding,
     )
 
+    job_id = None
+    if queue_enabled():
+        request.enrichment_status = "pending"
+        request.dedupe_pending = (dedupe and FEATURE_REQUEST_DEDUPE) or None
+        job_id = enqueue_enrichment(db, "feature_request", request_id)
+    else:
+        await enrich_feature_request(request)
+
     try:
         db.add(request)
-        db.commit()
+        await db.commit()
+        if job_id:
+            return EnrichmentQueuedStatus(
+                status="accepted", entity="feature_request", id=str(request_id), job_id=str(job_id)
+            )
         return OperationStatus(status="created", entity="feature_request", id=str(request_id))
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
-def update_feature_request(db: Session, update: FeatureRequestUpdatePayload) -> OperationStatus:
-    request = db.query(FeatureRequest).filter(FeatureRequest.id == update.request_id).first()
+def raw_input_unchanged(request: FeatureRequest, raw_input: str) -> bool:
+    """
+    Whether re-enriching would reproduce what is stored: same text (up to
+    whitespace) and already enriched, or enrichment is still queued.
+    """
+    if request.raw_input is None or normalize_text(request.raw_input) != normalize_text(raw_input):
+        return False
+    enriched = request.summary is not None and request.embedding is not None
+    return enriched or request.enrichment_status == "pending"
+
+
+async def update_feature_request(db: AsyncSession, update: FeatureRequestUpdatePayload) -> OperationStatus:
+    request = await db.get(FeatureRequest, update.request_id)
     if not request:
         raise HTTPException(status_code=404, detail="Feature request not found")
 
-    if update.raw_input:
+    job_id = None
+    if update.raw_input and not raw_input_unchanged(request, update.raw_input):
         request.raw_input = update.raw_input
-        summary_data = summarize_feature_request(update.raw_input)
-        request.request_title = summary_data["title"]
-        request.summary = summary_data["summary"]
-        request.embedding = fetch_embedding(request.summary)
+        request.canonical_id = None  # rewritten text gets its own summary
+        request.raw_embedding = None
+        if queue_enabled():
+            request.enrichment_status = "pending"
+            job_id = enqueue_enrichment(db, "feature_request", request.id)
+        else:
+            await enrich_feature_request(request)
 
     if update.priority:
         request.priority = update.priority
     if update.status:
         request.status = update.status
 
-    db.commit()
+    await db.commit()
+    if job_id:
+        return EnrichmentQueuedStatus(status="accepted", entity="feature_request", id=str(request.id), job_id=str(job_id))
     return OperationStatus(status="updated", entity="feature_request", id=str(request.id))
 
 
-def delete_feature_request(db: Session, request_id: UUID) -> OperationStatus:
-    request = db.query(FeatureRequest).filter(FeatureRequest.id == request_id).first()
+async def delete_feature_request(db: AsyncSession, request_id: UUID) -> OperationStatus:
+    request = await db.get(FeatureRequest, request_id)
     if not request:
         raise HTTPException(status_code=404, detail="Feature request not found")
 
-    db.delete(request)
-    db.commit()
+    await db.delete(request)
+    await db.commit()
     return OperationStatus(status="deleted", entity="feature_request", id=str(request.id))
 
 
-def handle_feature_request_operation(db: Session, payload: FeatureRequestOperationRequest):
+async def handle_feature_request_operation(db: AsyncSession, payload: FeatureRequestOperationRequest):
     if payload.operation == "add":
         raw = FeatureRequestFromRaw(**payload.payload)
-        return add_feature_request_from_raw(
+        return await add_feature_request_from_raw(
             db=db,
             customer_id=raw.customer_id,
             raw_input=raw.raw_input,
             priority=raw.priority,
             status=raw.status,
+            dedupe=raw.dedupe,
         )
     elif payload.operation == "update":
-        return update_feature_request(db, FeatureRequestUpdatePayload(**payload.payload))
+        return await update_feature_request(db, FeatureRequestUpdatePayload(**payload.payload))
     elif payload.operation == "delete":
         request_id = UUID(payload.payload.get("request_id"))
-        return delete_feature_request(db, request_id)
+        return await delete_feature_request(db, request_id)
     else:
-        raise HTTPException(status_code=400, detail="Invalid feature request operation")
\ No newline at end of file
+        raise HTTPException(status_code=400, detail="Invalid feature request operation")
+
+
+async def query_feature_requests(db: AsyncSession, payload: StructuredQuery) -> tuple:
+    """Structured feature request query, newest first by default."""
+    return await execute_structured_query(db, FeatureRequest, payload, default_order=[("created_at", "desc")])
+
+
+async def search_feature_requests(db: AsyncSession, payload: SemanticSearchRequest) -> list:
+    """Filtered semantic search over feature requests by summary embedding."""
+    embedding = await afetch_embedding(payload.query)
+    return await semantic_search(db, FeatureRequest, FeatureRequest.embedding, embedding, payload)
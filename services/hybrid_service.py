@@ -0,0 +1,234 @@
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Float, bindparam, case, func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal, has_extension
+from models import (
+    CUSTOMER_DOCUMENT,
+    CUSTOMER_SEARCH_CONFIG,
+    FEATURE_REQUEST_DOCUMENT,
+    NOTE_DOCUMENT,
+    TEXT_SEARCH_CONFIG,
+    CustomNote,
+    Customer,
+    CustomerAlias,
+    FeatureRequest,
+)
+from schemas import HybridSearchRequest
+from utils import vector_index
+from utils.bedrock_wrapper import afetch_embedding
+from utils.search import compile_where, serialize_row
+
+load_dotenv(override=True)
+
+# Reciprocal rank fusion: score = sum(weight / (k + rank)) over the signals that returned the row.
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))  # rows taken from each signal
+DEFAULT_WEIGHTS = {
+    "fulltext": float(os.getenv("HYBRID_FULLTEXT_WEIGHT", "1.0")),
+    "trigram": float(os.getenv("HYBRID_TRIGRAM_WEIGHT", "1.0")),
+    "vector": float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0")),
+}
+# Aliases fetched per customer candidate; several aliases can belong to one customer.
+ALIASES_PER_CUSTOMER = 4
+
+
+@dataclass
+class HybridEntity:
+    model: type
+    document: str                   # tsvector expression matching the model's GIN index
+    config: str                     # text search configuration of the document
+    trigram_columns: List[str] = field(default_factory=list)
+    keyword_columns: List[str] = field(default_factory=list)  # exact, case-insensitive identifier matches
+    vector: Optional[Callable] = None                         # (embedding, filters, limit) -> Select(id, distance)
+
+
+def _document_vector(entity: HybridEntity, embedding, filters, limit: int):
+    column = entity.model.embedding
+    distance = column.op(vector_index.distance_operator(), return_type=Float)(
+        bindparam("query_vector", embedding, type_=Vector(1024))
+    ).label("distance")
+    return (
+        select(entity.model.id, distance)
+        .where(column.is_not(None), *filters)
+        .order_by(distance)
+        .limit(limit)
+    )
+
+
+def _customer_vector(entity: HybridEntity, embedding, filters, limit: int):
+    """Customers ranked by their closest alias."""
+    distance = CustomerAlias.embedding.op(vector_index.distance_operator(), return_type=Float)(
+        bindparam("query_vector", embedding, type_=Vector(1024))
+    ).label("distance")
+    hits = (
+        select(CustomerAlias.customer_id, distance)
+        .join(Customer, Customer.id == CustomerAlias.customer_id)
+        .where(CustomerAlias.embedding.is_not(None), *filters)
+        .order_by(distance)
+        .limit(limit * ALIASES_PER_CUSTOMER)
+        .subquery()
+    )
+    best = func.min(hits.c.distance)
+    return (
+        select(hits.c.customer_id.label("id"), best.label("distance"))
+        .group_by(hits.c.customer_id)
+        .order_by(best)
+        .limit(limit)
+    )
+
+
+HYBRID_ENTITIES: Dict[str, HybridEntity] = {
+    "customers": HybridEntity(
+        model=Customer,
+        document=CUSTOMER_DOCUMENT,
+        config=CUSTOMER_SEARCH_CONFIG,
+        trigram_columns=["name"],
+        keyword_columns=["jira_project_key"],
+        vector=_customer_vector,
+    ),
+    "notes": HybridEntity(
+        model=CustomNote, document=NOTE_DOCUMENT, config=TEXT_SEARCH_CONFIG, vector=_document_vector
+    ),
+    "feature-requests": HybridEntity(
+        model=FeatureRequest,
+        document=FEATURE_REQUEST_DOCUMENT,
+        config=TEXT_SEARCH_CONFIG,
+        trigram_columns=["request_title"],
+        vector=_document_vector,
+    ),
+}
+
+
+def _filters(entity: HybridEntity, payload: HybridSearchRequest) -> list:
+    filters = []
+    if payload.customer_id:
+        column = entity.model.id if entity.model is Customer else entity.model.customer_id
+        filters.append(column == payload.customer_id)
+    if payload.where is not None:
+        filters.append(compile_where(entity.model, payload.where))
+    return filters
+
+
+def _fulltext_query(entity: HybridEntity, query: str, filters: list, limit: int):
+    document = literal_column(entity.document)
+    tsquery = func.websearch_to_tsquery(literal_column(f"'{entity.config}'"), query)
+    score = func.ts_rank_cd(document, tsquery)
+    matches = [document.op("@@")(tsquery)]
+    for name in entity.keyword_columns:
+        keyword = func.lower(entity.model.__table__.c[name]) == query.lower()
+        matches.append(keyword)
+        score = score + case((keyword, 1.0), else_=0.0)  # exact identifiers outrank prose
+    return (
+        select(entity.model.id, score.label("score"))
+        .where(or_(*matches), *filters)
+        .order_by(score.desc())
+        .limit(limit)
+    )
+
+
+def _trigram_query(entity: HybridEntity, query: str, filters: list, limit: int):
+    columns = [entity.model.__table__.c[name] for name in entity.trigram_columns]
+    scores = [func.similarity(column, query) for column in columns]
+    score = func.greatest(*scores) if len(scores) > 1 else scores[0]
+    return (
+        select(entity.model.id, score.label("score"))
+        .where(or_(*[column.op("%")(query) for column in columns]), *filters)
+        .order_by(score.desc())
+        .limit(limit)
+    )
+
+
+async def _run_signal(statement, vector: bool = False) -> list:
+    # every signal gets its own session so the statements run concurrently
+    async with AsyncSessionLocal() as session:
+        if vector:
+            await vector_index.apply_iterative_scan(session)
+            await vector_index.apply_search_params(session, ef_search=max(40, HYBRID_CANDIDATES))
+        return (await session.execute(statement)).all()
+
+
+async def _vector_signal(entity: HybridEntity, query: str, filters: list, limit: int) -> list:
+    embedding = await afetch_embedding(query)
+    return await _run_signal(entity.vector(entity, embedding, filters, limit), vector=True)
+
+
+def reciprocal_rank_fusion(signals: Dict[str, list], weights: Dict[str, float], k: int = HYBRID_RRF_K) -> dict:
+    """
+    Fuse ranked (id, raw_score) lists.
+
+    Returns id -> {"score": fused score, "signals": {name: {"rank": r, "score": raw}}}.
+    """
+    fused = {}
+    for name, rows in signals.items():
+        weight = weights.get(name, 0.0)
+        for rank, (row_id, raw) in enumerate(rows, 1):
+            entry = fused.setdefault(row_id, {"score": 0.0, "signals": {}})
+            entry["score"] += weight / (k + rank)
+            entry["signals"][name] = {"rank": rank, "score": round(float(raw), 6)}
+    return fused
+
+
+async def hybrid_search(db: AsyncSession, entity_name: str, payload: HybridSearchRequest) -> List[dict]:
+    """
+    Full-text, trigram and vector retrieval run concurrently, merged with reciprocal rank fusion.
+
+    Signals whose weight is 0 are skipped; trigram needs pg_trgm and an entity with
+    short name-like columns.
+    """
+    entity = HYBRID_ENTITIES[entity_name]
+    query = payload.query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Query must not be empty.")
+    weights = {**DEFAULT_WEIGHTS, **(payload.weights or {})}
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown signals: {', '.join(sorted(unknown))}")
+
+    filters = _filters(entity, payload)
+    limit = max(HYBRID_CANDIDATES, payload.top_k)
+    tasks = {}
+    if weights["fulltext"] > 0:
+        tasks["fulltext"] = _run_signal(_fulltext_query(entity, query, filters, limit))
+    if weights["trigram"] > 0 and entity.trigram_columns and has_extension("pg_trgm"):
+        tasks["trigram"] = _run_signal(_trigram_query(entity, query, filters, limit))
+    if weights["vector"] > 0 and entity.vector:
+        tasks["vector"] = _vector_signal(entity, query, filters, limit)
+    if not tasks:
+        raise HTTPException(status_code=400, detail="No retrieval signal enabled.")
+
+    results = await asyncio.gather(*tasks.values())
+    signals = {
+        # vector rows carry a distance; report the similarity instead so higher is better everywhere
+        name: [(r.id, vector_index.similarity(r.distance) if name == "vector" else r.score) for r in rows]
+        for name, rows in zip(tasks, results)
+    }
+    fused = reciprocal_rank_fusion(signals, weights)
+    ranked = sorted(fused.items(), key=lambda item: item[1]["score"], reverse=True)[:payload.top_k]
+    if not ranked:
+        return []
+
+    model = entity.model
+    rows = (await db.execute(select(model).where(model.id.in_([row_id for row_id, _ in ranked])))).scalars().all()
+    by_id = {row.id: row for row in rows}
+
+    output = []
+    for row_id, entry in ranked:
+        if row_id not in by_id:
+            continue  # deleted between the signal queries and the fetch
+        item = {**serialize_row(by_id[row_id]), "score": round(entry["score"], 6)}
+        if payload.explain:
+            item["explain"] = {
+                "signals": entry["signals"],
+                "weights": {name: weights[name] for name in signals},
+                "rrf_k": HYBRID_RRF_K,
+            }
+        output.append(item)
+    return output
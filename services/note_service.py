@@ -1,142 +1,118 @@
-from uuid import UUID, uuid4
+import asyncio
 import json
+import os
 from datetime import datetime
-from fastapi import HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
-
-from models import FeatureRequest, Customer, CustomNote
-from utils.bedrock_wrapper import call_claude, fetch_embedding
-from schemas import (
-    FeatureRequestUpdatePayload,
-    FeatureRequestOperationRequest,
-    FeatureRequestFromRaw,
-    NoteCreateRequest,
-    OperationStatus,
+from typing import List, Tuple
+from uuid import UUID, uuid4
+
+from dotenv import load_dotenv
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Float, bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import CustomNote, NoteChunk
+from services.enrichment_queue import enqueue_enrichment, queue_enabled
+from utils import vector_index
+from utils.bedrock_wrapper import acall_claude, afetch_embedding, afetch_embeddings
+from utils.chunking import split_text
+from utils.llm_providers import estimate_tokens
+from utils.search import ANN_EF_SEARCH, compile_where, execute_structured_query, semantic_search
+from schemas import EnrichmentQueuedStatus, OperationStatus, SemanticSearchRequest, StructuredQuery
+
+load_dotenv(override=True)
+
+# Notes above the threshold are split into overlapping chunks, summarized chunk by
+# chunk (map) and then as a whole (reduce); every chunk keeps its own embedding.
+NOTE_CHUNK_THRESHOLD_TOKENS = int(os.getenv("NOTE_CHUNK_THRESHOLD_TOKENS", "3000"))
+NOTE_CHUNK_TOKENS = int(os.getenv("NOTE_CHUNK_TOKENS", "800"))
+NOTE_CHUNK_OVERLAP_TOKENS = int(os.getenv("NOTE_CHUNK_OVERLAP_TOKENS", "100"))
+NOTE_CHUNK_CONCURRENCY = int(os.getenv("NOTE_CHUNK_CONCURRENCY", "8"))  # Claude calls in flight per note
+
+NOTE_SUMMARY_PROMPT = "You are a helpful assistant that summarizes notes into several sentences."
+CHUNK_SUMMARY_PROMPT = (
+    "You are a helpful assistant that summarizes one part of a longer note in a few sentences. "
+    "Keep names, numbers, decisions and action items."
+)
+NOTE_REDUCE_PROMPT = (
+    "You are a helpful assistant that summarizes notes into several sentences. You get summaries "
+    "of consecutive parts of one long note; write a single summary of the whole note."
 )
 
-def summarize_feature_request(text: str) -> dict:
-    """Use Claude to summarize a raw feature request into title and summary."""
-    system_prompt = """
-    You are a helpful assistant summarizing software feature requests.
 
-    Based on the provided input:
-    1. Generate a clear and concise TITLE — it must be 80 characters or fewer.
-    2. Then generate a longer SUMMARY explaining the feature in more detail (1–3 paragraphs).
+async def summarize_note(note_text: str) -> str:
+    """Summarizes notes using Claude Sonnet 4."""
+    return await acall_claude(NOTE_SUMMARY_PROMPT, note_text, cache=True)
 
-    Return only the JSON object in this format:
-    {
-      "title": "<title here>",
-      "summary": "<summary here>"
-    }
-    """
-    raw_response = call_claude(system_prompt, text)
 
-    try:
-        if raw_response.strip().startswith("```"):
-            raw_response = raw_response.strip().strip("`").strip("json").strip()
-        parsed = json.loads(raw_response)
-        return {"title": parsed["title"], "summary": parsed["summary"]}
-    except Exception as e:
-        raise ValueError(f"Failed to parse Claude response: {e}\nRaw: {raw_response}")
+def is_long_note(full_note: str) -> bool:
+    return estimate_tokens(full_note or "") > NOTE_CHUNK_THRESHOLD_TOKENS
 
 
-def add_feature_request_from_raw(
-    db: Session,
-    customer_id: UUID,
-    raw_input: str,
-    priority: str = "unspecified",
-    status: str = "new",
-) -> OperationStatus:
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
-    if not customer:
-        raise HTTPException(status_code=404, detail=f"Customer {customer_id} not found.")
+def _join_parts(summaries: List[str]) -> str:
+    return "\n\n".join(f"Part {i + 1} of {len(summaries)}:\n{s}" for i, s in enumerate(summaries))
 
-    request_id = uuid4()
-    created_at = datetime.utcnow()
-    summary_data = summarize_feature_request(raw_input)
 
-    request = FeatureRequest(
-        id=request_id,
-        customer_id=customer_id,
-        request_title=summary_data["title"],
-        summary=summary_data["summary"],
-        priority=priority,
-        status=status,
-        created_at=created_at,
-        raw_input=raw_input,
-        embedding=fetch_embedding(summary_data["summary"]),
-    )
+def _group(summaries: List[str], max_tokens: int) -> List[List[str]]:
+    """Consecutive groups within max_tokens; at least two per group, so every round shrinks."""
+    groups, current = [], []
+    for summary in summaries:
+        if len(current) >= 2 and estimate_tokens(_join_parts(current + [summary])) > max_tokens:
+            groups.append(current)
+            current = []
+        current.append(summary)
+    if current:
+        groups.append(current)
+    return groups
 
-    try:
-        db.add(request)
-        db.commit()
-        return OperationStatus(status="created", entity="feature_request", id=str(request_id))
-    except IntegrityError as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
-
-def update_feature_request(db: Session, update: FeatureRequestUpdatePayload) -> OperationStatus:
-    request = db.query(FeatureRequest).filter(FeatureRequest.id == update.request_id).first()
-    if not request:
-        raise HTTPException(status_code=404, detail="Feature request not found")
-
-    if update.raw_input:
-        request.raw_input = update.raw_input
-        summary_data = summarize_feature_request(update.raw_input)
-        request.request_title = summary_data["title"]
-        request.summary = summary_data["summary"]
-        request.embedding = fetch_embedding(request.summary)
-
-    if update.priority:
-        request.priority = update.priority
-    if update.status:
-        request.status = update.status
-
-    db.commit()
-    return OperationStatus(status="updated", entity="feature_request", id=str(request.id))
-
-
-def delete_feature_request(db: Session, request_id: UUID) -> OperationStatus:
-    request = db.query(FeatureRequest).filter(FeatureRequest.id == request_id).first()
-    if not request:
-        raise HTTPException(status_code=404, detail="Feature request not found")
-
-    db.delete(request)
-    db.commit()
-    return OperationStatus(status="deleted", entity="feature_request", id=str(request.id))
-
-
-def handle_feature_request_operation(db: Session, payload: FeatureRequestOperationRequest):
-    if payload.operation == "add":
-        raw = FeatureRequestFromRaw(**payload.payload)
-        return add_feature_request_from_raw(
-            db=db,
-            customer_id=raw.customer_id,
-            raw_input=raw.raw_input,
-            priority=raw.priority,
-            status=raw.status,
+
+async def summarize_long_note(full_note: str) -> Tuple[str, List[dict]]:
+    """
+    Map-reduce summary of a long note: (summary, chunks). Chunk summaries that
+    together exceed the threshold are reduced in consecutive groups first.
+    """
+    semaphore = asyncio.Semaphore(NOTE_CHUNK_CONCURRENCY)
+
+    async def claude(prompt: str, text: str) -> str:
+        async with semaphore:
+            return await acall_claude(prompt, text, cache=True)
+
+    pieces = split_text(full_note, NOTE_CHUNK_TOKENS, NOTE_CHUNK_OVERLAP_TOKENS)
+    summaries = await asyncio.gather(*(claude(CHUNK_SUMMARY_PROMPT, content) for _, _, content in pieces))
+    chunks = [
+        {"chunk_index": i, "start_char": start, "end_char": end, "content": content, "summary": summary}
+        for i, ((start, end, content), summary) in enumerate(zip(pieces, summaries))
+    ]
+
+    level = list(summaries)
+    while len(level) > 2 and estimate_tokens(_join_parts(level)) > NOTE_CHUNK_THRESHOLD_TOKENS:
+        level = await asyncio.gather(
+            *(claude(NOTE_REDUCE_PROMPT, _join_parts(g)) for g in _group(level, NOTE_CHUNK_THRESHOLD_TOKENS))
         )
-    elif payload.operation == "update":
-        return update_feature_request(db, FeatureRequestUpdatePayload(**payload.payload))
-    elif payload.operation == "delete":
-        request_id = UUID(payload.payload.get("request_id"))
-        return delete_feature_request(db, request_id)
-    else:
-        raise HTTPException(status_code=400, detail="Invalid feature request operation")
+    summary = await claude(NOTE_REDUCE_PROMPT, _join_parts(level))
+    return summary, chunks
 
 
-# --- NOTE SERVICE BELOW ---
+async def enrich_long_note(full_note: str) -> Tuple[str, List[float], List[dict]]:
+    """(summary, summary embedding, chunks with passage embeddings) of a long note."""
+    summary, chunks = await summarize_long_note(full_note)
+    embeddings = await afetch_embeddings([summary] + [c["content"] for c in chunks])
+    for chunk, embedding in zip(chunks, embeddings[1:]):
+        chunk["embedding"] = embedding
+    return summary, embeddings[0], chunks
 
-def summarize_note(note_text: str) -> str:
-    """Summarizes notes using Claude Sonnet 4."""
-    system_prompt = "You are a helpful assistant that summarizes notes into several sentences."
-    return call_claude(system_prompt, note_text)
+
+async def enrich_note(note: CustomNote) -> None:
+    """Fill in the Claude summary and its embedding (and the chunks of a long note)."""
+    if is_long_note(note.full_note):
+        note.summary, note.embedding, chunks = await enrich_long_note(note.full_note)
+        note.chunks.add_all(NoteChunk(note_id=note.id, **chunk) for chunk in chunks)
+        return
+    note.summary = await summarize_note(json.dumps(note.full_note))
+    note.embedding = await afetch_embedding(note.summary)
 
 
-def add_note(
-    db: Session,
+async def add_note(
+    db: AsyncSession,
     customer_id: UUID,
     author: str,
     category: str,
@@ -148,23 +124,80 @@ def add_note(
     note_id = uuid4()
     timestamp = timestamp or datetime.utcnow()
 
-    full_note_json = json.dumps(full_note)
-    summary = summarize_note(full_note_json)
-    embedding = fetch_embedding(summary)
-
     note = CustomNote(
         id=note_id,
         customer_id=customer_id,
         author=author,
         timestamp=timestamp,
         category=category,
-        summary=summary,
         full_note=full_note,
         tags=tags,
         source=source,
-        embedding=embedding,
     )
 
+    if queue_enabled():
+        note.enrichment_status = "pending"
+        db.add(note)
+        job_id = enqueue_enrichment(db, "note", note_id)
+        await db.commit()
+        return EnrichmentQueuedStatus(status="accepted", entity="note", id=str(note_id), job_id=str(job_id))
+
+    await enrich_note(note)
     db.add(note)
-    db.commit()
-    return OperationStatus(status="created", entity="note", id=str(note_id))
\ No newline at end of file
+    await db.commit()
+    return OperationStatus(status="created", entity="note", id=str(note_id))
+
+
+async def query_notes(db: AsyncSession, payload: StructuredQuery) -> tuple:
+    """Structured note query, newest first by default."""
+    return await execute_structured_query(db, CustomNote, payload, default_order=[("timestamp", "desc")])
+
+
+async def search_notes(db: AsyncSession, payload: SemanticSearchRequest) -> list:
+    """Filtered semantic search over notes by summary embedding."""
+    embedding = await afetch_embedding(payload.query)
+    return await semantic_search(db, CustomNote, CustomNote.embedding, embedding, payload)
+
+
+async def search_note_passages(db: AsyncSession, payload: SemanticSearchRequest) -> list:
+    """
+    Passages of long notes closest to the query; `customer_id` and `where`
+    filter on the parent note. Short notes have no chunks, see search_notes.
+    """
+    embedding = await afetch_embedding(payload.query)
+    distance = NoteChunk.embedding.op(vector_index.distance_operator(), return_type=Float)(
+        bindparam("query_vector", embedding, type_=Vector(1024))
+    ).label("distance")
+    filters = [NoteChunk.embedding.is_not(None)]
+    if payload.customer_id:
+        filters.append(CustomNote.customer_id == payload.customer_id)
+    if payload.where is not None:
+        filters.append(compile_where(CustomNote, payload.where))
+
+    await vector_index.apply_iterative_scan(db)
+    await vector_index.apply_search_params(
+        db, ef_search=payload.ef_search or max(ANN_EF_SEARCH, payload.top_k), probes=payload.probes
+    )
+    rows = (await db.execute(
+        select(NoteChunk, CustomNote.customer_id, CustomNote.author, CustomNote.timestamp, distance)
+        .join(CustomNote, CustomNote.id == NoteChunk.note_id)
+        .where(*filters)
+        .order_by(distance)
+        .limit(payload.top_k)
+    )).all()
+    return [
+        {
+            "note_id": str(chunk.note_id),
+            "customer_id": str(customer_id) if customer_id else None,
+            "author": author,
+            "timestamp": timestamp,
+            "chunk_index": chunk.chunk_index,
+            "start_char": chunk.start_char,
+            "end_char": chunk.end_char,
+            "passage": chunk.content,
+            "passage_summary": chunk.summary,
+            "distance": dist,
+            "score": round(vector_index.similarity(dist), 6),
+        }
+        for chunk, customer_id, author, timestamp, dist in rows
+    ]
@@ -1,19 +1,30 @@
 from datetime import datetime
 from uuid import UUID, uuid4
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from models import Task
-from utils.bedrock_wrapper import call_claude, fetch_embedding
+from services.enrichment_queue import enqueue_enrichment, queue_enabled
+from utils.bedrock_wrapper import acall_claude, afetch_embedding
+from utils.search import execute_structured_query, semantic_search
+from schemas import SemanticSearchRequest, StructuredQuery
 
 
-def summarize_task(title: str) -> str:
-    system_prompt = "You are a task assistant helping summarize tasks."
-    return call_claude(system_prompt, title)
+TASK_SUMMARY_PROMPT = "You are a task assistant helping summarize tasks."
 
 
-def add_task(
-    db: Session,
+async def summarize_task(title: str) -> str:
+    return await acall_claude(TASK_SUMMARY_PROMPT, title, cache=True)
+
+
+async def enrich_task(task: Task) -> None:
+    """Fill in the Claude summary and its embedding."""
+    task.summary = await summarize_task(task.title)
+    task.embedding = await afetch_embedding(task.summary)
+
+
+async def add_task(
+    db: AsyncSession,
     customer_id: UUID,
     title: str,
     due_date: datetime,
@@ -21,9 +32,6 @@ def add_task(
     assigned_to: str,
 ):
     task_id = uuid4()
-    summary = summarize_task(title)
-    embedding = fetch_embedding(summary)
-
     task = Task(
         id=task_id,
         customer_id=customer_id,
@@ -31,10 +39,27 @@ def add_task(
         due_date=due_date,
         status=status,
         assigned_to=assigned_to,
-        summary=summary,
-        embedding=embedding,
     )
 
+    if queue_enabled():
+        task.enrichment_status = "pending"
+        db.add(task)
+        job_id = enqueue_enrichment(db, "task", task_id)
+        await db.commit()
+        return {"status": "task accepted", "task_id": str(task_id), "job_id": str(job_id)}
+
+    await enrich_task(task)
     db.add(task)
-    db.commit()
+    await db.commit()
     return {"status": "task created", "task_id": str(task_id)}
+
+
+async def query_tasks(db: AsyncSession, payload: StructuredQuery) -> tuple:
+    """Structured task query, earliest due date first by default."""
+    return await execute_structured_query(db, Task, payload, default_order=[("due_date", "asc")])
+
+
+async def search_tasks(db: AsyncSession, payload: SemanticSearchRequest) -> list:
+    """Filtered semantic search over tasks by summary embedding."""
+    embedding = await afetch_embedding(payload.query)
+    return await semantic_search(db, Task, Task.embedding, embedding, payload)
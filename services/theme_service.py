@@ -0,0 +1,247 @@
+"""
+Feature request themes: cluster every request embedding and label each cluster once.
+
+    python -m services.theme_service --clusters 30
+
+Embeddings are streamed out of Postgres with a binary COPY and decoded straight
+into a float32 matrix, clustered with spherical mini-batch k-means (cosine
+similarity on unit vectors), and each cluster gets a single Claude call built
+from the requests closest to its centroid.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import engine
+from models import FeatureRequest, FeatureRequestTheme
+from utils.bedrock_wrapper import acall_claude
+from utils.vector_copy import NULL_UUID, copy_embeddings, to_uuids
+
+load_dotenv(override=True)
+
+THEME_CLUSTERS = int(os.getenv("THEME_CLUSTERS", "20"))
+THEME_BATCH_SIZE = int(os.getenv("THEME_BATCH_SIZE", "1024"))       # k-means mini-batch
+THEME_ITERATIONS = int(os.getenv("THEME_ITERATIONS", "100"))
+THEME_EXAMPLES = int(os.getenv("THEME_EXAMPLES", "5"))              # requests shown to Claude per theme
+THEME_LABEL_CONCURRENCY = int(os.getenv("THEME_LABEL_CONCURRENCY", "8"))
+
+# --- Loading ---
+
+def load_embeddings() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(ids, customer_ids, unit-normalized float32 matrix) of every embedded feature request."""
+    return copy_embeddings("feature_request")
+
+
+def load_examples(ids: list) -> dict:
+    """id -> {id, title, summary} of the given feature requests."""
+    with engine.connect() as conn:
+        return {
+            row.id: {"id": str(row.id), "title": row.request_title, "summary": row.summary}
+            for row in conn.execute(select(FeatureRequest.id, FeatureRequest.request_title, FeatureRequest.summary)
+                                    .where(FeatureRequest.id.in_(ids)))
+        }
+
+
+# --- Clustering ---
+
+def _kmeans_plus_plus(sample: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = [sample[rng.integers(len(sample))]]
+    closest = 1 - sample @ centroids[0]
+    for _ in range(1, k):
+        weights = np.clip(closest, 0, None) ** 2
+        total = weights.sum()
+        index = rng.choice(len(sample), p=weights / total) if total > 0 else rng.integers(len(sample))
+        centroids.append(sample[index])
+        closest = np.minimum(closest, 1 - sample @ sample[index])
+    return np.array(centroids, dtype=np.float32)
+
+
+def assign(matrix: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """Nearest centroid by cosine similarity: (labels, similarities)."""
+    labels = np.empty(len(matrix), dtype=np.int32)
+    similarity = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), chunk):
+        scores = matrix[start:start + chunk] @ centroids.T
+        labels[start:start + chunk] = scores.argmax(axis=1)
+        similarity[start:start + chunk] = scores[np.arange(len(scores)), labels[start:start + chunk]]
+    return labels, similarity
+
+
+def minibatch_kmeans(
+    matrix: np.ndarray,
+    k: int,
+    batch_size: int = THEME_BATCH_SIZE,
+    iterations: int = THEME_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Spherical mini-batch k-means (Sculley 2010) on unit vectors.
+
+    Each centroid moves towards its batch members with a per-centroid learning
+    rate of 1 / (points seen), then is re-normalized.
+    """
+    rng = np.random.default_rng(seed)
+    sample = matrix[rng.choice(len(matrix), size=min(len(matrix), max(50 * k, 10000)), replace=False)]
+    centroids = _kmeans_plus_plus(sample, k, rng)
+    seen = np.zeros(k, dtype=np.float64)
+    for _ in range(iterations):
+        batch = matrix[rng.integers(0, len(matrix), size=min(batch_size, len(matrix)))]
+        labels = (batch @ centroids.T).argmax(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        members = np.zeros((len(batch), k), dtype=np.float32)
+        members[np.arange(len(batch)), labels] = 1
+        sums = members.T @ batch
+        seen += counts
+        moved = counts > 0
+        rate = (1 / seen[moved])[:, None].astype(np.float32)
+        centroids[moved] += rate * (sums[moved] - counts[moved, None] * centroids[moved])
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+    return centroids
+
+
+# --- Labeling ---
+
+LABEL_PROMPT = """
+You name themes in software feature requests. You get several requests from different
+customers that were grouped together.
+
+Return only a JSON object in this format:
+{
+  "title": "<theme name, 8 words or fewer>",
+  "summary": "<one or two sentences on the need the requests share>"
+}
+"""
+
+
+async def label_theme(examples: List[dict]) -> Tuple[Optional[str], Optional[str]]:
+    """One Claude call per theme; falls back to the closest request's title."""
+    listing = "\n".join(f"- {e['title'] or ''}: {e['summary'] or ''}" for e in examples)
+    try:
+        raw = (await acall_claude(LABEL_PROMPT, listing)).strip()
+        if raw.startswith("```"):
+            raw = raw.strip("`").strip("json").strip()
+        parsed = json.loads(raw)
+        return parsed["title"], parsed["summary"]
+    except Exception as e:
+        logging.warning(f"Theme labeling failed: {str(e)}")
+        return (examples[0]["title"] if examples else None), None
+
+
+# --- Run ---
+
+def _store(run_id: uuid.UUID, themes: List[dict], ids: np.ndarray, theme_ids: List[uuid.UUID],
+           similarity: np.ndarray) -> None:
+    with engine.begin() as conn:
+        # members of the previous run go with their themes (ON DELETE CASCADE)
+        conn.execute(text("DELETE FROM feature_request_theme WHERE run_id <> :run_id"), {"run_id": run_id})
+        conn.execute(insert(FeatureRequestTheme), themes)
+        conn.execute(text("""
+            INSERT INTO feature_request_theme_member (feature_request_id, theme_id, similarity)
+            SELECT * FROM unnest(CAST(:ids AS uuid[]), CAST(:themes AS uuid[]), CAST(:similarity AS float8[]))
+            ON CONFLICT (feature_request_id) DO UPDATE
+            SET theme_id = excluded.theme_id, similarity = excluded.similarity
+        """), {
+            "ids": [str(i) for i in to_uuids(ids)],
+            "themes": [str(t) for t in theme_ids],
+            "similarity": similarity.astype(float).tolist(),
+        })
+
+
+async def build_themes(clusters: int = THEME_CLUSTERS, seed: int = 0) -> dict:
+    """Recluster all feature requests and replace the stored themes."""
+    timings = {}
+    started = time.perf_counter()
+    ids, customers, matrix = await asyncio.to_thread(load_embeddings)
+    timings["load_s"] = round(time.perf_counter() - started, 3)
+    if len(matrix) < 2:
+        raise HTTPException(status_code=400, detail="Need at least two embedded feature requests.")
+    k = min(clusters, len(matrix))
+
+    step = time.perf_counter()
+    centroids = await asyncio.to_thread(minibatch_kmeans, matrix, k, seed=seed)
+    labels, similarity = await asyncio.to_thread(assign, matrix, centroids)
+    timings["cluster_s"] = round(time.perf_counter() - step, 3)
+
+    step = time.perf_counter()
+    clusters_found = [c for c in range(k) if (labels == c).any()]
+    closest = {}
+    for c in clusters_found:
+        members = np.flatnonzero(labels == c)
+        closest[c] = members[np.argsort(-similarity[members])[:THEME_EXAMPLES]]
+    example_ids = to_uuids(ids[np.concatenate(list(closest.values()))])
+    details = await asyncio.to_thread(load_examples, example_ids)
+    examples = {c: [details[i] for i in to_uuids(ids[closest[c]]) if i in details] for c in clusters_found}
+
+    semaphore = asyncio.Semaphore(THEME_LABEL_CONCURRENCY)
+
+    async def label(c: int):
+        async with semaphore:
+            return await label_theme(examples[c])
+
+    names = await asyncio.gather(*(label(c) for c in clusters_found))
+    timings["label_s"] = round(time.perf_counter() - step, 3)
+
+    step = time.perf_counter()
+    run_id = uuid.uuid4()
+    theme_uuid = {c: uuid.uuid4() for c in clusters_found}
+    themes = []
+    for c, (title, description) in zip(clusters_found, names):
+        members = labels == c
+        themes.append({
+            "id": theme_uuid[c],
+            "run_id": run_id,
+            "label": title,
+            "description": description,
+            "size": int(members.sum()),
+            "customer_count": len({bytes(v) for v in customers[members]} - {uuid.UUID(NULL_UUID).bytes}),
+            "cohesion": float(similarity[members].mean()),
+            "centroid": centroids[c].tolist(),
+            "examples": [{"id": e["id"], "title": e["title"]} for e in examples[c]],
+        })
+    await asyncio.to_thread(_store, run_id, themes, ids, [theme_uuid[c] for c in labels], similarity)
+    timings["store_s"] = round(time.perf_counter() - step, 3)
+    timings["total_s"] = round(time.perf_counter() - started, 3)
+
+    return {"run_id": str(run_id), "requests": int(len(matrix)), "themes": len(themes), "timings": timings}
+
+
+async def list_themes(db: AsyncSession, limit: int = 20) -> List[dict]:
+    """Themes of the latest run, most widely requested first."""
+    result = await db.execute(
+        select(FeatureRequestTheme)
+        .order_by(FeatureRequestTheme.customer_count.desc(), FeatureRequestTheme.size.desc())
+        .limit(limit)
+    )
+    return [
+        {
+            "id": str(t.id),
+            "label": t.label,
+            "description": t.description,
+            "customer_count": t.customer_count,
+            "size": t.size,
+            "cohesion": round(t.cohesion, 4) if t.cohesion is not None else None,
+            "examples": t.examples,
+            "created_at": t.created_at,
+        }
+        for t in result.scalars().all()
+    ]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clusters", type=int, default=THEME_CLUSTERS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(build_themes(args.clusters, args.seed)), indent=2))
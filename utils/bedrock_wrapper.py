@@ -1,95 +1,222 @@
-import json
-import logging
+import asyncio
+import contextvars
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
 from dotenv import load_dotenv
 from fastapi import HTTPException
 
+from utils import embedding_cache, llm_providers, metrics, summary_cache
+from utils.resilience import DeadlineExceeded, ModelGuard, ModelUnavailable, remaining
+
 load_dotenv(override=True)
 
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_REGION = os.getenv("AWS_REGION")
+EMBEDDING_CONCURRENCY = int(os.getenv("BEDROCK_EMBEDDING_CONCURRENCY", "8"))
+# Max Bedrock calls in flight from the async request path; further calls queue.
+ASYNC_CONCURRENCY = int(os.getenv("BEDROCK_ASYNC_CONCURRENCY", "64"))
+
+# Resilience (utils/resilience.py). A rate of 0 only limits after Bedrock throttles.
+CLAUDE_RPS = float(os.getenv("BEDROCK_CLAUDE_RPS", "0"))
+EMBEDDING_RPS = float(os.getenv("BEDROCK_EMBEDDING_RPS", "0"))
+CLAUDE_MAX_IN_FLIGHT = int(os.getenv("BEDROCK_CLAUDE_MAX_IN_FLIGHT", "32"))
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("BEDROCK_EMBEDDING_MAX_IN_FLIGHT", "64"))
+MAX_ATTEMPTS = int(os.getenv("BEDROCK_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE_SECONDS = float(os.getenv("BEDROCK_BACKOFF_BASE_SECONDS", "0.2"))
+BACKOFF_CAP_SECONDS = float(os.getenv("BEDROCK_BACKOFF_CAP_SECONDS", "10"))
+BREAKER_FAILURES = int(os.getenv("BEDROCK_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BEDROCK_BREAKER_RESET_SECONDS", "30"))
+
+# Chosen by LLM_PROVIDER; see utils/llm_providers.py.
+provider = llm_providers.create_provider(max_pool_connections=ASYNC_CONCURRENCY + EMBEDDING_CONCURRENCY)
+
+
+def _guard(name: str, rate: float, max_in_flight: int) -> ModelGuard:
+    return ModelGuard(
+        name,
+        rate=rate,
+        max_in_flight=max_in_flight,
+        max_attempts=MAX_ATTEMPTS,
+        backoff_base=BACKOFF_BASE_SECONDS,
+        backoff_cap=BACKOFF_CAP_SECONDS,
+        failure_threshold=BREAKER_FAILURES,
+        reset_seconds=BREAKER_RESET_SECONDS,
+    )
+
+
+guards = {
+    "claude": _guard("claude", CLAUDE_RPS, CLAUDE_MAX_IN_FLIGHT),
+    "embedding": _guard("embedding", EMBEDDING_RPS, EMBEDDING_MAX_IN_FLIGHT),
+}
+
+
+def get_stats() -> dict:
+    return {"provider": provider.name, "models": {name: guard.get_stats() for name, guard in guards.items()}}
+
+
+GUARD_EVENTS = ("calls", "successes", "failures", "throttles", "retries", "rejected", "deadline_exceeded")
+metrics.callback(
+    "kc_model_guard_events_total", "Model call outcomes seen by the resilience layer.", ("model", "event"),
+    lambda: {(name, event): g.stats[event] for name, g in guards.items() for event in GUARD_EVENTS},
+    kind="counter",
+)
+metrics.callback("kc_model_in_flight", "Model calls currently running.", ("model",),
+                 lambda: {(name,): g.in_flight for name, g in guards.items()})
+metrics.callback("kc_model_rate_limit", "Current client-side rate limit (requests/s); absent when unlimited.",
+                 ("model",), lambda: {(name,): g.bucket.rate for name, g in guards.items()})
+metrics.callback("kc_model_breaker_open", "1 while the circuit breaker rejects calls.", ("model",),
+                 lambda: {(name,): int(g.breaker.state == "open") for name, g in guards.items()})
 
-MODEL_ID = os.getenv("BEDROCK_MODEL_ID")  # ✅ fix
-INFERENCE_ARN = os.getenv("BEDROCK_INFERENCE_CONFIG_ARN")  # ✅ fix
 
-bedrock_client = boto3.client(
-    service_name="bedrock-runtime",
-    region_name=AWS_REGION,
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-)
+# --- Claude Generation ---
+def call_claude(system_prompt: str, user_input: str, cache: bool = False,
+                max_tokens: int = llm_providers.DEFAULT_MAX_TOKENS, batched: bool = False) -> str:
+    """
+    Generate with Claude. With cache=True the output is served from the summary
+    cache when this prompt, model and input were seen before. `batched` marks a
+    JSON-array batch request, see LLMProvider.generate.
+    """
+    if cache:
+        cached = summary_cache.lookup(system_prompt, provider.generation_model_id, user_input)
+        if cached is not None:
+            return cached
+    with metrics.stage("llm"):
+        output = guards["claude"].call(provider.generate, system_prompt, user_input, max_tokens, batched)
+    if cache:
+        summary_cache.store(system_prompt, provider.generation_model_id, user_input, output)
+    return output
 
 
-# --- Claude Generation via signed HTTP request ---
-def call_claude(system_prompt: str, user_input: str) -> str:
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 1000,
-        "temperature": 0.7,
-        "system": system_prompt,  # ✅ Top-level key
-        "messages": [
-            {"role": "user", "content": [{"type": "text", "text": user_input}]}
-        ],
-    }
+def forget_claude_output(system_prompt: str, user_input: str) -> None:
+    """Drop a cached output the caller could not use, so the next call asks Claude again."""
+    summary_cache.invalidate(system_prompt, provider.generation_model_id, user_input)
 
-    try:
-        response = bedrock_client.invoke_model(
-            modelId=MODEL_ID,
-            body=json.dumps(body),
-            contentType="application/json",
-            accept="application/json",
-        )
 
-        raw = response["body"].read().decode()
-        parsed = json.loads(raw)
-        return parsed["content"][0]["text"].strip()
+# --- Embeddings ---
+def _embed(text: str) -> list[float]:
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Input text is empty.")
+    with metrics.stage("embedding"):
+        return guards["embedding"].call(provider.embed, text)
+
+
+def fetch_embedding(text: str) -> list[float]:
+    """
+    Fetch embedding for a single text, served from the embedding cache when possible.
+    """
+    cached = embedding_cache.lookup(provider.embedding_model_id, [text])
+    if text in cached:
+        return cached[text]
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Claude request failed: {str(e)}")
+    embedding = _embed(text)
+    embedding_cache.store(provider.embedding_model_id, {text: embedding})
+    return embedding
 
 
-# --- Titan Embedding ---
-bedrock_client = boto3.client(
-    service_name="bedrock-runtime",
-    region_name=AWS_REGION,
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+# --- Batched Embeddings ---
+_embedding_executor = ThreadPoolExecutor(
+    max_workers=EMBEDDING_CONCURRENCY, thread_name_prefix="embed"
 )
 
 
-def fetch_embedding(text: str) -> list[float]:
+class EmbeddingBatchError(HTTPException):
+    """
+    Raised by fetch_embeddings when one or more inputs could not be embedded.
+
+    `errors` and `embeddings` are keyed by input position; `embeddings` holds
+    every input that did succeed, so callers never have to embed them again.
     """
-    Fetch embedding using Amazon Titan model.
+
+    def __init__(self, errors: dict[int, str], total: int, status_code: int = 500, headers: dict = None,
+                 embeddings: dict[int, list[float]] = None):
+        self.errors = errors
+        self.embeddings = embeddings or {}
+        summary = "; ".join(f"[{i}] {msg}" for i, msg in sorted(errors.items()))
+        super().__init__(
+            status_code=status_code,
+            detail=f"Embedding generation failed for {len(errors)} of {total} inputs: {summary}",
+            headers=headers,
+        )
+
+
+def fetch_embeddings(texts: list[str]) -> list[list[float]]:
     """
-    if not text.strip():
-        raise HTTPException(status_code=400, detail="Input text is empty.")
+    Fetch embeddings for several texts concurrently.
 
+    Results are returned in input order. Cached texts are served from the
+    embedding cache and duplicate texts are embedded once.
+    If any input fails, EmbeddingBatchError is raised with the per-item errors
+    and the embeddings that did succeed, both keyed by input position.
+    """
+    if not texts:
+        return []
+
+    embeddings = embedding_cache.lookup(provider.embedding_model_id, texts)
+    missing = [t for t in dict.fromkeys(texts) if t not in embeddings]
+    if len(missing) == 1:
+        futures = None
+    else:
+        # each task runs in its own copy of the caller's context so the request deadline applies
+        futures = {t: _embedding_executor.submit(contextvars.copy_context().run, _embed, t) for t in missing}
+
+    computed: dict[str, list[float]] = {}
+    failures: dict[str, str] = {}
+    unavailable: list[ModelUnavailable] = []
+    for text in missing:
+        try:
+            if futures is None:
+                computed[text] = _embed(text)
+            else:
+                computed[text] = futures[text].result()
+        except HTTPException as e:
+            failures[text] = e.detail
+            if isinstance(e, ModelUnavailable):
+                unavailable.append(e)
+        except Exception as e:
+            failures[text] = str(e)
+
+    embedding_cache.store(provider.embedding_model_id, computed)
+    embeddings.update(computed)
+
+    if failures:
+        errors = {i: failures[t] for i, t in enumerate(texts) if t in failures}
+        done = {i: embeddings[t] for i, t in enumerate(texts) if t not in failures}
+        if len(unavailable) == len(failures):
+            # only throttling / open breaker: tell the client when to come back
+            raise EmbeddingBatchError(errors, len(texts), status_code=503, headers=unavailable[0].headers,
+                                      embeddings=done)
+        raise EmbeddingBatchError(errors, len(texts), embeddings=done)
+
+    return [embeddings[t] for t in texts]
+
+
+# --- Async API ---
+# Provider calls are blocking, so async callers run them on a dedicated bounded executor
+# instead of the event loop or Starlette's shared threadpool.
+_async_executor = ThreadPoolExecutor(max_workers=ASYNC_CONCURRENCY, thread_name_prefix="llm-async")
+
+
+async def _run_blocking(fn, *args):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(_async_executor, context.run, fn, *args)
+    left = remaining()
+    if left is None:
+        return await future
+    # the guard only bounds its own waits; this bounds the model call itself
     try:
-        payload = {"inputText": text}
-        response = bedrock_client.invoke_model(
-            modelId="amazon.titan-embed-text-v2:0",
-            body=json.dumps(payload),
-            contentType="application/json",
-            accept="application/json",
-        )
-        body = response["body"].read().decode()
-        logging.info(f"Bedrock response body: {body}")
-        result = json.loads(body)
-
-        embedding = result.get("embedding")
-        if not embedding or not isinstance(embedding, list):
-            logging.error(f"Invalid embedding structure: {result}")
-            raise HTTPException(
-                status_code=500, detail="Embedding response invalid or missing."
-            )
-
-        return embedding
-
-    except Exception as e:
-        logging.error(f"Embedding generation failed: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail=f"Embedding generation failed: {str(e)}"
-        )
+        return await asyncio.wait_for(future, max(0.0, left))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request deadline exceeded while waiting for the model.") from None
+
+
+async def acall_claude(system_prompt: str, user_input: str, cache: bool = False,
+                       max_tokens: int = llm_providers.DEFAULT_MAX_TOKENS, batched: bool = False) -> str:
+    return await _run_blocking(call_claude, system_prompt, user_input, cache, max_tokens, batched)
+
+
+async def afetch_embedding(text: str) -> list[float]:
+    return await _run_blocking(fetch_embedding, text)
+
+
+async def afetch_embeddings(texts: list[str]) -> list[list[float]]:
+    return await _run_blocking(fetch_embeddings, texts)
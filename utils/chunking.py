@@ -0,0 +1,49 @@
+import re
+from typing import List, Tuple
+
+from utils.llm_providers import estimate_tokens
+
+CHARS_PER_TOKEN = 4  # same estimate as llm_providers.estimate_tokens
+
+# Preferred places to end a chunk, best first: paragraph, line, sentence, word.
+_BREAKS = [re.compile(r"\n\s*\n"), re.compile(r"\n"), re.compile(r"[.!?][\"')\]]?\s"), re.compile(r"\s")]
+
+
+def _cut(text: str, start: int, limit: int) -> int:
+    """End of a chunk starting at `start`: the last good break in the second half of the window."""
+    if limit >= len(text):
+        return len(text)
+    floor = start + (limit - start) // 2
+    for pattern in _BREAKS:
+        ends = [m.end() for m in pattern.finditer(text, floor, limit)]
+        if ends:
+            return ends[-1]
+    return limit
+
+
+def split_text(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[Tuple[int, int, str]]:
+    """
+    Split text into (start, end, content) chunks of at most `max_tokens`
+    estimated tokens, ending at paragraph, sentence or word breaks where
+    possible. Consecutive chunks share about `overlap_tokens` of text, so a
+    passage cut at a boundary is still whole in one of them.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [(0, len(text), text)]
+    size = max_tokens * CHARS_PER_TOKEN
+    overlap = min(overlap_tokens * CHARS_PER_TOKEN, size // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = _cut(text, start, start + size)
+        chunks.append((start, end, text[start:end]))
+        if end >= len(text):
+            break
+        next_start = max(start + 1, end - overlap)
+        if overlap:
+            # begin the overlap at a word break so no chunk starts mid-word
+            space = text.find(" ", next_start, end)
+            if space != -1:
+                next_start = space + 1
+        start = next_start
+    return chunks
@@ -0,0 +1,233 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from database import engine
+from models import EmbeddingCache
+from utils import metrics
+
+load_dotenv(override=True)
+
+CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+CACHE_PERSISTENT = os.getenv("EMBEDDING_CACHE_PERSISTENT", "true").lower() == "true"
+CACHE_MAX_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+# Rows of the embedding_cache table unused for this long are deleted (0: keep forever).
+CACHE_DB_TTL_DAYS = float(os.getenv("EMBEDDING_CACHE_DB_TTL_DAYS", "30"))
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, trimmed, single-spaced."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model_id: str, text: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(model_id.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry time to live."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_memory = LRUCache(CACHE_MAX_SIZE, CACHE_TTL_SECONDS)
+_stats_lock = threading.Lock()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "db_errors": 0, "db_pruned": 0}
+_last_prune = 0.0
+
+
+def _count(name: str, amount: int = 1) -> None:
+    if amount:
+        with _stats_lock:
+            _stats[name] += amount
+
+
+def _last_used():
+    return func.coalesce(EmbeddingCache.last_used_at, EmbeddingCache.created_at)
+
+
+def _db_lookup(model_id: str, keys: List[str]) -> Dict[str, List[float]]:
+    try:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(EmbeddingCache.key, EmbeddingCache.embedding).where(
+                    EmbeddingCache.model_id == model_id,
+                    EmbeddingCache.key.in_(keys),
+                )
+            ).all()
+            if rows:
+                # touch hits at most once a day, so hot entries survive pruning without a write per lookup
+                conn.execute(
+                    update(EmbeddingCache)
+                    .where(EmbeddingCache.key.in_([row.key for row in rows]),
+                           _last_used() < func.now() - timedelta(days=1))
+                    .values(last_used_at=func.now())
+                )
+        return {row.key: [float(x) for x in row.embedding] for row in rows}
+    except Exception as e:
+        _count("db_errors")
+        logging.warning(f"Embedding cache lookup failed: {str(e)}")
+        return {}
+
+
+def prune() -> int:
+    """Delete table entries unused for CACHE_DB_TTL_DAYS; returns the number removed."""
+    if CACHE_DB_TTL_DAYS <= 0:
+        return 0
+    try:
+        with engine.begin() as conn:
+            removed = conn.execute(
+                delete(EmbeddingCache).where(_last_used() < func.now() - timedelta(days=CACHE_DB_TTL_DAYS))
+            ).rowcount
+    except Exception as e:
+        _count("db_errors")
+        logging.warning(f"Embedding cache pruning failed: {str(e)}")
+        return 0
+    _count("db_pruned", removed)
+    return removed
+
+
+def _maybe_prune() -> None:
+    """Prune in the background at most once per PRUNE_INTERVAL_SECONDS per process."""
+    global _last_prune
+    with _stats_lock:
+        now = time.monotonic()
+        if CACHE_DB_TTL_DAYS <= 0 or now - _last_prune < PRUNE_INTERVAL_SECONDS:
+            return
+        _last_prune = now
+    threading.Thread(target=prune, name="embedding-cache-prune", daemon=True).start()
+
+
+def _db_store(model_id: str, entries: Dict[str, List[float]]) -> None:
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                insert(EmbeddingCache)
+                .values([
+                    {"key": key, "model_id": model_id, "embedding": embedding}
+                    for key, embedding in entries.items()
+                ])
+                .on_conflict_do_nothing(index_elements=["key"])
+            )
+    except Exception as e:
+        _count("db_errors")
+        logging.warning(f"Embedding cache write failed: {str(e)}")
+    _maybe_prune()
+
+
+def lookup(model_id: str, texts: Iterable[str]) -> Dict[str, List[float]]:
+    """Return cached embeddings for the given texts, keyed by the original text."""
+    texts = list(dict.fromkeys(texts))
+    if not CACHE_ENABLED or not texts:
+        return {}
+
+    found: Dict[str, List[float]] = {}
+    pending: Dict[str, List[str]] = {}
+    for text in texts:
+        key = cache_key(model_id, text)
+        value = _memory.get(key)
+        if value is not None:
+            found[text] = value
+        else:
+            pending.setdefault(key, []).append(text)
+    _count("memory_hits", len(found))
+
+    if pending and CACHE_PERSISTENT:
+        stored = _db_lookup(model_id, list(pending))
+        for key, value in stored.items():
+            _memory.set(key, value)
+            for text in pending.pop(key):
+                found[text] = value
+                _count("db_hits")
+
+    _count("misses", sum(len(t) for t in pending.values()))
+    return found
+
+
+def store(model_id: str, embeddings: Dict[str, List[float]]) -> None:
+    """Write freshly computed embeddings (keyed by original text) to both layers."""
+    if not CACHE_ENABLED or not embeddings:
+        return
+
+    entries = {cache_key(model_id, text): value for text, value in embeddings.items()}
+    for key, value in entries.items():
+        _memory.set(key, value)
+    if CACHE_PERSISTENT:
+        _db_store(model_id, entries)
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    stats.update({
+        "enabled": CACHE_ENABLED,
+        "persistent": CACHE_PERSISTENT,
+        "memory_entries": len(_memory),
+        "memory_max_size": CACHE_MAX_SIZE,
+        "ttl_seconds": CACHE_TTL_SECONDS,
+        "db_ttl_days": CACHE_DB_TTL_DAYS,
+        "hit_rate": round((stats["memory_hits"] + stats["db_hits"]) / lookups, 4) if lookups else 0.0,
+    })
+    return stats
+
+
+metrics.callback(
+    "kc_embedding_cache_lookups_total", "Embedding cache lookups by result.", ("result",),
+    lambda: {(name,): _stats[name] for name in ("memory_hits", "db_hits", "misses")},
+    kind="counter",
+)
+metrics.callback("kc_embedding_cache_entries", "Entries in the in-process embedding cache.", (),
+                 lambda: {(): len(_memory)})
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from utils import metrics
+from utils.resilience import REQUEST_TIMEOUT_SECONDS
+
+load_dotenv(override=True)
+
+# bedrock: Claude + Titan on AWS Bedrock (default)
+# local:   deterministic offline backend for benchmarks and load tests
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "bedrock")
+
+AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
+AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+AWS_REGION = os.getenv("AWS_REGION")
+
+MODEL_ID = os.getenv("BEDROCK_MODEL_ID")  # ✅ fix
+INFERENCE_ARN = os.getenv("BEDROCK_INFERENCE_CONFIG_ARN")  # ✅ fix
+EMBEDDING_MODEL_ID = os.getenv("BEDROCK_EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v2:0")
+# Socket read timeout of a Bedrock call; at most the request deadline, so a hung call frees its thread.
+BEDROCK_READ_TIMEOUT_SECONDS = float(os.getenv("BEDROCK_READ_TIMEOUT_SECONDS", str(REQUEST_TIMEOUT_SECONDS or 60)))
+
+EMBEDDING_DIMENSIONS = 1024
+DEFAULT_MAX_TOKENS = 1000
+
+# Simulated model latency of the local provider, in milliseconds.
+# uniform: latency +/- jitter fraction; lognormal: median latency with sigma; fixed
+LOCAL_LLM_LATENCY_MS = float(os.getenv("LOCAL_LLM_LATENCY_MS", "0"))
+LOCAL_EMBEDDING_LATENCY_MS = float(os.getenv("LOCAL_EMBEDDING_LATENCY_MS", "0"))
+LOCAL_LATENCY_DISTRIBUTION = os.getenv("LOCAL_LATENCY_DISTRIBUTION", "uniform")
+LOCAL_LATENCY_JITTER = float(os.getenv("LOCAL_LATENCY_JITTER", "0.2"))
+LOCAL_LATENCY_SIGMA = float(os.getenv("LOCAL_LATENCY_SIGMA", "0.5"))
+LOCAL_SUMMARY_CHARS = int(os.getenv("LOCAL_SUMMARY_CHARS", "280"))
+# Extra local generation latency per output token, so long (batched) outputs cost time as on Bedrock.
+LOCAL_LLM_MS_PER_OUTPUT_TOKEN = float(os.getenv("LOCAL_LLM_MS_PER_OUTPUT_TOKEN", "0"))
+# Fraction of local provider calls failing with a simulated ThrottlingException.
+LOCAL_THROTTLE_RATE = float(os.getenv("LOCAL_THROTTLE_RATE", "0"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Claude token count (about four characters per token) for budgeting."""
+    return len(text) // 4 + 1
+
+
+class ThrottlingException(Exception):
+    """Simulated Bedrock throttling raised by the local provider (LOCAL_THROTTLE_RATE)."""
+
+
+class LLMProvider:
+    """Text generation and embeddings behind one interface."""
+
+    name = ""
+    generation_model_id = ""
+    embedding_model_id = ""
+
+    def generate(self, system_prompt: str, user_input: str, max_tokens: int = DEFAULT_MAX_TOKENS,
+                 batched: bool = False) -> str:
+        """
+        `batched` marks a batched summarization request (services/batch_summarizer.py):
+        user_input is a JSON array of {"id", "text"} items and the reply must be one too.
+        Bedrock needs no flag, the prompt says so; offline providers use it to shape the reply.
+        """
+        raise NotImplementedError
+
+    def embed(self, text: str) -> list[float]:
+        raise NotImplementedError
+
+
+class BedrockProvider(LLMProvider):
+    """Claude for generation and Titan for embeddings via bedrock-runtime."""
+
+    name = "bedrock"
+    generation_model_id = MODEL_ID or ""
+    embedding_model_id = EMBEDDING_MODEL_ID
+
+    def __init__(self, max_pool_connections: int = 10):
+        self.max_pool_connections = max_pool_connections
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # created on first use so importing the app does not need AWS configuration
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+
+                    self._client = boto3.client(
+                        service_name="bedrock-runtime",
+                        region_name=AWS_REGION,
+                        aws_access_key_id=AWS_ACCESS_KEY_ID,
+                        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                        # boto3 defaults to 10 pooled connections, which would cap concurrency below the executors;
+                        # retries are done by utils.resilience, so botocore makes a single attempt
+                        config=Config(
+                            max_pool_connections=self.max_pool_connections,
+                            retries={"total_max_attempts": 1, "mode": "standard"},
+                            read_timeout=BEDROCK_READ_TIMEOUT_SECONDS,
+                        ),
+                    )
+        return self._client
+
+    def generate(self, system_prompt: str, user_input: str, max_tokens: int = DEFAULT_MAX_TOKENS,
+                 batched: bool = False) -> str:
+        body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "system": system_prompt,  # ✅ Top-level key
+            "messages": [
+                {"role": "user", "content": [{"type": "text", "text": user_input}]}
+            ],
+        }
+
+        try:
+            response = self.client.invoke_model(
+                modelId=MODEL_ID,
+                body=json.dumps(body),
+                contentType="application/json",
+                accept="application/json",
+            )
+
+            raw = response["body"].read().decode()
+            parsed = json.loads(raw)
+            usage = parsed.get("usage") or {}
+            metrics.MODEL_TOKENS.inc(usage.get("input_tokens", 0), MODEL_ID, "input")
+            metrics.MODEL_TOKENS.inc(usage.get("output_tokens", 0), MODEL_ID, "output")
+            return parsed["content"][0]["text"].strip()
+
+        except Exception as e:
+            # chained so the resilience layer can tell throttling from bad input
+            raise HTTPException(status_code=500, detail=f"Claude request failed: {str(e)}") from e
+
+    def embed(self, text: str) -> list[float]:
+        try:
+            payload = {"inputText": text}
+            response = self.client.invoke_model(
+                modelId=self.embedding_model_id,
+                body=json.dumps(payload),
+                contentType="application/json",
+                accept="application/json",
+            )
+            result = json.loads(response["body"].read())
+            metrics.MODEL_TOKENS.inc(result.get("inputTextTokenCount", 0), self.embedding_model_id, "input")
+
+            embedding = result.get("embedding")
+            if not embedding or not isinstance(embedding, list):
+                logging.error(f"Invalid embedding structure, keys: {sorted(result)}")
+                raise HTTPException(
+                    status_code=500, detail="Embedding response invalid or missing."
+                )
+
+            return embedding
+
+        except Exception as e:
+            logging.error(f"Embedding generation failed: {str(e)}")
+            raise HTTPException(
+                status_code=500, detail=f"Embedding generation failed: {str(e)}"
+            ) from e
+
+
+class LocalProvider(LLMProvider):
+    """
+    Offline stand-in for Bedrock.
+
+    Embeddings are signed feature hashes of words and character trigrams, so
+    they are deterministic, unit-normalized and texts sharing words land close
+    together. Generation returns the input truncated into a template, or a
+    title/summary JSON object when the prompt asks for one.
+    """
+
+    name = "local"
+    generation_model_id = "local-template-v1"
+    embedding_model_id = "local-hash-v1"
+
+    def __init__(
+        self,
+        llm_latency_ms: float = LOCAL_LLM_LATENCY_MS,
+        embedding_latency_ms: float = LOCAL_EMBEDDING_LATENCY_MS,
+        distribution: str = LOCAL_LATENCY_DISTRIBUTION,
+        jitter: float = LOCAL_LATENCY_JITTER,
+        sigma: float = LOCAL_LATENCY_SIGMA,
+        throttle_rate: float = LOCAL_THROTTLE_RATE,
+    ):
+        if distribution not in ("uniform", "lognormal", "fixed"):
+            raise ValueError(f"Unknown LOCAL_LATENCY_DISTRIBUTION '{distribution}'")
+        self.llm_latency_ms = llm_latency_ms
+        self.embedding_latency_ms = embedding_latency_ms
+        self.distribution = distribution
+        self.jitter = jitter
+        self.sigma = sigma
+        self.throttle_rate = throttle_rate
+
+    def _sleep(self, latency_ms: float) -> None:
+        if self.throttle_rate and random.random() < self.throttle_rate:
+            raise ThrottlingException("Too many requests, please wait before trying again.")
+        if latency_ms <= 0:
+            return
+        if self.distribution == "lognormal":
+            # long right tail, like real model latency; latency_ms is the median
+            latency_ms *= random.lognormvariate(0, self.sigma)
+        elif self.distribution == "uniform":
+            latency_ms *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(latency_ms / 1000)
+
+    @staticmethod
+    def _features(text: str) -> list[str]:
+        words = re.findall(r"\w+", text.lower())
+        padded = f" {' '.join(words)} "
+        return words + [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    def embed(self, text: str) -> list[float]:
+        self._sleep(self.embedding_latency_ms)
+        vector = [0.0] * EMBEDDING_DIMENSIONS
+        for feature in self._features(text) or [text]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+            vector[h % EMBEDDING_DIMENSIONS] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _summarize(self, system_prompt: str, text: str):
+        text = " ".join(text.split())
+        summary = text[:LOCAL_SUMMARY_CHARS]
+        if '"title"' in system_prompt and '"summary"' in system_prompt:
+            return {"title": text[:80], "summary": summary}
+        return f"Summary: {summary}"
+
+    def generate(self, system_prompt: str, user_input: str, max_tokens: int = DEFAULT_MAX_TOKENS,
+                 batched: bool = False) -> str:
+        if batched:
+            # one result per input item
+            results = []
+            for item in json.loads(user_input):
+                result = self._summarize(system_prompt, item["text"])
+                results.append({"id": item["id"], **(result if isinstance(result, dict) else {"summary": result})})
+            output = json.dumps(results)
+        else:
+            result = self._summarize(system_prompt, user_input)
+            output = json.dumps(result) if isinstance(result, dict) else result
+        output_tokens = estimate_tokens(output)
+        self._sleep(self.llm_latency_ms + output_tokens * LOCAL_LLM_MS_PER_OUTPUT_TOKEN)
+        metrics.MODEL_TOKENS.inc(estimate_tokens(system_prompt) + estimate_tokens(user_input),
+                                 self.generation_model_id, "input")
+        metrics.MODEL_TOKENS.inc(output_tokens, self.generation_model_id, "output")
+        return output
+
+
+def create_provider(name: str = LLM_PROVIDER, max_pool_connections: int = 10) -> LLMProvider:
+    if name == "bedrock":
+        return BedrockProvider(max_pool_connections=max_pool_connections)
+    if name == "local":
+        return LocalProvider()
+    raise ValueError(f"Unknown LLM_PROVIDER '{name}', expected 'bedrock' or 'local'")
@@ -0,0 +1,318 @@
+"""
+Prometheus metrics and optional OpenTelemetry spans.
+
+    with metrics.stage("embedding"):
+        ...
+
+Each stage lands in kc_stage_duration_seconds{route, stage} and in the
+request's Server-Timing header, and becomes a span when TRACING_ENABLED and
+opentelemetry-api is installed. With METRICS_ENABLED=false stage() returns a
+shared no-op context manager, and no middleware or DB hooks are installed.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse
+
+load_dotenv(override=True)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+
+try:
+    from opentelemetry import trace
+except ImportError:  # optional dependency
+    trace = None
+
+_tracer = trace.get_tracer("knowledge-companion") if (TRACING_ENABLED and trace is not None) else None
+if TRACING_ENABLED and trace is None:
+    logging.warning("TRACING_ENABLED is set but opentelemetry-api is not installed; spans are disabled")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_NOOP = nullcontext()
+
+
+# --- Metric types ---
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, *labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = self._header()
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Callback(_Metric):
+    """Gauge or counter read at scrape time: fn() returns {label values tuple: value}."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], fn: Callable[[], dict],
+                 kind: str = "gauge"):
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            values = self.fn()
+        except Exception as e:
+            logging.warning(f"Metric {self.name} collection failed: {str(e)}")
+            return []
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in values.items() if v is not None
+        ]
+
+
+_registry: List[_Metric] = []
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Core metrics ---
+
+REQUEST_DURATION = Histogram(
+    "kc_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status")
+)
+STAGE_DURATION = Histogram(
+    "kc_stage_duration_seconds", "Time spent per stage (llm, embedding, db, serialization, ...).", ("route", "stage")
+)
+DB_QUERY_DURATION = Histogram(
+    "kc_db_query_duration_seconds", "Database statement latency by engine and statement type.",
+    ("engine", "operation"),
+)
+MODEL_TOKENS = Counter("kc_model_tokens_total", "Tokens reported by the model provider.", ("model", "direction"))
+
+
+# --- Request context ---
+# The current request's ASGI scope (for its route, resolved after routing) and
+# per-stage totals for the Server-Timing header. Copied onto executor threads
+# along with the deadline, see utils.bedrock_wrapper.
+_request: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("metrics_request", default=None)
+
+
+def _route() -> str:
+    request = _request.get()
+    if request is None:
+        return "background"
+    route = request["scope"].get("route")
+    return getattr(route, "path", "unmatched")
+
+
+_timings_lock = threading.Lock()
+
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_DURATION.observe(seconds, _route(), name)
+    request = _request.get()
+    if request is not None:
+        # stages of one request can run on several executor threads
+        with _timings_lock:
+            timings = request["timings"]
+            timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def _timed_stage(name: str):
+    span = _tracer.start_as_current_span(name) if _tracer is not None else _NOOP
+    started = time.perf_counter()
+    with span:
+        try:
+            yield
+        finally:
+            record_stage(name, time.perf_counter() - started)
+
+
+def stage(name: str):
+    """Context manager timing one stage of the current request (no-op when metrics are disabled)."""
+    return _timed_stage(name) if METRICS_ENABLED else _NOOP
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value; stages can overlap, so they need not add up to total."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request histogram, Server-Timing header and a server span per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request = {"scope": scope, "timings": {}}
+        token = _request.set(request)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                timings = {**request["timings"], "total": time.perf_counter() - started}
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        span = _tracer.start_as_current_span(f"{scope['method']} {scope['path']}") if _tracer is not None else _NOOP
+        try:
+            with span:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], _route(), status[0])
+            _request.reset(token)
+
+
+class TimedJSONResponse(JSONResponse):
+    """Default response class; JSON rendering is recorded as the serialization stage."""
+
+    def render(self, content) -> bytes:
+        with stage("serialization"):
+            return super().render(content)
+
+
+# --- Database ---
+
+def instrument_engine(engine, name: str) -> None:
+    """Time every statement on a (sync) SQLAlchemy engine and export its pool gauges."""
+    if not METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("kc_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("kc_query_started")
+        if not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_QUERY_DURATION.observe(seconds, name, operation)
+        record_stage("db", seconds)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("kc_query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    _pools[name] = engine.pool
+
+
+_pools: Dict[str, object] = {}
+Callback("kc_db_pool_checked_out", "Connections currently checked out of the pool.", ("engine",),
+         lambda: {(name,): pool.checkedout() for name, pool in _pools.items()})
+Callback("kc_db_pool_size", "Configured pool size.", ("engine",),
+         lambda: {(name,): pool.size() for name, pool in _pools.items()})
+Callback("kc_db_pool_overflow", "Connections open beyond the pool size (negative: unused pool slots).", ("engine",),
+         lambda: {(name,): pool.overflow() for name, pool in _pools.items()})
+
+
+def callback(name: str, help_text: str, labelnames: Tuple[str, ...], fn: Callable[[], dict],
+             kind: str = "gauge") -> None:
+    """Export values owned by another module (stats dicts) at scrape time."""
+    if METRICS_ENABLED:
+        Callback(name, help_text, labelnames, fn, kind)
@@ -0,0 +1,43 @@
+import re
+import unicodedata
+
+# Company legal forms dropped from the end of a name ("Acme Inc." -> "acme"), at most one.
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "llc", "llp", "lp", "ltd", "limited",
+    "plc", "gmbh", "mbh", "ag", "kg", "se", "sa", "sas", "sarl", "srl", "spa", "sl", "bv", "nv",
+    "oy", "oyj", "ab", "as", "asa", "aps", "pty", "pte", "kk",
+}
+
+_JOINED = re.compile(r"[.'’]")        # "S.A." -> "sa", "O'Neil" -> "oneil"
+_SEPARATORS = re.compile(r"[\W_]+")   # any other punctuation separates words
+
+
+def normalize_name(name: str) -> str:
+    """
+    Canonical key for alias / customer name lookups.
+
+    Casefolds, strips accents and punctuation, collapses whitespace and drops
+    one trailing legal suffix. Only one: suffixes further in are part of the
+    name, and a name made only of a suffix is kept as is.
+
+    >>> normalize_name("ACME, Inc.")
+    'acme'
+    >>> normalize_name("Société Générale S.A.")
+    'societe generale'
+    >>> normalize_name("The Co Company")
+    'the co'
+    >>> normalize_name("Acme Holding AG & Co. KG")
+    'acme holding ag co'
+    >>> normalize_name("Co")
+    'co'
+    >>> normalize_name("Limited Co")
+    'limited'
+    """
+    if not name:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", name)
+    plain = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    words = _SEPARATORS.sub(" ", _JOINED.sub("", plain)).split()
+    if len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words = words[:-1]
+    return " ".join(words)
@@ -0,0 +1,335 @@
+"""
+Client-side protection for model calls: rate limiting, bounded concurrency,
+retries with backoff, circuit breaking and request deadlines.
+
+Every model (Claude, Titan) gets its own ModelGuard. Calls block in the
+calling thread (they already run on executor threads), and every wait is
+capped by the deadline of the HTTP request that caused the call.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv(override=True)
+
+# Default budget of an HTTP request for model calls (0: none); clients can shorten it with X-Request-Timeout.
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "60"))
+# Error codes (botocore ClientError codes or exception class names) worth retrying.
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException",
+                    "ServiceQuotaExceededException"}
+TRANSIENT_CODES = {"ModelNotReadyException", "InternalServerException", "ModelTimeoutException",
+                   "ReadTimeoutError", "ConnectTimeoutError", "EndpointConnectionError", "ConnectionClosedError"}
+
+
+class ModelUnavailable(HTTPException):
+    """The model is throttled or its breaker is open; clients should retry after `retry_after` seconds."""
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(status_code=503, detail=detail, headers={"Retry-After": str(max(1, round(retry_after)))})
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self, detail: str = "Request deadline exceeded before the model call completed."):
+        super().__init__(status_code=504, detail=detail)
+
+
+# --- Deadlines ---
+# Monotonic time by which the current request must finish. Set by the HTTP
+# middleware; contextvars follow the call onto executor threads (see bedrock_wrapper).
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Run the block with a deadline `seconds` from now (None: no deadline); nested deadlines only shrink."""
+    if seconds is None:
+        yield
+        return
+    current = _deadline.get()
+    token = _deadline.set(min(time.monotonic() + seconds, current or float("inf")))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def error_code(exc: BaseException) -> Optional[str]:
+    """Classify an exception chain: 'throttle', 'transient' or None (not worth retrying)."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, "response", None)
+        code = response.get("Error", {}).get("Code") if isinstance(response, dict) else None
+        for name in (code, type(exc).__name__):
+            if name in THROTTLING_CODES:
+                return "throttle"
+            if name in TRANSIENT_CODES:
+                return "transient"
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+# --- Rate limiting ---
+
+class TokenBucket:
+    """
+    Thread-safe token bucket whose rate adapts to throttling.
+
+    `rate` is the configured ceiling in requests per second (0: none). A throttle
+    halves the current rate, or, when no limit is active yet, starts limiting at
+    half the observed rate; every second without throttling adds 10% back.
+    Throttles within a second of the last cut are one burst and cut only once.
+    """
+
+    def __init__(self, rate: float = 0.0, burst: Optional[float] = None, min_rate: float = 0.5):
+        self.ceiling = rate or None
+        self.rate = self.ceiling
+        self.burst = burst or max(1.0, rate)
+        self.min_rate = min_rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.last_change = self.updated
+        self.last_cut = 0.0
+        self._recent = deque(maxlen=10000)  # acquisition times, for the observed rate
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> None:
+        """Take a token, sleeping as needed; raises DeadlineExceeded when the wait would outlast the deadline."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if not self.rate or self.tokens >= 1:
+                    self.tokens -= 1 if self.rate else 0
+                    self._recent.append(now)
+                    return
+                wait = (1 - self.tokens) / self.rate
+            left = remaining()
+            if left is not None and wait > left:
+                raise DeadlineExceeded("Request deadline exceeded while waiting for the model rate limit.")
+            time.sleep(wait)
+
+    def observed_rate(self, window: float = 5.0) -> float:
+        """Acquisitions per second over the last `window` seconds (or since the first one, if later)."""
+        now = time.monotonic()
+        recent = [t for t in self._recent if now - t <= window]
+        return len(recent) / max(now - recent[0], 0.1) if recent else 0.0
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.rate and now - self.last_cut < 1:
+                return
+            self.last_cut = now
+            self._refill(now)
+            base = self.rate or self.observed_rate() or self.min_rate * 2
+            self.rate = max(self.min_rate, base / 2)
+            self.burst = max(1.0, min(self.burst, self.rate))
+            self.tokens = min(self.tokens, self.burst)
+            self.last_change = now
+
+    def on_success(self) -> None:
+        if not self.rate or self.rate == self.ceiling:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self.last_change < 1:
+                return
+            self._refill(now)
+            self.last_change = now
+            if self.ceiling is None and self.rate > 2 * self.observed_rate():
+                self.rate = None  # recovered well past demand: stop limiting
+                return
+            self.rate = min(self.ceiling or float("inf"), self.rate * 1.1)
+            self.burst = max(self.burst, min(self.rate, self.ceiling or self.rate))
+
+
+# --- Circuit breaker ---
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_seconds`; then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return
+            retry_after = self.reset_seconds - (time.monotonic() - self.opened_at) if state == "open" else 1
+            raise ModelUnavailable("Model temporarily unavailable (circuit open).", retry_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def release(self) -> None:
+        """The call ended without telling anything about the model's health (e.g. bad input)."""
+        with self._lock:
+            self.trial_running = False
+
+
+# --- Guard ---
+
+class ModelGuard:
+    """Rate limit, concurrency cap, retries and breaker around one model's calls."""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = 0.0,
+        burst: Optional[float] = None,
+        max_in_flight: int = 32,
+        max_attempts: int = 4,
+        backoff_base: float = 0.2,
+        backoff_cap: float = 10.0,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.in_flight = 0
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "calls": 0, "successes": 0, "failures": 0, "throttles": 0, "retries": 0,
+            "rejected": 0, "deadline_exceeded": 0, "latency_seconds_total": 0.0,
+        }
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter": uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _acquire_slot(self) -> None:
+        left = remaining()
+        if not self._slots.acquire(timeout=None if left is None else max(0.0, left)):
+            raise DeadlineExceeded("Request deadline exceeded while waiting for a model call slot.")
+
+    def _attempt(self, fn: Callable, *args):
+        self.bucket.acquire()
+        self._acquire_slot()
+        with self._stats_lock:
+            self.in_flight += 1
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+                self.stats["latency_seconds_total"] += time.monotonic() - started
+            self._slots.release()
+
+    def call(self, fn: Callable, *args):
+        """Run fn(*args) under the guard; retries throttling and transient errors with jittered backoff."""
+        self._count("calls")
+        try:
+            self.breaker.before_call()
+        except ModelUnavailable:
+            self._count("rejected")
+            raise
+        attempt = 0
+        while True:
+            left = remaining()
+            if left is not None and left <= 0:
+                self.breaker.release()
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded()
+            try:
+                result = self._attempt(fn, *args)
+            except DeadlineExceeded:
+                self.breaker.release()
+                self._count("deadline_exceeded")
+                raise
+            except Exception as e:
+                kind = error_code(e)
+                if kind == "throttle":
+                    self._count("throttles")
+                    self.bucket.on_throttle()
+                if kind is None:
+                    # the request itself was rejected; the model is fine
+                    self.breaker.release()
+                    raise
+                attempt += 1
+                delay = self._backoff(attempt)
+                left = remaining()
+                if attempt >= self.max_attempts or (left is not None and delay >= left):
+                    self._count("failures")
+                    self.breaker.record_failure()
+                    if kind == "throttle":
+                        raise ModelUnavailable(f"{self.name} is throttled, retry later.", self.backoff_cap) from e
+                    raise
+                self._count("retries")
+                time.sleep(delay)
+                continue
+            self._count("successes")
+            self.bucket.on_success()
+            self.breaker.record_success()
+            return result
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = self.in_flight
+        stats.update({
+            "max_in_flight": self.max_in_flight,
+            "rate_limit": round(self.bucket.rate, 3) if self.bucket.rate else None,
+            "rate_ceiling": self.bucket.ceiling,
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+        })
+        return stats
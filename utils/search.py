@@ -1,8 +1,22 @@
-from typing import List
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
 
-from pydantic import BaseModel
-from sqlalchemy import or_
-from sqlalchemy.orm import Query
+from fastapi import HTTPException
+from pgvector.sqlalchemy import Vector
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import (
+    DateTime, Float, Integer, Numeric, Select, String, and_, bindparam, false, or_, select, text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from schemas import QueryCondition, QueryOrder, SemanticSearchRequest, StructuredQuery, UTCDatetime
+from utils import vector_index
 
 
 class SearchFilter(BaseModel):
@@ -10,7 +24,7 @@ class SearchFilter(BaseModel):
     value: str
 
 
-def apply_dynamic_filters(query: Query, model, filters: List[SearchFilter]) -> Query:
+def apply_dynamic_filters(query: Select, model, filters: List[SearchFilter]) -> Select:
     if not filters:
         return query
 
@@ -23,3 +37,281 @@ def apply_dynamic_filters(query: Query, model, filters: List[SearchFilter]) -> Q
         query = query.filter(or_(*conditions))
 
     return query
+
+
+# --- Structured queries ---
+#
+# Operators compile to index-friendly SQL:
+#   eq / in        -> = / IN                   (B-tree)
+#   prefix         -> LIKE 'value%'            (B-tree text_pattern_ops, trigram GIN)
+#   contains       -> ILIKE '%value%'          (trigram GIN); JSONB arrays use @> (GIN)
+#   range          -> >, >=, <, <=             (B-tree)
+
+MAX_CONDITIONS = 50
+MAX_IN_VALUES = 1000
+
+OPERATORS = {
+    "text": {"eq", "prefix", "contains", "in"},
+    "uuid": {"eq", "in"},
+    "datetime": {"eq", "range"},
+    "number": {"eq", "in", "range"},
+    "array": {"contains"},
+}
+SORTABLE = {"text", "uuid", "datetime", "number"}
+
+_datetime = TypeAdapter(UTCDatetime)
+
+
+def _field_kind(column) -> Optional[str]:
+    column_type = column.type
+    if isinstance(column_type, Vector):
+        return None
+    if isinstance(column_type, JSONB):
+        return "array"
+    if isinstance(column_type, PGUUID):
+        return "uuid"
+    if isinstance(column_type, DateTime):
+        return "datetime"
+    if isinstance(column_type, (Integer, Numeric, Float)):
+        return "number"
+    if isinstance(column_type, String):
+        return "text"
+    return None
+
+
+def searchable_fields(model) -> Dict[str, str]:
+    """Column name -> kind for every column the DSL may filter on (vectors excluded)."""
+    return {c.name: kind for c in model.__table__.columns if (kind := _field_kind(c))}
+
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=400, detail=detail)
+
+
+def _coerce(kind: str, field: str, value: Any) -> Any:
+    try:
+        if kind == "uuid":
+            return UUID(str(value))
+        if kind == "datetime":
+            return _datetime.validate_python(value)
+        if kind == "number" and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        if kind == "text" and isinstance(value, str):
+            return value
+    except Exception:
+        pass
+    raise _bad_request(f"Invalid value for '{field}': {value!r}")
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _compile_condition(model, fields: Dict[str, str], cond: QueryCondition):
+    kind = fields.get(cond.field)
+    if kind is None:
+        raise _bad_request(f"Unknown or unsearchable field '{cond.field}'")
+    if cond.op not in OPERATORS[kind]:
+        raise _bad_request(f"Operator '{cond.op}' is not supported for '{cond.field}' ({kind})")
+    column = model.__table__.c[cond.field]
+
+    if cond.op == "range":
+        bounds = [(cond.gt, column.__gt__), (cond.gte, column.__ge__), (cond.lt, column.__lt__),
+                  (cond.lte, column.__le__)]
+        clauses = [compare(_coerce(kind, cond.field, v)) for v, compare in bounds if v is not None]
+        if not clauses:
+            raise _bad_request(f"Range on '{cond.field}' needs at least one of gt, gte, lt, lte")
+        return and_(*clauses)
+
+    if cond.value is None:
+        raise _bad_request(f"Operator '{cond.op}' on '{cond.field}' needs a value")
+
+    if cond.op == "in":
+        if not isinstance(cond.value, list) or not 0 < len(cond.value) <= MAX_IN_VALUES:
+            raise _bad_request(f"'in' on '{cond.field}' needs a list of 1-{MAX_IN_VALUES} values")
+        return column.in_([_coerce(kind, cond.field, v) for v in cond.value])
+
+    if kind == "array":
+        values = cond.value if isinstance(cond.value, list) else [cond.value]
+        return column.contains(values)
+
+    value = _coerce(kind, cond.field, cond.value)
+    if cond.op == "eq":
+        return column == value
+    if cond.op == "prefix":
+        return column.like(f"{escape_like(value)}%", escape="\\")
+    return column.ilike(f"%{escape_like(value)}%", escape="\\")
+
+
+def compile_where(model, node, fields: Optional[Dict[str, str]] = None, _count: Optional[list] = None):
+    """Compile a condition / and-or group tree into a SQLAlchemy expression."""
+    fields = fields or searchable_fields(model)
+    count = _count if _count is not None else [0]
+
+    if isinstance(node, QueryCondition):
+        count[0] += 1
+        if count[0] > MAX_CONDITIONS:
+            raise _bad_request(f"Queries are limited to {MAX_CONDITIONS} conditions")
+        return _compile_condition(model, fields, node)
+
+    if (node.all_of is None) == (node.any_of is None):
+        raise _bad_request("A group needs exactly one of 'and' / 'or'")
+    members = node.all_of if node.all_of is not None else node.any_of
+    children = [compile_where(model, child, fields, count) for child in members]
+    if node.all_of is not None:
+        return and_(*children) if children else and_(True)
+    return or_(*children) if children else false()
+
+
+def _resolve_order(fields: Dict[str, str], order_by: Optional[List[QueryOrder]],
+                   default: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    order = [(o.field, o.direction) for o in order_by] if order_by else list(default)
+    for field, _ in order:
+        if fields.get(field) not in SORTABLE:
+            raise _bad_request(f"Cannot order by '{field}'")
+    if "id" not in {field for field, _ in order}:
+        order.append(("id", "asc"))  # unique tiebreaker for keyset pagination
+    return order
+
+
+def encode_query_cursor(order: List[Tuple[str, str]], row) -> str:
+    values = []
+    for field, _ in order:
+        value = getattr(row, field)
+        values.append(value.isoformat() if isinstance(value, datetime) else
+                      str(value) if isinstance(value, UUID) else value)
+    raw = json.dumps({"order": order, "values": values}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_query_cursor(cursor: str, order: List[Tuple[str, str]], fields: Dict[str, str]) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        assert [tuple(o) for o in data["order"]] == order
+        return [None if v is None else _coerce(fields[f], f, v) for (f, _), v in zip(order, data["values"])]
+    except Exception:
+        raise _bad_request("Invalid cursor for this query")
+
+
+def _keyset(model, order: List[Tuple[str, str]], values: list):
+    """
+    Rows strictly after the cursor in (order, NULLs) order.
+
+    Postgres sorts NULLs last for asc and first for desc, so every column
+    contributes "after" and "equal" predicates that account for NULLs.
+    """
+    branches = []
+    equal_so_far = []
+    for (field, direction), value in zip(order, values):
+        column = model.__table__.c[field]
+        if direction == "asc":
+            after = false() if value is None else or_(column > value, column.is_(None))
+        else:
+            after = column.is_not(None) if value is None else column < value
+        branches.append(and_(*equal_so_far, after))
+        equal_so_far.append(column.is_(None) if value is None else column == value)
+    return or_(*branches)
+
+
+async def execute_structured_query(
+    db: AsyncSession,
+    model,
+    payload: StructuredQuery,
+    query: Optional[Select] = None,
+    default_order: Optional[List[Tuple[str, str]]] = None,
+) -> Tuple[list, Optional[str]]:
+    """
+    Run a StructuredQuery against a model and return (rows, next_cursor).
+
+    `query` can carry extra filters (scoping, legacy filters); the DSL is ANDed onto it.
+    """
+    fields = searchable_fields(model)
+    query = query if query is not None else select(model)
+    if payload.where is not None:
+        query = query.filter(compile_where(model, payload.where, fields))
+
+    order = _resolve_order(fields, payload.order_by, default_order or [])
+    if payload.cursor:
+        query = query.filter(_keyset(model, order, decode_query_cursor(payload.cursor, order, fields)))
+    columns = [model.__table__.c[f] for f, _ in order]
+    query = query.order_by(*[c.asc() if d == "asc" else c.desc() for c, (_, d) in zip(columns, order)])
+
+    rows = (await db.execute(query.limit(payload.limit + 1))).scalars().all()
+    next_cursor = None
+    if len(rows) > payload.limit:
+        rows = rows[:payload.limit]
+        next_cursor = encode_query_cursor(order, rows[-1])
+    return rows, next_cursor
+
+
+def serialize_row(row) -> dict:
+    """Column values of a model instance without vector columns; UUIDs as strings."""
+    data = {}
+    for column in row.__table__.columns:
+        if isinstance(column.type, Vector):
+            continue
+        value = getattr(row, column.name)
+        data[column.name] = str(value) if isinstance(value, UUID) else value
+    return data
+
+
+# --- Filtered semantic search ---
+
+ANN_EF_SEARCH = 40      # pgvector default
+MAX_EF_SEARCH = 1000    # pgvector upper bound
+
+
+async def semantic_search(
+    db: AsyncSession,
+    model,
+    column,
+    embedding: List[float],
+    payload: SemanticSearchRequest,
+) -> List[dict]:
+    """
+    Nearest rows to `embedding` among those matching the request filters.
+
+    Filters run inside the ANN scan. On pgvector >= 0.8 the index is scanned
+    iteratively until top_k rows pass them; on older versions ef_search is
+    widened instead. If the index still comes up short (very selective
+    filters), the filtered rows are ranked exactly.
+    """
+    filters = [column.is_not(None)]
+    if payload.customer_id:
+        filters.append(model.customer_id == payload.customer_id)
+    if payload.where is not None:
+        filters.append(compile_where(model, payload.where))
+
+    op = vector_index.distance_operator()
+    query_vector = bindparam("query_vector", embedding, type_=Vector(1024))
+    top_k = payload.top_k
+
+    distance = column.op(op, return_type=Float)(query_vector).label("distance")
+    hits = select(model, distance).where(*filters).order_by(distance).limit(top_k).subquery()
+    hit = aliased(model, hits)
+    # relaxed_order iterative scans may return rows slightly out of order
+    ann = select(hit, hits.c.distance).order_by(hits.c.distance)
+
+    # materializing the filtered rows keeps the planner off the ANN index
+    filtered = select(model).where(*filters).cte("filtered").prefix_with("MATERIALIZED")
+    row = aliased(model, filtered)
+    exact_distance = getattr(row, column.key).op(op, return_type=Float)(query_vector).label("distance")
+    exact = select(row, exact_distance).order_by(exact_distance).limit(top_k)
+
+    # partial ANN indexes only match plans built with the actual filter values
+    await db.execute(text("SET LOCAL plan_cache_mode = force_custom_plan"))
+    iterative = await vector_index.apply_iterative_scan(db)
+    ef_search = payload.ef_search or max(ANN_EF_SEARCH, top_k)
+    while True:
+        await vector_index.apply_search_params(db, ef_search=ef_search, probes=payload.probes)
+        rows = (await db.execute(ann)).all()
+        if len(rows) >= top_k or iterative or ef_search >= MAX_EF_SEARCH:
+            break
+        ef_search = min(MAX_EF_SEARCH, ef_search * 4)
+    if len(rows) < top_k:
+        rows = (await db.execute(exact)).all()
+
+    return [
+        {**serialize_row(item), "distance": dist, "score": round(vector_index.similarity(dist), 6)}
+        for item, dist in rows
+    ]
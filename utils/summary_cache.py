@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from database import engine
+from models import SummaryCache
+from utils import metrics
+from utils.embedding_cache import LRUCache, normalize_text
+
+load_dotenv(override=True)
+
+CACHE_ENABLED = os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() == "true"
+CACHE_PERSISTENT = os.getenv("SUMMARY_CACHE_PERSISTENT", "true").lower() == "true"
+CACHE_MAX_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "2000"))
+CACHE_TTL_SECONDS = float(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "86400"))
+
+
+def prompt_hash(system_prompt: str) -> str:
+    """Prompt templates are hashed verbatim: any edit to a prompt starts a fresh cache."""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+
+def cache_key(system_prompt: str, model_id: str, text: str) -> str:
+    digest = hashlib.sha256()
+    for part in (prompt_hash(system_prompt), model_id, normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+_memory = LRUCache(CACHE_MAX_SIZE, CACHE_TTL_SECONDS)
+_stats_lock = threading.Lock()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "invalidated": 0, "db_errors": 0}
+
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def lookup_many(system_prompt: str, model_id: str, texts: Iterable[str]) -> Dict[str, str]:
+    """Cached outputs for several inputs, keyed by the original text; one query for all memory misses."""
+    texts = list(dict.fromkeys(texts))
+    if not CACHE_ENABLED or not texts:
+        return {}
+    found: Dict[str, str] = {}
+    pending: Dict[str, List[str]] = {}
+    for text in texts:
+        key = cache_key(system_prompt, model_id, text)
+        output = _memory.get(key)
+        if output is not None:
+            found[text] = output
+        else:
+            pending.setdefault(key, []).append(text)
+    _count("memory_hits", len(found))
+
+    if pending and CACHE_PERSISTENT:
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    select(SummaryCache.key, SummaryCache.output).where(SummaryCache.key.in_(list(pending)))
+                ).all()
+        except Exception as e:
+            _count("db_errors")
+            logging.warning(f"Summary cache lookup failed: {str(e)}")
+            rows = []
+        for key, output in rows:
+            _memory.set(key, output)
+            for text in pending.pop(key):
+                found[text] = output
+                _count("db_hits")
+
+    _count("misses", sum(len(t) for t in pending.values()))
+    return found
+
+
+def lookup(system_prompt: str, model_id: str, text: str) -> Optional[str]:
+    """Cached model output for this prompt, model and input, or None."""
+    return lookup_many(system_prompt, model_id, [text]).get(text)
+
+
+def store(system_prompt: str, model_id: str, text: str, output: str) -> None:
+    store_many(system_prompt, model_id, {text: output})
+
+
+def store_many(system_prompt: str, model_id: str, outputs: Dict[str, str]) -> None:
+    """Write outputs keyed by their input text to both layers."""
+    if not CACHE_ENABLED or not outputs:
+        return
+    rows = []
+    for text, output in outputs.items():
+        key = cache_key(system_prompt, model_id, text)
+        _memory.set(key, output)
+        rows.append({"key": key, "prompt_hash": prompt_hash(system_prompt), "model_id": model_id, "output": output})
+    if not CACHE_PERSISTENT:
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert(SummaryCache).values(rows).on_conflict_do_nothing(index_elements=["key"]))
+    except Exception as e:
+        _count("db_errors")
+        logging.warning(f"Summary cache write failed: {str(e)}")
+
+
+def invalidate(system_prompt: str, model_id: str, text: str) -> None:
+    """Drop an entry whose output turned out to be unusable (e.g. unparseable JSON)."""
+    if not CACHE_ENABLED:
+        return
+    key = cache_key(system_prompt, model_id, text)
+    _memory.pop(key)
+    _count("invalidated")
+    if not CACHE_PERSISTENT:
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(delete(SummaryCache).where(SummaryCache.key == key))
+    except Exception as e:
+        _count("db_errors")
+        logging.warning(f"Summary cache invalidation failed: {str(e)}")
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    stats.update({
+        "enabled": CACHE_ENABLED,
+        "persistent": CACHE_PERSISTENT,
+        "memory_entries": len(_memory),
+        "memory_max_size": CACHE_MAX_SIZE,
+        "ttl_seconds": CACHE_TTL_SECONDS,
+        "hit_rate": round((stats["memory_hits"] + stats["db_hits"]) / lookups, 4) if lookups else 0.0,
+    })
+    return stats
+
+
+metrics.callback(
+    "kc_summary_cache_lookups_total", "Summary cache lookups by result.", ("result",),
+    lambda: {(name,): _stats[name] for name in ("memory_hits", "db_hits", "misses")},
+    kind="counter",
+)
@@ -0,0 +1,95 @@
+"""
+Bulk export of embeddings into NumPy.
+
+Rows are streamed out of Postgres with a binary COPY and decoded straight
+into a float32 matrix, avoiding the text round trip of `SELECT embedding`.
+"""
+import uuid
+from typing import List, Tuple
+
+import numpy as np
+
+from database import engine
+from utils.llm_providers import EMBEDDING_DIMENSIONS
+
+COPY_BLOCK_BYTES = 8 * 1024 * 1024  # decode the COPY stream in blocks of this size
+NULL_UUID = "00000000-0000-0000-0000-000000000000"
+
+_COPY_HEADER = 19  # PGCOPY signature (11) + flags (4) + header extension length (4)
+# One binary COPY row: field count, then (length, value) per field. pgvector sends
+# int16 dimensions, int16 unused and big-endian float32 values.
+_ROW = np.dtype([
+    ("fields", ">i2"),
+    ("id_len", ">i4"), ("id", "V16"),
+    ("customer_len", ">i4"), ("customer_id", "V16"),
+    ("vector_len", ">i4"), ("dim", ">i2"), ("unused", ">i2"), ("vector", ">f4", (EMBEDDING_DIMENSIONS,)),
+])
+
+
+class _CopyDecoder:
+    """File-like COPY sink; psycopg2 writes one row per call, rows are decoded in blocks."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.header_seen = False
+        self.ids: List[np.ndarray] = []
+        self.customers: List[np.ndarray] = []
+        self.vectors: List[np.ndarray] = []
+
+    def write(self, data) -> int:
+        self.buffer += data
+        if len(self.buffer) >= COPY_BLOCK_BYTES:
+            self._decode()
+        return len(data)
+
+    def _decode(self) -> None:
+        if not self.header_seen:
+            if len(self.buffer) < _COPY_HEADER:
+                return
+            del self.buffer[:_COPY_HEADER]
+            self.header_seen = True
+        rows = len(self.buffer) // _ROW.itemsize
+        if not rows:
+            return
+        block = np.frombuffer(bytes(self.buffer[:rows * _ROW.itemsize]), dtype=_ROW)
+        if (block["fields"] != 3).any() or (block["vector_len"] != 4 + 4 * EMBEDDING_DIMENSIONS).any():
+            raise ValueError("Unexpected COPY row layout")
+        self.ids.append(block["id"])
+        self.customers.append(block["customer_id"])
+        self.vectors.append(block["vector"].astype(np.float32))
+        del self.buffer[:rows * _ROW.itemsize]
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        self._decode()
+        if bytes(self.buffer) not in (b"", b"\xff\xff"):  # trailer
+            raise ValueError("Truncated COPY stream")
+        if not self.vectors:
+            return np.empty(0, "V16"), np.empty(0, "V16"), np.empty((0, EMBEDDING_DIMENSIONS), np.float32)
+        return np.concatenate(self.ids), np.concatenate(self.customers), np.concatenate(self.vectors)
+
+
+def copy_embeddings(table: str, column: str = "embedding") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (ids, customer_ids, unit-normalized float32 matrix) of every embedded row of `table`.
+
+    Ids are raw 16-byte UUIDs (see to_uuids); a missing customer_id comes back as NULL_UUID.
+    """
+    decoder = _CopyDecoder()
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY (SELECT id, coalesce(customer_id, '{NULL_UUID}'::uuid), {column} "
+                f"FROM {table} WHERE {column} IS NOT NULL) TO STDOUT WITH (FORMAT binary)",
+                decoder,
+            )
+    finally:
+        conn.close()
+    ids, customers, matrix = decoder.result()
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    return ids, customers, matrix
+
+
+def to_uuids(values: np.ndarray) -> List[uuid.UUID]:
+    return [uuid.UUID(bytes=bytes(v)) for v in values]
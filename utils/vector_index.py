@@ -0,0 +1,379 @@
+import logging
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import engine
+
+load_dotenv(override=True)
+
+# Default serving configuration; queries use the operator that matches it.
+VECTOR_INDEX_METHOD = os.getenv("VECTOR_INDEX_METHOD", "hnsw")
+VECTOR_DISTANCE = os.getenv("VECTOR_DISTANCE", "l2")
+VECTOR_INDEX_AUTO_CREATE = os.getenv("VECTOR_INDEX_AUTO_CREATE", "true").lower() == "true"
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = os.getenv("IVFFLAT_LISTS")  # default: rows / 1000, at least 10
+# Filtered ANN: keep scanning the index until enough rows pass the filter (pgvector >= 0.8).
+# off / relaxed_order / strict_order
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order")
+HNSW_MAX_SCAN_TUPLES = os.getenv("HNSW_MAX_SCAN_TUPLES")  # pgvector default 20000
+IVFFLAT_MAX_PROBES = os.getenv("IVFFLAT_MAX_PROBES")
+
+# Every pgvector column served by an ANN index.
+VECTOR_COLUMNS = [
+    ("customer_alias", "embedding"),
+    ("custom_notes", "embedding"),
+    ("note_chunk", "embedding"),
+    ("task", "embedding"),
+    ("feature_request", "embedding"),
+    ("feature_request", "raw_embedding"),
+    ("contact", "name_embedding"),
+]
+
+# distance -> (operator class, query operator)
+DISTANCES = {
+    "l2": ("vector_l2_ops", "<->"),
+    "cosine": ("vector_cosine_ops", "<=>"),
+    "inner_product": ("vector_ip_ops", "<#>"),
+}
+METHODS = ("hnsw", "ivfflat")
+
+# Postgres omits the operator class from indexdef when it is the default (vector_l2_ops).
+_INDEX_DEF = re.compile(
+    r"USING (hnsw|ivfflat) \((\w+)(?: (\w+))?\)(?: WITH \(([^)]*)\))?(?: WHERE (.*))?$", re.IGNORECASE
+)
+
+
+def _check_column(table: str, column: str) -> None:
+    if (table, column) not in VECTOR_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"{table}.{column} is not an indexed vector column.")
+
+
+def _check_distance(distance: str) -> None:
+    if distance not in DISTANCES:
+        raise HTTPException(status_code=400, detail=f"Unknown distance '{distance}'.")
+
+
+def distance_operator(distance: Optional[str] = None) -> str:
+    """SQL operator for a distance; defaults to the configured serving distance."""
+    distance = distance or VECTOR_DISTANCE
+    _check_distance(distance)
+    return DISTANCES[distance][1]
+
+
+def similarity(distance_value: float, distance: Optional[str] = None) -> float:
+    """Convert a raw operator distance into a similarity score (higher is closer)."""
+    distance = distance or VECTOR_DISTANCE
+    if distance == "l2":
+        # embeddings (Titan and the local provider) are unit-normalized, so cosine similarity = 1 - d^2 / 2
+        return 1 - distance_value ** 2 / 2
+    if distance == "cosine":
+        return 1 - distance_value
+    return -distance_value
+
+
+def distance_from_cosine(cosine_similarity: float, distance: Optional[str] = None) -> float:
+    """Inverse of similarity() for unit-normalized embeddings: the value the SQL operator would return."""
+    distance = distance or VECTOR_DISTANCE
+    if distance == "l2":
+        return max(0.0, 2 - 2 * cosine_similarity) ** 0.5
+    if distance == "cosine":
+        return 1 - cosine_similarity
+    return -cosine_similarity
+
+
+def index_name(table: str, column: str, method: str, distance: str, where: Optional[Dict[str, str]] = None) -> str:
+    name = f"ix_{table}_{column}_{method}_{distance}"
+    if where:
+        for column_name, value in sorted(where.items()):
+            name += f"_{column_name}_" + re.sub(r"\W+", "_", str(value).lower())
+    return name[:63]
+
+
+def _partial_predicate(table: str, where: Optional[Dict[str, str]]) -> str:
+    """WHERE clause of a partial ANN index: equality on plain columns of the table."""
+    if not where:
+        return ""
+    with engine.connect() as conn:
+        columns = set(conn.execute(text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :t"
+        ), {"t": table}).scalars().all())
+    for column in where:
+        if column not in columns:
+            raise HTTPException(status_code=400, detail=f"{table} has no column '{column}'.")
+    return " WHERE " + " AND ".join(
+        f"{column} = '{str(value).replace(chr(39), chr(39) * 2)}'" for column, value in sorted(where.items())
+    )
+
+
+@lru_cache(maxsize=1)
+def pgvector_version() -> tuple:
+    with engine.connect() as conn:
+        version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    return tuple(int(part) for part in re.findall(r"\d+", version or "0"))
+
+
+def supports_iterative_scan() -> bool:
+    return VECTOR_ITERATIVE_SCAN != "off" and pgvector_version() >= (0, 8)
+
+
+async def apply_search_params(db: AsyncSession, ef_search: Optional[int] = None, probes: Optional[int] = None) -> None:
+    """Set per-transaction ANN search parameters (hnsw.ef_search / ivfflat.probes)."""
+    if ef_search is not None:
+        await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+    if probes is not None:
+        await db.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+
+
+async def apply_iterative_scan(db: AsyncSession) -> bool:
+    """
+    Let filtered ANN queries keep scanning the index until LIMIT rows pass the filter.
+
+    Returns False when pgvector is older than 0.8 or the feature is disabled.
+    """
+    if not supports_iterative_scan():
+        return False
+    await db.execute(text(f"SET LOCAL hnsw.iterative_scan = {VECTOR_ITERATIVE_SCAN}"))
+    await db.execute(text(f"SET LOCAL ivfflat.iterative_scan = {VECTOR_ITERATIVE_SCAN}"))
+    if HNSW_MAX_SCAN_TUPLES:
+        await db.execute(text(f"SET LOCAL hnsw.max_scan_tuples = {int(HNSW_MAX_SCAN_TUPLES)}"))
+    if IVFFLAT_MAX_PROBES:
+        await db.execute(text(f"SET LOCAL ivfflat.max_probes = {int(IVFFLAT_MAX_PROBES)}"))
+    return True
+
+
+def list_vector_indexes(table: Optional[str] = None) -> List[dict]:
+    """List HNSW / IVFFlat indexes with their operator class and build parameters."""
+    sql = text("""
+        SELECT i.tablename, i.indexname, i.indexdef, pg_relation_size(c.oid) AS size_bytes, x.indisvalid
+        FROM pg_indexes i
+        JOIN pg_class c ON c.relname = i.indexname
+        JOIN pg_index x ON x.indexrelid = c.oid
+        WHERE i.schemaname = current_schema()
+          AND (i.indexdef ILIKE '%USING hnsw%' OR i.indexdef ILIKE '%USING ivfflat%')
+    """)
+    with engine.connect() as conn:
+        rows = conn.execute(sql).fetchall()
+
+    opclass_to_distance = {ops: name for name, (ops, _) in DISTANCES.items()}
+    indexes = []
+    for row in rows:
+        if table and row.tablename != table:
+            continue
+        match = _INDEX_DEF.search(row.indexdef)
+        if not match:
+            continue
+        method, column, opclass, params, where = match.groups()
+        indexes.append({
+            "name": row.indexname,
+            "table": row.tablename,
+            "column": column,
+            "method": method.lower(),
+            "distance": opclass_to_distance.get(opclass or "vector_l2_ops", opclass),
+            "params": {
+                key.strip(): int(value.strip(" '"))
+                for key, value in (p.split("=", 1) for p in params.split(","))
+            } if params else {},
+            "where": where,
+            "size_bytes": row.size_bytes,
+            "valid": row.indisvalid,  # false after an interrupted CREATE INDEX CONCURRENTLY
+        })
+    return indexes
+
+
+def _default_lists(table: str) -> int:
+    if IVFFLAT_LISTS:
+        return int(IVFFLAT_LISTS)
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    return max(10, rows // 1000)
+
+
+def create_vector_index(
+    table: str,
+    column: str,
+    method: str = VECTOR_INDEX_METHOD,
+    distance: Optional[str] = None,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    lists: Optional[int] = None,
+    replace: bool = False,
+    where: Optional[Dict[str, str]] = None,
+) -> dict:
+    """
+    Build an ANN index on a vector column with CREATE INDEX CONCURRENTLY.
+
+    `where` builds a partial index over rows matching column = value pairs
+    (e.g. {"status": "open"}), which the planner uses for searches filtered
+    on the same values. With replace=True any other HNSW / IVFFlat index on
+    the same column and rows is dropped once the new one is valid. The
+    distance defaults to VECTOR_DISTANCE, the one search queries use.
+    """
+    distance = distance or VECTOR_DISTANCE
+    _check_column(table, column)
+    _check_distance(distance)
+    if method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown index method '{method}'.")
+
+    if method == "hnsw":
+        params = {"m": m or HNSW_M, "ef_construction": ef_construction or HNSW_EF_CONSTRUCTION}
+    else:
+        params = {"lists": lists or _default_lists(table)}
+    with_clause = ", ".join(f"{k} = {int(v)}" for k, v in params.items())
+
+    name = index_name(table, column, method, distance, where)
+    predicate = _partial_predicate(table, where)
+    opclass = DISTANCES[distance][0]
+    started = time.perf_counter()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+            f"ON {table} USING {method} ({column} {opclass}) WITH ({with_clause}){predicate}"
+        ))
+    build_seconds = round(time.perf_counter() - started, 3)
+
+    if replace:
+        suffix = name[len(index_name(table, column, method, distance)):]
+        for existing in list_vector_indexes(table):
+            same_rows = existing["name"].endswith(suffix) if where else existing["where"] is None
+            if existing["column"] == column and existing["name"] != name and same_rows:
+                drop_vector_index(existing["name"])
+
+    return {"name": name, "table": table, "column": column, "method": method,
+            "distance": distance, "params": params, "where": where, "build_seconds": build_seconds}
+
+
+def drop_vector_index(name: str) -> dict:
+    if name not in {i["name"] for i in list_vector_indexes()}:
+        raise HTTPException(status_code=404, detail=f"Vector index {name} not found")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    return {"status": "dropped", "name": name}
+
+
+def ensure_vector_indexes() -> List[dict]:
+    """
+    Create the default ANN index for every vector column that has no valid one.
+
+    Runs in the background after startup when VECTOR_INDEX_AUTO_CREATE is set,
+    or via `python -m utils.vector_index`, since builds on populated tables take
+    a while. A failed column is logged and the remaining columns are still built.
+    """
+    try:
+        existing = [i for i in list_vector_indexes() if i["where"] is None]
+    except Exception as e:
+        logging.warning(f"Vector index creation skipped: {str(e)}")
+        return []
+    indexed = {(i["table"], i["column"]) for i in existing if i["valid"]}
+    results = []
+    for table, column in VECTOR_COLUMNS:
+        if (table, column) in indexed:
+            continue
+        try:
+            default = index_name(table, column, VECTOR_INDEX_METHOD, VECTOR_DISTANCE)
+            if any(i["name"] == default for i in existing):
+                drop_vector_index(default)  # invalid leftover; IF NOT EXISTS would keep it
+            results.append(create_vector_index(table, column))
+            logging.info(f"Created vector index on {table}.{column}")
+        except Exception as e:
+            logging.warning(f"Vector index on {table}.{column} not created: {str(e)}")
+    return results
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def recall_report(
+    table: str,
+    column: str,
+    distance: Optional[str] = None,
+    sample_size: int = 20,
+    top_k: int = 10,
+    ef_search: Optional[List[int]] = None,
+    probes: Optional[List[int]] = None,
+) -> dict:
+    """
+    Measure recall@k and latency of the ANN index against an exact scan.
+
+    Query vectors are sampled from the column itself. Each ef_search / probes
+    value is run over the same sample so the rows can be compared directly.
+    """
+    distance = distance or VECTOR_DISTANCE
+    _check_column(table, column)
+    op = distance_operator(distance)
+    knn = text(f"""
+        SELECT id FROM {table}
+        WHERE {column} IS NOT NULL
+        ORDER BY {column} {op} CAST(:q AS vector)
+        LIMIT :k
+    """)
+
+    with engine.connect() as conn:
+        queries = conn.execute(text(
+            f"SELECT {column}::text FROM {table} WHERE {column} IS NOT NULL ORDER BY random() LIMIT :n"
+        ), {"n": sample_size}).scalars().all()
+    if not queries:
+        raise HTTPException(status_code=400, detail=f"{table}.{column} has no embeddings to sample.")
+
+    def run(settings: List[str]):
+        results, latencies = [], []
+        with engine.connect() as conn:
+            for q in queries:
+                with conn.begin():
+                    for setting in settings:
+                        conn.execute(text(setting))
+                    started = time.perf_counter()
+                    ids = conn.execute(knn, {"q": q, "k": top_k}).scalars().all()
+                    latencies.append((time.perf_counter() - started) * 1000)
+                results.append(set(ids))
+        return results, latencies
+
+    exact, exact_latency = run(["SET LOCAL enable_indexscan = off"])
+    methods = {i["method"] for i in list_vector_indexes(table)
+               if i["column"] == column and i["distance"] == distance}
+
+    sweeps = []
+    if "hnsw" in methods:
+        sweeps += [("ef_search", v, f"SET LOCAL hnsw.ef_search = {int(v)}") for v in (ef_search or [20, 40, 80, 160])]
+    if "ivfflat" in methods:
+        sweeps += [("probes", v, f"SET LOCAL ivfflat.probes = {int(v)}") for v in (probes or [1, 5, 10, 20])]
+
+    rows = []
+    for param, value, setting in sweeps:
+        approx, latency = run([setting])
+        recall = sum(len(a & e) / max(len(e), 1) for a, e in zip(approx, exact)) / len(exact)
+        rows.append({
+            "param": param,
+            "value": value,
+            "recall": round(recall, 4),
+            "mean_ms": round(sum(latency) / len(latency), 3),
+            "p95_ms": round(_percentile(latency, 95), 3),
+        })
+
+    return {
+        "table": table,
+        "column": column,
+        "distance": distance,
+        "sample_size": len(queries),
+        "top_k": top_k,
+        "exact_mean_ms": round(sum(exact_latency) / len(exact_latency), 3),
+        "exact_p95_ms": round(_percentile(exact_latency, 95), 3),
+        "results": rows,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for created in ensure_vector_indexes():
+        print(f"{created['name']}: {created['build_seconds']}s")